@@ -0,0 +1,305 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrency import GAIA_MAX_CONCURRENCY
+from telemetry import registro, Contador, Histograma, Medidor
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_ADMISSAO = os.getenv("GAIA_ADMISSAO", "1") == "1"
+# Fluxos admitidos ao mesmo tempo no processo (por padrão, o mesmo limite do `limite_fluxos`).
+GAIA_ADMISSAO_MAX_EM_ANDAMENTO = int(os.getenv("GAIA_ADMISSAO_MAX_EM_ANDAMENTO", str(GAIA_MAX_CONCURRENCY)))
+# Requisições que podem esperar por uma vaga; além disso a resposta é 503 na hora.
+GAIA_ADMISSAO_FILA = int(os.getenv("GAIA_ADMISSAO_FILA", "32"))
+GAIA_ADMISSAO_ESPERA_S = float(os.getenv("GAIA_ADMISSAO_ESPERA_S", "2"))
+# Balde de tokens por sessão: `rajada` perguntas seguidas e depois `taxa` por segundo (0 desliga).
+GAIA_ADMISSAO_TAXA_SESSAO = float(os.getenv("GAIA_ADMISSAO_TAXA_SESSAO", "1"))
+GAIA_ADMISSAO_RAJADA_SESSAO = int(os.getenv("GAIA_ADMISSAO_RAJADA_SESSAO", "10"))
+GAIA_ADMISSAO_MAX_SESSOES = int(os.getenv("GAIA_ADMISSAO_MAX_SESSOES", "10000"))
+# Das vagas, quantas os itens de /chat/batch podem ocupar ao mesmo tempo (somando todos os lotes).
+GAIA_ADMISSAO_MAX_LOTE = int(os.getenv("GAIA_ADMISSAO_MAX_LOTE", str(max(1, GAIA_ADMISSAO_MAX_EM_ANDAMENTO // 2))))
+
+# Quanto menor, antes sai da fila. As baratas (palavrão, saudação) nem entram nela.
+PRIORIDADE_BARATA = 0
+PRIORIDADE_NORMAL = 1
+PRIORIDADE_CARA = 2
+# Itens de lote: só pegam vaga quando nenhuma requisição interativa está esperando.
+PRIORIDADE_LOTE = 3
+NOMES_PRIORIDADE = {
+    PRIORIDADE_BARATA: "barata", PRIORIDADE_NORMAL: "normal", PRIORIDADE_CARA: "cara", PRIORIDADE_LOTE: "lote"
+}
+
+admissoes = registro.registrar(Contador(
+    "gaia_admissao_total", "Decisões do controle de admissão por prioridade e resultado.", ("prioridade", "resultado")
+))
+espera_admissao = registro.registrar(Histograma(
+    "gaia_admissao_espera_segundos", "Tempo na fila até a requisição ganhar uma vaga.", ("prioridade",)
+))
+em_andamento_admissao = registro.registrar(Medidor(
+    "gaia_admissao_em_andamento", "Fluxos admitidos em andamento neste momento."
+))
+fila_admissao = registro.registrar(Medidor(
+    "gaia_admissao_fila_profundidade", "Requisições esperando uma vaga neste momento."
+))
+
+
+class RequisicaoRejeitada(Exception):
+    """Requisição recusada pelo controle de admissão: 429 (limite da sessão) ou 503 (sem capacidade)."""
+
+    def __init__(self, status: int, motivo: str, tentar_apos_s: float):
+        super().__init__(f"{motivo} (tente em {tentar_apos_s:.1f} s)")
+        self.status = status
+        self.motivo = motivo
+        self.tentar_apos_s = tentar_apos_s
+
+# =====================================
+# BALDE DE TOKENS POR SESSÃO
+# =====================================
+
+class _Balde:
+    __slots__ = ("tokens", "atualizado")
+
+    def __init__(self, tokens, agora):
+        self.tokens = tokens
+        self.atualizado = agora
+
+# =====================================
+# CONTROLE DE ADMISSÃO
+# =====================================
+
+class Ingresso:
+    """Vaga concedida pelo `ControleAdmissao`; `liberar()` pode ser chamado mais de uma vez."""
+
+    __slots__ = ("_controle", "_ocupa", "_lote", "_inicio", "_liberado")
+
+    def __init__(self, controle, ocupa: bool, lote: bool = False):
+        self._controle = controle
+        self._ocupa = ocupa
+        self._lote = lote
+        self._inicio = time.perf_counter()
+        self._liberado = False
+
+    def liberar(self):
+        if self._liberado:
+            return
+        self._liberado = True
+        if self._ocupa:
+            self._controle._liberar_vaga(time.perf_counter() - self._inicio, self._lote)
+
+
+class ControleAdmissao:
+    """
+    Fica na frente do fluxo da Gaia para que uma rajada degrade a vazão, e não a latência de todos:
+    - cada sessão tem um balde de tokens (`rajada` seguidas, `taxa` por segundo); sem token, 429;
+    - no máximo `max_em_andamento` fluxos rodam ao mesmo tempo;
+    - quem não acha vaga espera até `espera_max_s` numa fila de `max_fila` posições, ordenada por
+      prioridade e depois por chegada; com a fila cheia, uma requisição mais prioritária tira a
+      última da fila (que recebe 503) e uma menos prioritária recebe 503 na hora.
+    Requisições baratas (palavrão, saudação do pré-roteador) não ocupam vaga nem esperam na fila.
+    Itens de /chat/batch (`entrar_lote`) disputam as mesmas vagas, mas por último: esperam sem
+    prazo numa fila própria, só são atendidos com a fila interativa vazia e nunca ocupam mais
+    que `max_lote` vagas, para que o lote não tome a capacidade das requisições interativas.
+    O estado da fila vive no event loop; o lock protege só os baldes e as estatísticas.
+    """
+
+    def __init__(
+        self,
+        max_em_andamento=GAIA_ADMISSAO_MAX_EM_ANDAMENTO,
+        max_fila=GAIA_ADMISSAO_FILA,
+        espera_max_s=GAIA_ADMISSAO_ESPERA_S,
+        taxa_sessao=GAIA_ADMISSAO_TAXA_SESSAO,
+        rajada_sessao=GAIA_ADMISSAO_RAJADA_SESSAO,
+        max_sessoes=GAIA_ADMISSAO_MAX_SESSOES,
+        max_lote=GAIA_ADMISSAO_MAX_LOTE,
+        ativo=GAIA_ADMISSAO
+    ):
+        self.max_em_andamento = max_em_andamento
+        self.max_fila = max_fila
+        self.espera_max_s = espera_max_s
+        self.taxa_sessao = taxa_sessao
+        self.rajada_sessao = rajada_sessao
+        self.max_sessoes = max_sessoes
+        self.max_lote = max_lote
+        self.ativo = ativo
+        self._em_andamento = 0
+        self._em_andamento_lote = 0
+        self._fila = []
+        self._fila_lote = deque()
+        self._sequencia = itertools.count()
+        self._baldes = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = Counter()
+        # Média móvel da duração dos fluxos, para estimar o Retry-After do 503.
+        self._duracao_media_s = 1.0
+
+    def _consumir_token(self, session_id: str) -> float:
+        """Retira um token do balde da sessão; devolve 0 ou quantos segundos faltam para o próximo."""
+        if self.taxa_sessao <= 0:
+            return 0.0
+        agora = time.monotonic()
+        with self._lock:
+            balde = self._baldes.get(session_id)
+            if balde is None:
+                balde = self._baldes[session_id] = _Balde(self.rajada_sessao, agora)
+                if len(self._baldes) > self.max_sessoes:
+                    self._baldes.popitem(last=False)
+            else:
+                self._baldes.move_to_end(session_id)
+                balde.tokens = min(self.rajada_sessao, balde.tokens + (agora - balde.atualizado) * self.taxa_sessao)
+                balde.atualizado = agora
+            if balde.tokens >= 1:
+                balde.tokens -= 1
+                return 0.0
+            return (1 - balde.tokens) / self.taxa_sessao
+
+    def _tentar_apos(self) -> float:
+        return self._duracao_media_s * (len(self._fila) + 1) / max(1, self.max_em_andamento)
+
+    def _contar(self, prioridade: int, resultado: str):
+        admissoes.inc(1, NOMES_PRIORIDADE[prioridade], resultado)
+        with self._lock:
+            self._contadores[resultado] += 1
+
+    def _atualizar_medidores(self):
+        em_andamento_admissao.definir(self._em_andamento)
+        fila_admissao.definir(len(self._fila) + len(self._fila_lote))
+
+    async def entrar(self, session_id: str, prioridade: int = PRIORIDADE_NORMAL) -> Ingresso:
+        """Espera uma vaga e devolve o `Ingresso`, ou levanta `RequisicaoRejeitada`."""
+        if not self.ativo:
+            return Ingresso(self, ocupa=False)
+
+        espera = self._consumir_token(session_id)
+        if espera > 0:
+            self._contar(prioridade, "limite_sessao")
+            raise RequisicaoRejeitada(429, "limite_sessao", espera)
+
+        if prioridade == PRIORIDADE_BARATA:
+            self._contar(prioridade, "admitida")
+            return Ingresso(self, ocupa=False)
+
+        if self._em_andamento < self.max_em_andamento and not self._fila:
+            self._em_andamento += 1
+            self._atualizar_medidores()
+            self._contar(prioridade, "admitida")
+            return Ingresso(self, ocupa=True)
+
+        if len(self._fila) >= self.max_fila:
+            pior = max(self._fila, default=None)
+            if pior is None or pior[0] <= prioridade:
+                self._contar(prioridade, "fila_cheia")
+                raise RequisicaoRejeitada(503, "fila_cheia", self._tentar_apos())
+            self._fila.remove(pior)
+            heapq.heapify(self._fila)
+            pior[2].set_exception(RequisicaoRejeitada(503, "descartada", self._tentar_apos()))
+            self._contar(pior[0], "descartada")
+
+        futuro = asyncio.get_running_loop().create_future()
+        entrada = (prioridade, next(self._sequencia), futuro)
+        heapq.heappush(self._fila, entrada)
+        self._atualizar_medidores()
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait((futuro,), timeout=self.espera_max_s)
+        except asyncio.CancelledError:
+            self._desistir(entrada)
+            raise
+        if not futuro.done():
+            self._desistir(entrada)
+            self._contar(prioridade, "espera_esgotada")
+            raise RequisicaoRejeitada(503, "espera_esgotada", self._tentar_apos())
+        futuro.result()  # levanta o 503 se ela foi descartada por uma mais prioritária
+        espera_admissao.observar(time.perf_counter() - inicio, NOMES_PRIORIDADE[prioridade])
+        self._contar(prioridade, "admitida_apos_fila")
+        return Ingresso(self, ocupa=True)
+
+    async def entrar_lote(self) -> Ingresso:
+        """Vaga para um item de lote: espera o quanto for preciso, atrás das requisições interativas."""
+        if not self.ativo:
+            return Ingresso(self, ocupa=False)
+        if self._em_andamento < self.max_em_andamento and not self._fila and not self._fila_lote \
+                and self._em_andamento_lote < self.max_lote:
+            self._em_andamento += 1
+            self._em_andamento_lote += 1
+            self._atualizar_medidores()
+            self._contar(PRIORIDADE_LOTE, "admitida")
+            return Ingresso(self, ocupa=True, lote=True)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._fila_lote.append(futuro)
+        self._atualizar_medidores()
+        inicio = time.perf_counter()
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            if futuro.done() and not futuro.cancelled():
+                self._liberar_vaga(None, lote=True)
+            elif futuro in self._fila_lote:
+                self._fila_lote.remove(futuro)
+                self._atualizar_medidores()
+            raise
+        espera_admissao.observar(time.perf_counter() - inicio, NOMES_PRIORIDADE[PRIORIDADE_LOTE])
+        self._contar(PRIORIDADE_LOTE, "admitida_apos_fila")
+        return Ingresso(self, ocupa=True, lote=True)
+
+    def _desistir(self, entrada):
+        """Tira da fila quem desistiu; se a vaga já tinha sido passada para ela, repassa adiante."""
+        futuro = entrada[2]
+        if futuro.done() and not futuro.cancelled() and futuro.exception() is None:
+            self._liberar_vaga(None, lote=False)
+            return
+        futuro.cancel()
+        if entrada in self._fila:
+            self._fila.remove(entrada)
+            heapq.heapify(self._fila)
+            self._atualizar_medidores()
+
+    def _liberar_vaga(self, duracao_s, lote: bool):
+        if duracao_s is not None:
+            self._duracao_media_s = 0.9 * self._duracao_media_s + 0.1 * duracao_s
+        if lote:
+            self._em_andamento_lote -= 1
+        # A vaga passa direto para a primeira da fila interativa que ainda espera
+        # e, com ela vazia, para o item de lote mais antigo (se o lote ainda tem cota).
+        while self._fila:
+            _, _, futuro = heapq.heappop(self._fila)
+            if not futuro.done():
+                futuro.set_result(None)
+                self._atualizar_medidores()
+                return
+        while self._fila_lote and self._em_andamento_lote < self.max_lote:
+            futuro = self._fila_lote.popleft()
+            if not futuro.done():
+                self._em_andamento_lote += 1
+                futuro.set_result(None)
+                self._atualizar_medidores()
+                return
+        self._em_andamento -= 1
+        self._atualizar_medidores()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "ativo": self.ativo,
+                "max_em_andamento": self.max_em_andamento,
+                "max_fila": self.max_fila,
+                "taxa_sessao": self.taxa_sessao,
+                "rajada_sessao": self.rajada_sessao,
+                "max_lote": self.max_lote,
+                "em_andamento": self._em_andamento,
+                "em_andamento_lote": self._em_andamento_lote,
+                "na_fila": len(self._fila),
+                "na_fila_lote": len(self._fila_lote),
+                "duracao_media_s": round(self._duracao_media_s, 3),
+                "sessoes_com_balde": len(self._baldes),
+                "decisoes": dict(self._contadores),
+            }
+
+
+controle_admissao = ControleAdmissao()
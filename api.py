@@ -1,11 +1,27 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import RedirectResponse
+import time
+import math
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import RedirectResponse, StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
+from typing import List
 import traceback
+import json
+from contextlib import asynccontextmanager
+from mongo_client import health_check
+from form_summary import resumo_formularios, GAIA_RESUMO_MATERIALIZADO
+from form_cache import cache_crachas
+from speculation import estatisticas_especulacao
+from session_dispatch import despachante_sessoes
+from llm_resilience import LLMIndisponivel, estatisticas_llm
+from admission import controle_admissao, RequisicaoRejeitada, PRIORIDADE_BARATA, PRIORIDADE_NORMAL, PRIORIDADE_CARA
+import faq_tool
+from telemetry import registro, iniciar_rastro, rastro_atual, duracao_http, CABECALHO_TRACE
 
 try:
-    from ia_calbon import executar_fluxo_gaia, get_session_history, store
+    from ia_calbon import executar_fluxo_gaia_async, fluxo_gaia_eventos, get_session_history, store, pre_roteador, cache_respostas, validador_local, BADWORDS_MATCHER
+    from ia_calbon import executar_lote_gaia_async, roteador_agrupado, juiz_agrupado, GAIA_LOTE_MAX_CONCORRENCIA, GAIA_LOTE_MAX_ITENS
 except ImportError as e:
     print("="*50)
     print(f"ERRO: Falha ao importar 'ia_calbon.py'. Detalhe: {e}")
@@ -17,12 +33,44 @@ except ImportError as e:
 # INICIALIZAÇÃO DA API
 # =====================================
 
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    """
+    No startup, inicia (em segundo plano) o resumo materializado dos formulários, que também
+    invalida o cache por crachá quando um formulário muda, mesmo que ninguém peça o resumo geral.
+    """
+    if GAIA_RESUMO_MATERIALIZADO:
+        resumo_formularios.iniciar_em_segundo_plano()
+    yield
+
+
 app = FastAPI(
+    lifespan=ciclo_de_vida,
     title="Gaia API",
     description="API para interagir com a assistente de sustentabilidade Gaia, utilizando um fluxo de RAG e Agentes.",
     version="1.0.0"
 )
 
+
+@app.middleware("http")
+async def rastrear_requisicao(request: Request, call_next):
+    """
+    Dá a cada requisição um trace id (o do cabeçalho X-Trace-Id, se o cliente mandar)
+    que acompanha as etapas do fluxo e volta no mesmo cabeçalho da resposta.
+    """
+    rastro = iniciar_rastro(request.headers.get(CABECALHO_TRACE))
+    inicio = time.perf_counter()
+    response = await call_next(request)
+    rota = request.scope.get("route")
+    duracao_http.observar(
+        time.perf_counter() - inicio,
+        request.method,
+        rota.path if rota is not None else "desconhecida",
+        str(response.status_code)
+    )
+    response.headers[CABECALHO_TRACE] = rastro.trace_id
+    return response
+
 # =====================================
 # MODELOS DE DADOS (Pydantic)
 # =====================================
@@ -53,6 +101,19 @@ class ChatResponse(BaseModel):
         example="session_test"
     )
 
+class BatchRequest(BaseModel):
+    """Modelo de entrada para o endpoint /chat/batch"""
+    items: List[ChatRequest] = Field(
+        ...,
+        description="As perguntas do lote, cada uma com o seu session_id."
+    )
+    concurrency: int = Field(
+        8,
+        ge=1,
+        description=f"Quantos itens do lote rodam ao mesmo tempo (no máximo {GAIA_LOTE_MAX_CONCORRENCIA}).",
+        example=8
+    )
+
 # =====================================
 # ENDPOINTS DA API
 # =====================================
@@ -64,6 +125,44 @@ def read_root():
     """
     return RedirectResponse(url="/docs")
 
+def validar_requisicao(request: ChatRequest):
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="O campo 'question' não pode estar vazio.")
+    if not request.session_id or not request.session_id.strip():
+        raise HTTPException(status_code=400, detail="O campo 'session_id' não pode estar vazio.")
+
+def prioridade_requisicao(pergunta: str) -> int:
+    """
+    Estima o custo da pergunta antes do fluxo: palavrões e saudações resolvidos pelo pré-roteador
+    saem sem chamar o LLM; o diagnóstico (agente com ferramentas e MongoDB) é o caminho mais caro.
+    """
+    if BADWORDS_MATCHER.contem(pergunta):
+        return PRIORIDADE_BARATA
+    decisao = pre_roteador.classificar(pergunta) if pre_roteador.ativo else None
+    if decisao is None or decisao[2] < pre_roteador.confianca_minima:
+        return PRIORIDADE_NORMAL
+    if decisao[0] == "saudacao":
+        return PRIORIDADE_BARATA
+    if decisao[0] == "diagnostico":
+        return PRIORIDADE_CARA
+    return PRIORIDADE_NORMAL
+
+async def admitir(request: ChatRequest):
+    """Pede uma vaga ao controle de admissão; sem vaga, responde 429 ou 503 com Retry-After."""
+    try:
+        return await controle_admissao.entrar(request.session_id, prioridade_requisicao(request.question))
+    except RequisicaoRejeitada as e:
+        print(f"[API] Requisição recusada para session_id {request.session_id} ({e.motivo}).")
+        if e.status == 429:
+            detalhe = "Muitas perguntas seguidas nesta sessão. Aguarde um instante e tente novamente."
+        else:
+            detalhe = "A Gaia está com muitas requisições no momento. Tente novamente em instantes."
+        raise HTTPException(
+            status_code=e.status,
+            detail=detalhe,
+            headers={"Retry-After": str(max(1, math.ceil(e.tentar_apos_s)))}
+        )
+
 @app.post("/chat", response_model=ChatResponse, tags=["Chat"])
 async def handle_chat(request: ChatRequest):
     """
@@ -71,28 +170,35 @@ async def handle_chat(request: ChatRequest):
     Processa a pergunta usando o fluxo completo da Gaia (Roteador, Especialistas, Juiz, Orquestrador)
     e retorna a resposta final.
     """
-    if not request.question or not request.question.strip():
-        raise HTTPException(status_code=400, detail="O campo 'question' não pode estar vazio.")
-    if not request.session_id or not request.session_id.strip():
-        raise HTTPException(status_code=400, detail="O campo 'session_id' não pode estar vazio.")
+    validar_requisicao(request)
+    trace_id = rastro_atual().trace_id
+    ingresso = await admitir(request)
 
     try:
-        print(f"[API] Recebida requisição para session_id: {request.session_id}")
+        print(f"[API] Recebida requisição para session_id: {request.session_id} (trace {trace_id})")
         
-        resposta_gaia = executar_fluxo_gaia(
+        resposta_gaia = await executar_fluxo_gaia_async(
             pergunta_usuario=request.question,
             session_id=request.session_id
         )
         
-        print(f"[API] Resposta gerada para session_id: {request.session_id}")
+        print(f"[API] Resposta gerada para session_id: {request.session_id} (trace {trace_id})")
         
         return ChatResponse(
             answer=resposta_gaia,
             session_id=request.session_id
         )
+
+    except LLMIndisponivel as e:
+        print(f"[API] LLM indisponível para session_id {request.session_id} (trace {trace_id}): {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="A Gaia está instável no momento. Tente novamente em instantes.",
+            headers={"Retry-After": str(max(1, round(e.tentar_apos_s)))}
+        )
         
     except Exception as e:
-        print(f"[API ERRO] Erro crítico ao processar /chat para session_id {request.session_id}: {e}")
+        print(f"[API ERRO] Erro crítico ao processar /chat para session_id {request.session_id} (trace {trace_id}): {e}")
         traceback.print_exc()
         
         raise HTTPException(
@@ -100,6 +206,78 @@ async def handle_chat(request: ChatRequest):
             detail=f"Ocorreu um erro interno no servidor ao processar sua pergunta."
         )
 
+    finally:
+        ingresso.liberar()
+
+@app.post("/chat/stream", tags=["Chat"])
+async def handle_chat_stream(request: ChatRequest):
+    """
+    Mesmo fluxo do /chat, transmitido como Server-Sent Events:
+    - `etapa`: ao fim de cada etapa (roteamento, especialista/consulta de dados, validação);
+    - `token`: pedaços da resposta final, à medida que o orquestrador (ou o FAQ) gera;
+    - `fim`: a resposta completa, já gravada no histórico da sessão;
+    - `erro`: se o fluxo falhar no meio do caminho.
+    A admissão é decidida antes do stream começar, então 429/503 chegam como status HTTP.
+    """
+    validar_requisicao(request)
+    trace_id = rastro_atual().trace_id
+    ingresso = await admitir(request)
+
+    async def eventos_sse():
+        print(f"[API] Recebida requisição de stream para session_id: {request.session_id} (trace {trace_id})")
+        try:
+            async for evento in fluxo_gaia_eventos(request.question, request.session_id):
+                yield f"event: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+        except LLMIndisponivel as e:
+            print(f"[API] LLM indisponível no stream da session_id {request.session_id} (trace {trace_id}): {e}")
+            erro = {
+                "tipo": "erro",
+                "detail": "A Gaia está instável no momento. Tente novamente em instantes.",
+                "retry_after": max(1, round(e.tentar_apos_s)),
+            }
+            yield f"event: erro\ndata: {json.dumps(erro, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"[API ERRO] Erro crítico ao processar /chat/stream para session_id {request.session_id} (trace {trace_id}): {e}")
+            traceback.print_exc()
+            erro = {"tipo": "erro", "detail": "Ocorreu um erro interno no servidor ao processar sua pergunta."}
+            yield f"event: erro\ndata: {json.dumps(erro, ensure_ascii=False)}\n\n"
+        finally:
+            ingresso.liberar()
+
+    return StreamingResponse(
+        eventos_sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Se o cliente cair antes do stream começar, o gerador não roda e a vaga sai por aqui.
+        background=BackgroundTask(ingresso.liberar)
+    )
+
+@app.post("/chat/batch", tags=["Chat"])
+async def handle_chat_batch(request: BatchRequest):
+    """
+    Processa várias perguntas (avaliações noturnas, pré-respostas do FAQ) com concorrência limitada
+    e devolve uma linha JSON (NDJSON) por item, na ordem em que terminam:
+    `{"index", "session_id", "status": 200, "answer"}` ou `{"index", "session_id", "status", "detail"}`.
+    A falha de um item não interrompe os outros. Cada item ocupa uma vaga do controle de admissão
+    com a menor prioridade (ver `ControleAdmissao.entrar_lote`), então lotes não atrasam o /chat.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="O campo 'items' não pode estar vazio.")
+    if len(request.items) > GAIA_LOTE_MAX_ITENS:
+        raise HTTPException(status_code=400, detail=f"O lote pode ter no máximo {GAIA_LOTE_MAX_ITENS} itens.")
+    trace_id = rastro_atual().trace_id
+
+    async def linhas_ndjson():
+        print(f"[API] Recebido lote com {len(request.items)} itens (trace {trace_id})")
+        falhas = 0
+        itens = [(item.session_id, item.question) for item in request.items]
+        async for resultado in executar_lote_gaia_async(itens, request.concurrency):
+            falhas += resultado["status"] != 200
+            yield json.dumps(resultado, ensure_ascii=False) + "\n"
+        print(f"[API] Lote concluído: {len(itens)} itens, {falhas} com falha (trace {trace_id})")
+
+    return StreamingResponse(linhas_ndjson(), media_type="application/x-ndjson")
+
 @app.get("/history/{session_id}", tags=["Chat"])
 def get_chat_history_by_id(session_id: str):
     """
@@ -117,6 +295,133 @@ def get_chat_history_by_id(session_id: str):
         raise HTTPException(status_code=500, detail=f"Erro ao recuperar histórico: {e}")
 
 
+@app.get("/health", tags=["Root"])
+def get_health():
+    """
+    Verifica a conexão com o MongoDB usando o cliente compartilhado.
+    """
+    mongo = health_check()
+    if mongo["status"] != "ok":
+        raise HTTPException(status_code=503, detail={"mongo": mongo})
+    return {"status": "ok", "mongo": mongo}
+
+
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Métricas no formato do Prometheus: duração, erros e tokens por etapa do fluxo,
+    duração das ferramentas, fluxos por rota e veredito, e duração das requisições HTTP.
+    """
+    return PlainTextResponse(registro.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/sessions/stats", tags=["Chat"])
+def get_sessions_stats():
+    """
+    Retorna o número de sessões e mensagens em memória, a memória estimada
+    do store e quantas sessões já foram removidas por LRU ou TTL.
+    """
+    return store.estatisticas()
+
+
+@app.get("/sessions/dispatch/stats", tags=["Chat"])
+def get_sessions_dispatch_stats():
+    """
+    Retorna quantas requisições foram coalescidas com uma idêntica em andamento,
+    quantas esperaram outra da mesma sessão terminar e a profundidade atual das filas.
+    """
+    return despachante_sessoes.estatisticas()
+
+
+@app.get("/router/stats", tags=["Chat"])
+def get_router_stats():
+    """
+    Retorna quantas mensagens o pré-roteador resolveu sem chamar o LLM (taxa de acerto)
+    e quais regras foram usadas.
+    """
+    return pre_roteador.estatisticas()
+
+
+@app.get("/judge/stats", tags=["Chat"])
+def get_judge_stats():
+    """
+    Retorna quantas respostas foram ao juiz LLM e quantas chamadas foram evitadas
+    pela validação local (formato, toxicidade ou amostragem).
+    """
+    return validador_local.estatisticas()
+
+
+@app.get("/llm/stats", tags=["Chat"])
+def get_llm_stats():
+    """
+    Retorna o estado dos disjuntores de cada modelo, o p95 de latência por modelo e etapa
+    e quantas retentativas, hedges e trocas para o modelo reserva aconteceram.
+    """
+    return estatisticas_llm()
+
+
+@app.get("/admission/stats", tags=["Chat"])
+def get_admission_stats():
+    """
+    Retorna os limites do controle de admissão, quantos fluxos estão em andamento ou na fila
+    e quantas requisições foram admitidas, enfileiradas ou recusadas (429/503) por motivo.
+    """
+    return controle_admissao.estatisticas()
+
+
+@app.get("/batch/stats", tags=["Chat"])
+def get_batch_stats():
+    """
+    Retorna quantas chamadas ao roteador e ao juiz dos lotes de /chat/batch foram
+    agrupadas em `abatch` e o tamanho médio de cada grupo.
+    """
+    return {"roteador": roteador_agrupado.estatisticas(), "juiz": juiz_agrupado.estatisticas()}
+
+
+@app.get("/speculation/stats", tags=["Chat"])
+def get_speculation_stats():
+    """
+    Retorna quantas execuções especulativas do orquestrador foram aprovadas ou descartadas,
+    a latência economizada e os tokens estimados gastos nas descartadas.
+    """
+    return estatisticas_especulacao.estatisticas()
+
+
+@app.get("/cache/stats", tags=["Cache"])
+def get_cache_stats():
+    """
+    Retorna hits (exatos e semânticos), misses e ocupação do cache de respostas de carbono e FAQ,
+    além dos hits e misses do cache de formulários por crachá e do cache de embeddings.
+    """
+    estatisticas = {**cache_respostas.estatisticas(), "crachas": cache_crachas.estatisticas()}
+    if hasattr(faq_tool.embeddings_model, "estatisticas"):
+        estatisticas["embeddings"] = faq_tool.embeddings_model.estatisticas()
+    return estatisticas
+
+
+@app.post("/cache/invalidate", tags=["Cache"])
+def invalidate_cache(rota: str = None):
+    """
+    Remove as respostas em cache (todas, ou só as da `rota` informada: `carbono` ou `faq`).
+    As respostas de FAQ também são invalidadas automaticamente quando o GAIA_FAQ.pdf muda.
+    """
+    removidas = cache_respostas.invalidar(rota)
+    return {"removidas": removidas}
+
+
+@app.post("/admin/resumo-formularios/rebuild", tags=["Admin"])
+def rebuild_resumo_formularios():
+    """
+    Reconstrói do zero o resumo materializado de todos os formulários.
+    Use para recuperação caso o snapshot fique inconsistente.
+    """
+    try:
+        total = resumo_formularios.reconstruir()
+        return {"formularios": total, "snapshot": resumo_formularios.estado()}
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Erro ao reconstruir o resumo: {e}")
+
+
 # =====================================
 # EXECUÇÃO DA API
 # =====================================
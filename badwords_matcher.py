@@ -0,0 +1,153 @@
+from collections import deque
+
+# =====================================
+# AUTÔMATO DE BADWORDS (AHO-CORASICK)
+# =====================================
+
+class MatcherBadwords:
+    """
+    Compila uma lista de termos proibidos em um único autômato Aho-Corasick.
+    A pergunta é percorrida uma única vez, independente do tamanho da lista,
+    e cada ocorrência é devolvida como (termo, inicio, fim) sobre o texto em minúsculas.
+    """
+
+    __slots__ = ("_transicoes", "_falhas", "_saidas", "_termos")
+
+    def __init__(self, termos):
+        self._termos = []
+        self._transicoes = [{}]
+        self._saidas = [()]
+
+        vistos = set()
+        for termo in termos:
+            termo = termo.strip().lower()
+            if not termo or termo in vistos:
+                continue
+            vistos.add(termo)
+            self._inserir(termo)
+
+        self._falhas = [0] * len(self._transicoes)
+        self._construir_falhas()
+
+    def _inserir(self, termo):
+        estado = 0
+        for caractere in termo:
+            proximo = self._transicoes[estado].get(caractere)
+            if proximo is None:
+                proximo = len(self._transicoes)
+                self._transicoes[estado][caractere] = proximo
+                self._transicoes.append({})
+                self._saidas.append(())
+            estado = proximo
+        self._saidas[estado] = self._saidas[estado] + (len(self._termos),)
+        self._termos.append(termo)
+
+    def _construir_falhas(self):
+        fila = deque(self._transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for caractere, proximo in self._transicoes[estado].items():
+                fila.append(proximo)
+                falha = self._falhas[estado]
+                while falha and caractere not in self._transicoes[falha]:
+                    falha = self._falhas[falha]
+                destino = self._transicoes[falha].get(caractere, 0)
+                self._falhas[proximo] = destino if destino != proximo else 0
+                self._saidas[proximo] = self._saidas[proximo] + self._saidas[self._falhas[proximo]]
+
+    def _percorrer(self, texto):
+        transicoes = self._transicoes
+        falhas = self._falhas
+        saidas = self._saidas
+        estado = 0
+        for posicao, caractere in enumerate(texto.lower()):
+            while estado and caractere not in transicoes[estado]:
+                estado = falhas[estado]
+            estado = transicoes[estado].get(caractere, 0)
+            if saidas[estado]:
+                yield posicao, saidas[estado]
+
+    def encontrar(self, texto):
+        """
+        Retorna todas as ocorrências como uma lista de tuplas (termo, inicio, fim),
+        com `fim` exclusivo, na ordem em que terminam no texto.
+        """
+        ocorrencias = []
+        for posicao, indices in self._percorrer(texto):
+            for indice in indices:
+                termo = self._termos[indice]
+                ocorrencias.append((termo, posicao + 1 - len(termo), posicao + 1))
+        return ocorrencias
+
+    def contem(self, texto):
+        """Retorna True assim que o primeiro termo proibido é encontrado."""
+        for _ in self._percorrer(texto):
+            return True
+        return False
+
+    def contem_palavra(self, texto):
+        """
+        Como `contem`, mas só conta ocorrências que são palavras inteiras (sem letra ou dígito
+        colado antes ou depois), para que "cu" não case com "cuidado" nem "pau" com "pauta".
+        """
+        texto = texto.lower()
+        for posicao, indices in self._percorrer(texto):
+            depois = posicao + 1
+            if depois < len(texto) and texto[depois].isalnum():
+                continue
+            for indice in indices:
+                inicio = depois - len(self._termos[indice])
+                if inicio == 0 or not texto[inicio - 1].isalnum():
+                    return True
+        return False
+
+    def __len__(self):
+        return len(self._termos)
+
+
+def compilar_badwords(termos):
+    return MatcherBadwords(termos)
+
+# =====================================
+# MICRO-BENCHMARK
+# =====================================
+
+if __name__ == "__main__":
+    """
+    Compara o autômato com a varredura linear usada antes em `executar_fluxo_gaia`:
+    $ python badwords_matcher.py
+    """
+    import random
+    import string
+    import timeit
+
+    def varredura_linear(termos, texto):
+        texto = texto.lower()
+        return any(word in texto for word in termos)
+
+    random.seed(42)
+    with open("badwords.txt", "r", encoding="utf-8") as f:
+        termos_arquivo = [linha.strip().lower() for linha in f if linha.strip()]
+    termos_sinteticos = termos_arquivo + [
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(5, 12)))
+        for _ in range(30000)
+    ]
+
+    entradas = {
+        "curta": "Qual a média de emissão da minha equipe?",
+        "longa": "Como posso reduzir minha pegada de carbono no deslocamento diário? " * 40,
+    }
+
+    for nome_lista, termos in (("badwords.txt", termos_arquivo), ("sintética", termos_sinteticos)):
+        matcher = compilar_badwords(termos)
+        print(f"\nLista {nome_lista}: {len(matcher)} termos")
+        for nome_entrada, texto in entradas.items():
+            assert matcher.contem(texto) == varredura_linear(termos, texto)
+            repeticoes = 200
+            t_linear = timeit.timeit(lambda: varredura_linear(termos, texto), number=repeticoes) / repeticoes
+            t_matcher = timeit.timeit(lambda: matcher.contem(texto), number=repeticoes) / repeticoes
+            print(
+                f"  entrada {nome_entrada:<5} ({len(texto):>5} chars): "
+                f"linear {t_linear * 1e6:9.1f} µs | autômato {t_matcher * 1e6:9.1f} µs "
+                f"| {t_linear / t_matcher:6.1f}x"
+            )
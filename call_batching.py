@@ -0,0 +1,98 @@
+import os
+import asyncio
+import threading
+import contextvars
+from collections import Counter
+from telemetry import registro, Histograma
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+# Quanto uma chamada espera por outras antes de o lote sair, e o tamanho máximo do lote.
+GAIA_LOTE_JANELA_S = float(os.getenv("GAIA_LOTE_JANELA_S", "0.01"))
+GAIA_LOTE_MAX_CHAMADAS = int(os.getenv("GAIA_LOTE_MAX_CHAMADAS", "16"))
+
+tamanho_lote = registro.registrar(Histograma(
+    "gaia_lote_tamanho", "Chamadas agrupadas em cada `abatch`, por cadeia.", ("cadeia",),
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+))
+
+# =====================================
+# AGRUPADOR
+# =====================================
+
+class AgrupadorChamadas:
+    """
+    Junta as chamadas `ainvoke` de uma cadeia que chegam dentro de `janela_s` (ou até
+    `max_chamadas`) e as envia num único `abatch(..., return_exceptions=True)`.
+    Cada chamador recebe só o seu resultado ou a sua exceção: uma entrada que falha não
+    derruba as outras do lote. Quem desiste (cancelamento) é ignorado quando o lote volta.
+
+    O lote roda num contexto vazio (não no do primeiro chamador): o que cada chamada precisa
+    do seu contexto vai na config dela, montada por `config_da_chamada()` no momento do
+    `ainvoke` (ex.: `llm_resilience.config_prazo_atual`, com o prazo da requisição).
+    """
+
+    def __init__(self, chain, nome: str, janela_s=GAIA_LOTE_JANELA_S, max_chamadas=GAIA_LOTE_MAX_CHAMADAS,
+                 config_da_chamada=None):
+        self.chain = chain
+        self.nome = nome
+        self.config_da_chamada = config_da_chamada
+        self.janela_s = janela_s
+        self.max_chamadas = max_chamadas
+        self._pendentes = []
+        self._agendado = None
+        self._lock = threading.Lock()
+        self._contadores = Counter()
+
+    async def ainvoke(self, entrada):
+        futuro = asyncio.get_running_loop().create_future()
+        config = self.config_da_chamada() if self.config_da_chamada is not None else {}
+        self._pendentes.append((entrada, config, futuro))
+        if len(self._pendentes) >= self.max_chamadas:
+            self._disparar()
+        elif self._agendado is None:
+            self._agendado = asyncio.get_running_loop().call_later(self.janela_s, self._disparar)
+        return await futuro
+
+    def _disparar(self):
+        if self._agendado is not None:
+            self._agendado.cancel()
+            self._agendado = None
+        lote, self._pendentes = self._pendentes, []
+        if lote:
+            asyncio.get_running_loop().create_task(self._executar(lote), context=contextvars.Context())
+
+    async def _executar(self, lote):
+        vivos = [chamada for chamada in lote if not chamada[2].done()]
+        if not vivos:
+            return
+        tamanho_lote.observar(len(vivos), self.nome)
+        with self._lock:
+            self._contadores["lotes"] += 1
+            self._contadores["chamadas"] += len(vivos)
+        try:
+            resultados = await self.chain.abatch(
+                [entrada for entrada, _, _ in vivos],
+                config=[config for _, config, _ in vivos],
+                return_exceptions=True
+            )
+        except Exception as e:
+            resultados = [e] * len(vivos)
+        for (_, _, futuro), resultado in zip(vivos, resultados):
+            if futuro.done():
+                continue
+            if isinstance(resultado, BaseException):
+                futuro.set_exception(resultado)
+            else:
+                futuro.set_result(resultado)
+
+    def estatisticas(self):
+        with self._lock:
+            lotes = self._contadores["lotes"]
+            return {
+                "lotes": lotes,
+                "chamadas": self._contadores["chamadas"],
+                "tamanho_medio": self._contadores["chamadas"] / lotes if lotes else 0.0,
+            }
@@ -0,0 +1,32 @@
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# =====================================
+# LIMITES DE CONCORRÊNCIA
+# =====================================
+
+GAIA_MAX_CONCURRENCY = int(os.getenv("GAIA_MAX_CONCURRENCY", "32"))
+GAIA_BLOCKING_THREADS = int(os.getenv("GAIA_BLOCKING_THREADS", "16"))
+
+# Pool dedicado às chamadas que não têm versão assíncrona (pymongo, Atlas Vector Search).
+# Fica separado do executor padrão do asyncio para que I/O lento não esgote as threads do servidor.
+blocking_pool = ThreadPoolExecutor(
+    max_workers=GAIA_BLOCKING_THREADS,
+    thread_name_prefix="gaia-blocking"
+)
+
+# Quantos fluxos da Gaia podem estar em andamento ao mesmo tempo no processo.
+limite_fluxos = asyncio.Semaphore(GAIA_MAX_CONCURRENCY)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Executa uma função síncrona no pool limitado, sem bloquear o event loop.
+    O contexto atual (ex.: o rastro da requisição em `telemetry`) segue junto para a thread.
+    """
+    loop = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_pool, partial(contexto.run, func, *args, **kwargs))
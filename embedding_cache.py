@@ -0,0 +1,232 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict, Counter
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from telemetry import registro, Contador
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_EMBED_CACHE_MAX_ITEMS = int(os.getenv("GAIA_EMBED_CACHE_MAX_ITEMS", "10000"))
+GAIA_EMBED_CACHE_DISK = os.getenv("GAIA_EMBED_CACHE_DISK", "1") == "1"
+GAIA_EMBED_CACHE_PATH = os.getenv(
+    "GAIA_EMBED_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embeddings_cache.sqlite3")
+)
+
+acessos_cache_embeddings = registro.registrar(Contador(
+    "gaia_embeddings_cache_total", "Textos buscados no cache de embeddings, por camada que respondeu.", ("camada",)
+))
+latencia_economizada_embeddings = registro.registrar(Contador(
+    "gaia_embeddings_cache_latencia_economizada_segundos_total",
+    "Latência estimada que os acertos do cache de embeddings evitaram."
+))
+
+
+def normalizar_texto(texto: str) -> str:
+    return " ".join(texto.split()).casefold()
+
+
+def chave_embedding(modelo: str, tipo: str, texto: str) -> str:
+    """Chave por conteúdo: modelo, tipo (consulta ou documento) e texto normalizado."""
+    return hashlib.sha256(f"{modelo}\0{tipo}\0{normalizar_texto(texto)}".encode("utf-8")).hexdigest()
+
+# =====================================
+# CAMADA EM DISCO
+# =====================================
+
+class CamadaSqlite:
+    """Vetores float32 em um SQLite (modo WAL, então vários workers podem compartilhar o arquivo)."""
+
+    def __init__(self, caminho=GAIA_EMBED_CACHE_PATH):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (chave TEXT PRIMARY KEY, modelo TEXT, vetor BLOB, criado_em REAL)"
+        )
+        self._conexao.commit()
+
+    def buscar_varios(self, chaves) -> dict:
+        if not chaves:
+            return {}
+        marcadores = ",".join("?" * len(chaves))
+        with self._lock:
+            linhas = self._conexao.execute(
+                f"SELECT chave, vetor FROM embeddings WHERE chave IN ({marcadores})", list(chaves)
+            ).fetchall()
+        return {chave: np.frombuffer(vetor, dtype=np.float32).tolist() for chave, vetor in linhas}
+
+    def guardar_varios(self, modelo, itens):
+        agora = time.time()
+        with self._lock:
+            self._conexao.executemany(
+                "INSERT OR REPLACE INTO embeddings (chave, modelo, vetor, criado_em) VALUES (?, ?, ?, ?)",
+                [(chave, modelo, np.asarray(vetor, dtype=np.float32).tobytes(), agora) for chave, vetor in itens]
+            )
+            self._conexao.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conexao.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+# =====================================
+# EMBEDDINGS COM CACHE
+# =====================================
+
+class EmbeddingsEmCache(Embeddings):
+    """
+    Envolve um modelo de embeddings com cache por conteúdo em duas camadas:
+    LRU em memória e SQLite em disco (que sobrevive a reinícios e reindexações).
+    Em `embed_documents`, todos os textos que faltam nas duas camadas vão ao modelo
+    em uma única chamada.
+    """
+
+    def __init__(self, base, modelo: str, max_itens=GAIA_EMBED_CACHE_MAX_ITEMS, disco=None):
+        self.base = base
+        self.modelo = modelo
+        self.max_itens = max_itens
+        if disco is None and GAIA_EMBED_CACHE_DISK:
+            try:
+                disco = CamadaSqlite()
+            except Exception as e:
+                print(f"[embedding_cache] Cache em disco indisponível ({e}); usando só a memória.")
+        self.disco = disco
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = Counter()
+        self._latencia_por_texto = None
+        self._economia_s = 0.0
+
+    # ---------- camadas ----------
+
+    def _consultar(self, chaves):
+        """Retorna {chave: vetor} do que já está em memória ou em disco."""
+        encontrados = {}
+        with self._lock:
+            for chave in chaves:
+                vetor = self._memoria.get(chave)
+                if vetor is not None:
+                    self._memoria.move_to_end(chave)
+                    encontrados[chave] = vetor
+        em_memoria = len(encontrados)
+
+        faltando = [c for c in chaves if c not in encontrados]
+        em_disco = {}
+        if faltando and self.disco is not None:
+            try:
+                em_disco = self.disco.buscar_varios(faltando)
+            except Exception as e:
+                print(f"[embedding_cache] Falha ao ler o cache em disco: {e}")
+            self._guardar_memoria(em_disco.items())
+            encontrados.update(em_disco)
+
+        self._registrar_acertos(em_memoria, len(em_disco), len(chaves) - len(encontrados))
+        return encontrados
+
+    def _guardar_memoria(self, itens):
+        with self._lock:
+            for chave, vetor in itens:
+                self._memoria[chave] = vetor
+                self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_itens:
+                self._memoria.popitem(last=False)
+
+    def _guardar(self, itens):
+        itens = list(itens)
+        self._guardar_memoria(itens)
+        if self.disco is not None:
+            try:
+                self.disco.guardar_varios(self.modelo, itens)
+            except Exception as e:
+                print(f"[embedding_cache] Falha ao gravar o cache em disco: {e}")
+
+    # ---------- métricas ----------
+
+    def _registrar_acertos(self, memoria, disco, misses):
+        acessos_cache_embeddings.inc(memoria, "memoria")
+        acessos_cache_embeddings.inc(disco, "disco")
+        acessos_cache_embeddings.inc(misses, "miss")
+        with self._lock:
+            self._contadores["memoria"] += memoria
+            self._contadores["disco"] += disco
+            self._contadores["miss"] += misses
+            if self._latencia_por_texto is not None and memoria + disco:
+                economia = (memoria + disco) * self._latencia_por_texto
+                self._economia_s += economia
+                latencia_economizada_embeddings.inc(economia)
+
+    def _registrar_chamada(self, duracao_s, n_textos):
+        """Média móvel da latência por texto das chamadas ao modelo, usada para estimar a economia."""
+        por_texto = duracao_s / max(n_textos, 1)
+        with self._lock:
+            anterior = self._latencia_por_texto
+            self._latencia_por_texto = por_texto if anterior is None else 0.8 * anterior + 0.2 * por_texto
+            self._contadores["chamadas_modelo"] += 1
+
+    def estatisticas(self):
+        with self._lock:
+            acertos = self._contadores["memoria"] + self._contadores["disco"]
+            total = acertos + self._contadores["miss"]
+            return {
+                "modelo": self.modelo,
+                "itens_memoria": len(self._memoria),
+                "acertos_memoria": self._contadores["memoria"],
+                "acertos_disco": self._contadores["disco"],
+                "misses": self._contadores["miss"],
+                "taxa_acerto": acertos / total if total else 0.0,
+                "chamadas_modelo": self._contadores["chamadas_modelo"],
+                "latencia_economizada_s": round(self._economia_s, 3),
+                "disco": self.disco.caminho if self.disco is not None else None,
+            }
+
+    # ---------- interface Embeddings ----------
+
+    def _preparar(self, textos, tipo):
+        chaves = [chave_embedding(self.modelo, tipo, t) for t in textos]
+        encontrados = self._consultar(list(dict.fromkeys(chaves)))
+        # Textos faltando, sem repetição (dois textos iguais viram uma única entrada no lote).
+        faltando = {}
+        for chave, texto in zip(chaves, textos):
+            if chave not in encontrados and chave not in faltando:
+                faltando[chave] = texto
+        return chaves, encontrados, faltando
+
+    def _concluir(self, chaves, encontrados, faltando, vetores, duracao_s):
+        if faltando:
+            self._registrar_chamada(duracao_s, len(faltando))
+            novos = dict(zip(faltando, vetores))
+            self._guardar(novos.items())
+            encontrados.update(novos)
+        return [encontrados[c] for c in chaves]
+
+    def embed_documents(self, texts):
+        chaves, encontrados, faltando = self._preparar(texts, "documento")
+        inicio = time.perf_counter()
+        vetores = self.base.embed_documents(list(faltando.values())) if faltando else []
+        return self._concluir(chaves, encontrados, faltando, vetores, time.perf_counter() - inicio)
+
+    def embed_query(self, text):
+        chaves, encontrados, faltando = self._preparar([text], "consulta")
+        inicio = time.perf_counter()
+        vetores = [self.base.embed_query(text)] if faltando else []
+        return self._concluir(chaves, encontrados, faltando, vetores, time.perf_counter() - inicio)[0]
+
+    async def aembed_documents(self, texts):
+        chaves, encontrados, faltando = self._preparar(texts, "documento")
+        inicio = time.perf_counter()
+        vetores = await self.base.aembed_documents(list(faltando.values())) if faltando else []
+        return self._concluir(chaves, encontrados, faltando, vetores, time.perf_counter() - inicio)
+
+    async def aembed_query(self, text):
+        chaves, encontrados, faltando = self._preparar([text], "consulta")
+        inicio = time.perf_counter()
+        vetores = [await self.base.aembed_query(text)] if faltando else []
+        return self._concluir(chaves, encontrados, faltando, vetores, time.perf_counter() - inicio)[0]
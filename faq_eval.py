@@ -0,0 +1,150 @@
+"""
+Avaliação da recuperação do FAQ sobre um pequeno conjunto de perguntas rotuladas.
+
+Para cada configuração (só vetorial como antes, com orçamento, só BM25 e híbrida) mede:
+- acerto: fração das perguntas cujo trecho esperado chegou ao contexto;
+- MRR: 1 / posição do primeiro trecho do contexto que contém o trecho esperado;
+- tokens: tamanho médio estimado do contexto enviado ao `prompt_faq`;
+- latência: p50 da recuperação (com o embedding da pergunta já em cache).
+
+    $ python faq_eval.py                       # embeddings reais (GEMINI_API_KEY)
+    $ python faq_eval.py --embeddings-falsos   # offline, com os embeddings do load_test
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from pre_router import normalizar
+from history_window import estimar_tokens
+from faq_index import IndiceFaqLocal, MODELO_EMBEDDINGS
+from faq_retrieval import (
+    IndiceBM25, fundir_rrf, remover_quase_duplicados, montar_contexto,
+    GAIA_FAQ_CANDIDATOS, GAIA_FAQ_CONTEXT_TOKENS
+)
+
+# (pergunta, trecho do FAQ que precisa estar no contexto)
+PERGUNTAS_ROTULADAS = [
+    ("A Gaia substitui um consultor de ESG?", "não substituindo consultores"),
+    ("Posso corrigir meu formulário pela conversa?", "registrar, alterar ou corrigir"),
+    ("A Gaia consegue ler um PDF ou uma planilha que eu enviar?", "Não há leitura, abertura, extração"),
+    ("Quais dados pessoais a Gaia pede para mim?", "solicita senhas, códigos"),
+    ("Como entro em contato com o suporte?", "ecofactoryc2@gmail.com"),
+    ("O que é um dado agregado?", "Resumo estatístico"),
+    ("A Gaia segue a LGPD?", "Lei Geral de Proteção de Dados"),
+    ("Posso apagar a resposta de um crachá?", "excluir, apagar ou remover"),
+    ("A Gaia acessa sites externos ou e-mails?", "Não há acesso a sites externos"),
+    ("A Gaia faz pagamentos ou transferências?", "execução de pagamentos"),
+    ("O que significa crachá para a Gaia?", "Número de identificação do funcionário"),
+    ("A Gaia executa tarefas sozinha em segundo plano?", "execução autônoma de tarefas"),
+    ("Quem é responsável pelos dados digitados nos formulários?", "responsável pela veracidade"),
+    ("A consulta geral identifica as pessoas?", "anonimizada"),
+    ("Qual o objetivo dessa instrução normativa?", "Estabelecer diretrizes claras"),
+    ("Me dê exemplos de pedidos que não são permitidos.", "Corrija meu formulário"),
+    ("A Gaia pode marcar eventos no meu calendário?", "eventos em calendários externos"),
+    ("Esse documento pode mudar no futuro?", "poderá ser revisada"),
+]
+
+# =====================================
+# CONFIGURAÇÕES AVALIADAS
+# =====================================
+
+def _vetorial(indice, embeddings, pergunta, k):
+    return indice.textos(p for p, _ in indice.buscar(embeddings.embed_query(pergunta), k))
+
+
+def configuracoes(indice, embeddings, bm25, max_tokens):
+    """Cada configuração devolve a lista de trechos que vai para o contexto, em ordem."""
+    def vetorial_antigo(pergunta):
+        return _vetorial(indice, embeddings, pergunta, 6)
+
+    def vetorial_orcamento(pergunta):
+        candidatos = _vetorial(indice, embeddings, pergunta, GAIA_FAQ_CANDIDATOS)
+        return _trechos_do_contexto(candidatos, max_tokens)
+
+    def bm25_orcamento(pergunta):
+        return _trechos_do_contexto(bm25.buscar_textos(pergunta, GAIA_FAQ_CANDIDATOS), max_tokens)
+
+    def hibrido(pergunta):
+        candidatos = fundir_rrf([
+            _vetorial(indice, embeddings, pergunta, GAIA_FAQ_CANDIDATOS),
+            bm25.buscar_textos(pergunta, GAIA_FAQ_CANDIDATOS),
+        ])
+        return _trechos_do_contexto(candidatos, max_tokens)
+
+    return {
+        "vetorial k=6 (antigo)": vetorial_antigo,
+        "vetorial + orçamento": vetorial_orcamento,
+        "bm25 + orçamento": bm25_orcamento,
+        "híbrido + orçamento": hibrido,
+    }
+
+
+def _trechos_do_contexto(candidatos, max_tokens):
+    contexto = montar_contexto(remover_quase_duplicados(candidatos), max_tokens)
+    return contexto.split("\n\n") if contexto else []
+
+# =====================================
+# MÉTRICAS
+# =====================================
+
+def _contem(trecho, esperado):
+    return normalizar(esperado) in normalizar(trecho)
+
+
+def avaliar(recuperar, perguntas=PERGUNTAS_ROTULADAS, repeticoes=3):
+    acertos, reciprocos, tokens, latencias = 0, [], [], []
+    for pergunta, esperado in perguntas:
+        recuperar(pergunta)  # aquece o cache do embedding da pergunta
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            trechos = recuperar(pergunta)
+            latencias.append((time.perf_counter() - inicio) * 1e6)
+        posicao = next((i for i, t in enumerate(trechos, start=1) if _contem(t, esperado)), None)
+        acertos += posicao is not None
+        reciprocos.append(1 / posicao if posicao else 0.0)
+        tokens.append(estimar_tokens("\n\n".join(trechos)))
+    return {
+        "acerto": acertos / len(perguntas),
+        "mrr": statistics.fmean(reciprocos),
+        "tokens_medios": statistics.fmean(tokens),
+        "latencia_p50_us": statistics.median(latencias),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Avalia a recuperação do FAQ da Gaia.")
+    parser.add_argument("--embeddings-falsos", action="store_true", help="Usa os embeddings determinísticos do load_test (sem rede).")
+    parser.add_argument("--max-tokens", type=int, default=GAIA_FAQ_CONTEXT_TOKENS)
+    args = parser.parse_args(argv)
+
+    from faq_ingest import ingerir, DestinoLocal
+    from embedding_cache import EmbeddingsEmCache
+
+    if args.embeddings_falsos:
+        from load_test import EmbeddingsFake
+        base = EmbeddingsFake(latencia_s=0.0)
+    else:
+        from dotenv import load_dotenv
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        load_dotenv()
+        base = GoogleGenerativeAIEmbeddings(model=MODELO_EMBEDDINGS, google_api_key=os.getenv("GEMINI_API_KEY"))
+    embeddings = EmbeddingsEmCache(base, modelo=MODELO_EMBEDDINGS)
+
+    diretorio = tempfile.mkdtemp(prefix="gaia-faq-eval-")
+    ingerir(embeddings, DestinoLocal(diretorio))
+    indice = IndiceFaqLocal.carregar(diretorio)
+    bm25 = IndiceBM25(t["texto"] for t in indice.trechos)
+
+    tipo = "falsos" if args.embeddings_falsos else MODELO_EMBEDDINGS
+    print(f"{len(PERGUNTAS_ROTULADAS)} perguntas | {len(indice)} trechos | embeddings {tipo} | orçamento {args.max_tokens} tokens")
+    print(f"  {'configuração':<24} {'acerto':>7} {'MRR':>6} {'tokens':>7} {'p50 µs':>8}")
+    for nome, recuperar in configuracoes(indice, embeddings, bm25, args.max_tokens).items():
+        r = avaliar(recuperar)
+        print(f"  {nome:<24} {r['acerto']:>7.0%} {r['mrr']:>6.2f} {r['tokens_medios']:>7.0f} {r['latencia_p50_us']:>8.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import numpy as np
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+DIRETORIO_BASE = os.path.dirname(os.path.abspath(__file__))
+CAMINHO_FAQ_PDF = os.path.join(DIRETORIO_BASE, "GAIA_FAQ.pdf")
+GAIA_FAQ_INDEX_DIR = os.getenv("GAIA_FAQ_INDEX_DIR", os.path.join(DIRETORIO_BASE, "faq_index"))
+GAIA_FAQ_CHUNK_CHARS = int(os.getenv("GAIA_FAQ_CHUNK_CHARS", "800"))
+GAIA_FAQ_CHUNK_OVERLAP = int(os.getenv("GAIA_FAQ_CHUNK_OVERLAP", "150"))
+
+MODELO_EMBEDDINGS = "models/text-embedding-004"
+
+# =====================================
+# LEITURA E DIVISÃO DO PDF
+# =====================================
+
+def extrair_paginas(caminho_pdf=CAMINHO_FAQ_PDF):
+    """Gera (número da página, texto) uma página por vez, sem carregar o PDF inteiro em texto."""
+    from pypdf import PdfReader
+
+    leitor = PdfReader(caminho_pdf)
+    for numero, pagina in enumerate(leitor.pages, start=1):
+        yield numero, pagina.extract_text() or ""
+
+
+def dividir_em_trechos(texto: str, tamanho=GAIA_FAQ_CHUNK_CHARS, sobreposicao=GAIA_FAQ_CHUNK_OVERLAP):
+    """
+    Divide o texto em trechos de até `tamanho` caracteres, com `sobreposicao` caracteres
+    repetidos entre trechos vizinhos. Os cortes caem em quebra de linha ou espaço quando possível.
+    """
+    texto = texto.strip()
+    if not texto:
+        return []
+    if sobreposicao >= tamanho:
+        raise ValueError("A sobreposição precisa ser menor que o tamanho do trecho.")
+    trechos = []
+    inicio = 0
+    while inicio < len(texto):
+        fim = min(inicio + tamanho, len(texto))
+        if fim < len(texto):
+            corte = max(texto.rfind("\n", inicio + tamanho // 2, fim), texto.rfind(" ", inicio + tamanho // 2, fim))
+            if corte > inicio:
+                fim = corte
+        trecho = texto[inicio:fim].strip()
+        if trecho:
+            trechos.append(trecho)
+        if fim >= len(texto):
+            break
+        proximo = fim - sobreposicao
+        espaco = texto.find(" ", proximo, fim)
+        if espaco != -1:
+            proximo = espaco + 1
+        inicio = max(proximo, inicio + 1)
+    return trechos
+
+# =====================================
+# ÍNDICE VETORIAL LOCAL
+# =====================================
+
+class IndiceFaqLocal:
+    """
+    Índice do FAQ em processo: uma matriz NumPy (trechos x dimensões) de embeddings
+    normalizados, consultada por produto escalar (força bruta). Para um FAQ de poucas
+    centenas de trechos isso leva microssegundos, sem rede.
+
+    Em disco são dois arquivos no diretório do índice:
+    - `vetores.npy`: a matriz float32, aberta com memória mapeada (`mmap_mode="r"`);
+    - `trechos.json`: os textos, na mesma ordem das linhas, e os metadados (modelo, fonte).
+    """
+
+    ARQUIVO_VETORES = "vetores.npy"
+    ARQUIVO_TRECHOS = "trechos.json"
+
+    def __init__(self, vetores, trechos, metadados=None):
+        self.vetores = vetores
+        self.trechos = trechos
+        self.metadados = metadados or {}
+
+    def __len__(self):
+        return len(self.trechos)
+
+    @classmethod
+    def existe(cls, diretorio=GAIA_FAQ_INDEX_DIR) -> bool:
+        return (
+            os.path.exists(os.path.join(diretorio, cls.ARQUIVO_VETORES))
+            and os.path.exists(os.path.join(diretorio, cls.ARQUIVO_TRECHOS))
+        )
+
+    @classmethod
+    def carregar(cls, diretorio=GAIA_FAQ_INDEX_DIR):
+        with open(os.path.join(diretorio, cls.ARQUIVO_TRECHOS), encoding="utf-8") as f:
+            dados = json.load(f)
+        vetores = np.load(os.path.join(diretorio, cls.ARQUIVO_VETORES), mmap_mode="r")
+        if vetores.shape[0] != len(dados["trechos"]):
+            raise ValueError(
+                f"Índice do FAQ inconsistente: {vetores.shape[0]} vetores para {len(dados['trechos'])} trechos."
+            )
+        return cls(vetores, dados["trechos"], dados.get("metadados"))
+
+    @classmethod
+    def salvar(cls, diretorio, trechos, vetores, metadados=None):
+        """
+        Grava o índice normalizando os vetores. Cada arquivo é escrito num temporário e
+        trocado com `os.replace`, para que um processo lendo o índice nunca veja um arquivo pela metade.
+        """
+        os.makedirs(diretorio, exist_ok=True)
+        matriz = np.asarray(vetores, dtype=np.float32).reshape(len(trechos), -1)
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        matriz = matriz / np.where(normas == 0, 1, normas)
+
+        caminho_vetores = os.path.join(diretorio, cls.ARQUIVO_VETORES)
+        with open(caminho_vetores + ".tmp", "wb") as f:
+            np.save(f, matriz)
+        caminho_trechos = os.path.join(diretorio, cls.ARQUIVO_TRECHOS)
+        with open(caminho_trechos + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"metadados": metadados or {}, "trechos": list(trechos)}, f, ensure_ascii=False)
+        os.replace(caminho_vetores + ".tmp", caminho_vetores)
+        os.replace(caminho_trechos + ".tmp", caminho_trechos)
+        return cls(matriz, list(trechos), metadados)
+
+    def buscar(self, vetor_consulta, k: int = 6):
+        """Retorna [(posição, similaridade de cosseno)] dos `k` trechos mais próximos, do maior para o menor."""
+        if not len(self.trechos):
+            return []
+        consulta = np.asarray(vetor_consulta, dtype=np.float32)
+        norma = np.linalg.norm(consulta)
+        if norma == 0:
+            return []
+        similaridades = self.vetores @ (consulta / norma)
+        k = min(k, len(similaridades))
+        melhores = np.argpartition(-similaridades, k - 1)[:k]
+        melhores = melhores[np.argsort(-similaridades[melhores])]
+        return [(int(i), float(similaridades[i])) for i in melhores]
+
+    def textos(self, posicoes):
+        return [self.trechos[i]["texto"] for i in posicoes]
+
+
+# =====================================
+# BENCHMARK
+# =====================================
+
+if __name__ == "__main__":
+    """
+    Mede a latência de uma busca no índice local (gerado com `python faq_ingest.py`):
+    $ python faq_index.py
+    """
+    indice = IndiceFaqLocal.carregar()
+    print(f"[faq_index] {len(indice)} trechos em {GAIA_FAQ_INDEX_DIR} ({indice.metadados.get('modelo')})")
+
+    consulta = np.random.default_rng(7).standard_normal(indice.vetores.shape[1]).astype(np.float32)
+    repeticoes = 10000
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        indice.buscar(consulta, k=6)
+    print(f"[faq_index] busca k=6: {(time.perf_counter() - inicio) / repeticoes * 1e6:.1f} µs")
@@ -0,0 +1,259 @@
+"""
+Ingestão incremental do GAIA_FAQ.pdf no índice do FAQ (local ou MongoDB Atlas).
+
+O PDF é lido página por página e dividido em trechos; cada trecho é identificado pelo
+SHA-256 do seu texto. Só os trechos novos ou alterados passam pelo `embed_documents`
+(em lotes), os que sumiram do documento são removidos em bloco e os demais são mantidos.
+Rodar de novo sobre o mesmo PDF não gera nenhuma chamada de embedding.
+
+    $ python faq_ingest.py                      # índice local (faq_index/)
+    $ python faq_ingest.py --destino atlas      # coleção faq_embeddings do Atlas
+    $ python faq_ingest.py --tamanho 600 --sobreposicao 100
+    $ python faq_ingest.py --do-atlas           # índice local copiado do Atlas, sem embeddings
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import numpy as np
+from faq_index import (
+    IndiceFaqLocal, extrair_paginas, dividir_em_trechos,
+    CAMINHO_FAQ_PDF, GAIA_FAQ_INDEX_DIR, GAIA_FAQ_CHUNK_CHARS, GAIA_FAQ_CHUNK_OVERLAP, MODELO_EMBEDDINGS
+)
+
+GAIA_FAQ_EMBED_BATCH = int(os.getenv("GAIA_FAQ_EMBED_BATCH", "100"))
+
+# =====================================
+# TRECHOS
+# =====================================
+
+def hash_trecho(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def ler_trechos(caminho_pdf=CAMINHO_FAQ_PDF, tamanho=GAIA_FAQ_CHUNK_CHARS, sobreposicao=GAIA_FAQ_CHUNK_OVERLAP):
+    """Gera {"hash", "texto", "pagina"} por trecho, página por página, sem repetir trechos idênticos."""
+    vistos = set()
+    for pagina, conteudo in extrair_paginas(caminho_pdf):
+        for texto in dividir_em_trechos(conteudo, tamanho, sobreposicao):
+            chave = hash_trecho(texto)
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+            yield {"hash": chave, "texto": texto, "pagina": pagina}
+
+
+def embutir_em_lotes(embeddings, textos, tamanho_lote=GAIA_FAQ_EMBED_BATCH):
+    """Retorna (vetores, número de chamadas a `embed_documents`)."""
+    vetores = []
+    chamadas = 0
+    for inicio in range(0, len(textos), tamanho_lote):
+        vetores.extend(embeddings.embed_documents(textos[inicio:inicio + tamanho_lote]))
+        chamadas += 1
+    return vetores, chamadas
+
+# =====================================
+# DESTINOS
+# =====================================
+
+class DestinoLocal:
+    """Índice local do `faq_index` (vetores.npy + trechos.json), reescrito só quando algo muda."""
+
+    nome = "local"
+
+    def __init__(self, diretorio=GAIA_FAQ_INDEX_DIR):
+        self.diretorio = diretorio
+        self._indice = IndiceFaqLocal.carregar(diretorio) if IndiceFaqLocal.existe(diretorio) else None
+
+    def hashes_existentes(self, modelo) -> list:
+        """Hashes já indexados com o mesmo modelo de embeddings, na ordem atual do índice."""
+        if self._indice is None or self._indice.metadados.get("modelo") != modelo:
+            return []
+        return [t.get("hash") for t in self._indice.trechos]
+
+    def aplicar(self, trechos, novos_vetores: dict, removidos: set, metadados: dict):
+        existentes = self.hashes_existentes(metadados["modelo"])
+        if not novos_vetores and not removidos and existentes == [t["hash"] for t in trechos]:
+            return
+        posicao = {chave: i for i, chave in enumerate(existentes)}
+        vetores = [
+            novos_vetores[t["hash"]] if t["hash"] in novos_vetores else np.array(self._indice.vetores[posicao[t["hash"]]])
+            for t in trechos
+        ]
+        self._indice = IndiceFaqLocal.salvar(self.diretorio, trechos, vetores, metadados)
+
+
+class DestinoAtlas:
+    """
+    Coleção `faq_embeddings` consultada pelo `MongoDBAtlasVectorSearch` do `faq_tool`
+    (campos `text` e `embedding`), com o hash do trecho em `hash_conteudo`.
+    Documentos sem `hash_conteudo` (de cargas manuais antigas) são substituídos.
+    """
+
+    nome = "atlas"
+
+    def __init__(self, colecao):
+        self.colecao = colecao
+
+    def hashes_existentes(self, modelo) -> list:
+        return [
+            d["hash_conteudo"]
+            for d in self.colecao.find({"hash_conteudo": {"$exists": True}, "modelo": modelo}, {"hash_conteudo": 1})
+        ]
+
+    def aplicar(self, trechos, novos_vetores: dict, removidos: set, metadados: dict):
+        from pymongo import UpdateOne
+
+        validos = [t["hash"] for t in trechos]
+        # Remove os trechos que saíram do documento, os de outro modelo e os sem hash.
+        self.colecao.delete_many({"$or": [
+            {"hash_conteudo": {"$nin": validos}},
+            {"modelo": {"$ne": metadados["modelo"]}},
+        ]})
+        operacoes = [
+            UpdateOne(
+                {"hash_conteudo": t["hash"]},
+                {"$set": {
+                    "text": t["texto"],
+                    "embedding": [float(x) for x in novos_vetores[t["hash"]]],
+                    "pagina": t["pagina"],
+                    "fonte": metadados["fonte"],
+                    "modelo": metadados["modelo"],
+                }},
+                upsert=True
+            )
+            for t in trechos if t["hash"] in novos_vetores
+        ]
+        if operacoes:
+            self.colecao.bulk_write(operacoes, ordered=False)
+
+
+def copiar_do_atlas(colecao, diretorio=GAIA_FAQ_INDEX_DIR):
+    """
+    Grava o índice local com os trechos e embeddings que já estão na coleção do Atlas
+    (os mesmos que `--destino atlas` gravou), sem nenhuma chamada de embedding.
+    Retorna o índice, ou None se a coleção não tiver trechos.
+    """
+    documentos = list(colecao.find(
+        {"text": {"$exists": True}, "embedding": {"$exists": True}},
+        {"text": 1, "embedding": 1, "pagina": 1, "hash_conteudo": 1, "modelo": 1, "fonte": 1, "_id": 0}
+    ))
+    if not documentos:
+        return None
+    modelos = {d.get("modelo") for d in documentos}
+    trechos = [
+        {"hash": d.get("hash_conteudo") or hash_trecho(d["text"]), "texto": d["text"], "pagina": d.get("pagina")}
+        for d in documentos
+    ]
+    metadados = {
+        "modelo": modelos.pop() if len(modelos) == 1 else None,
+        "fonte": documentos[0].get("fonte"),
+        "origem": "atlas",
+        "atualizado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return IndiceFaqLocal.salvar(diretorio, trechos, [d["embedding"] for d in documentos], metadados)
+
+# =====================================
+# INGESTÃO
+# =====================================
+
+def ingerir(
+    embeddings,
+    destino,
+    caminho_pdf=CAMINHO_FAQ_PDF,
+    tamanho=GAIA_FAQ_CHUNK_CHARS,
+    sobreposicao=GAIA_FAQ_CHUNK_OVERLAP,
+    tamanho_lote=GAIA_FAQ_EMBED_BATCH,
+    modelo=MODELO_EMBEDDINGS
+) -> dict:
+    """Sincroniza o destino com os trechos atuais do PDF e retorna o que foi feito."""
+    inicio = time.perf_counter()
+    trechos = list(ler_trechos(caminho_pdf, tamanho, sobreposicao))
+    existentes = set(destino.hashes_existentes(modelo))
+    atuais = {t["hash"] for t in trechos}
+
+    pendentes = [t for t in trechos if t["hash"] not in existentes]
+    removidos = existentes - atuais
+    vetores, chamadas = embutir_em_lotes(embeddings, [t["texto"] for t in pendentes], tamanho_lote)
+    novos_vetores = {t["hash"]: v for t, v in zip(pendentes, vetores)}
+
+    metadados = {
+        "modelo": modelo,
+        "fonte": os.path.basename(caminho_pdf),
+        "tamanho_trecho": tamanho,
+        "sobreposicao": sobreposicao,
+        "atualizado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    destino.aplicar(trechos, novos_vetores, removidos, metadados)
+
+    return {
+        "destino": destino.nome,
+        "trechos": len(trechos),
+        "novos": len(pendentes),
+        "removidos": len(removidos),
+        "mantidos": len(trechos) - len(pendentes),
+        "chamadas_embedding": chamadas,
+        "duracao_s": round(time.perf_counter() - inicio, 3),
+    }
+
+
+def criar_destino(nome, diretorio=GAIA_FAQ_INDEX_DIR):
+    if nome == "local":
+        return DestinoLocal(diretorio)
+    if nome == "atlas":
+        from mongo_client import get_db
+        from faq_tool import COLLECTION_NAME
+        return DestinoAtlas(get_db()[COLLECTION_NAME])
+    raise ValueError(f"Destino desconhecido: {nome}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestão incremental do FAQ da Gaia.")
+    parser.add_argument("--pdf", default=CAMINHO_FAQ_PDF)
+    parser.add_argument("--destino", choices=["local", "atlas"], default="local")
+    parser.add_argument("--diretorio-indice", default=GAIA_FAQ_INDEX_DIR)
+    parser.add_argument("--tamanho", type=int, default=GAIA_FAQ_CHUNK_CHARS, help="Tamanho máximo do trecho, em caracteres.")
+    parser.add_argument("--sobreposicao", type=int, default=GAIA_FAQ_CHUNK_OVERLAP)
+    parser.add_argument("--lote", type=int, default=GAIA_FAQ_EMBED_BATCH, help="Trechos por chamada de embed_documents.")
+    parser.add_argument("--do-atlas", action="store_true", help="Copia o índice local da coleção do Atlas, sem ler o PDF.")
+    args = parser.parse_args(argv)
+
+    if args.do_atlas:
+        from mongo_client import get_db
+        from faq_tool import COLLECTION_NAME
+        indice = copiar_do_atlas(get_db()[COLLECTION_NAME], args.diretorio_indice)
+        if indice is None:
+            print("[faq_ingest] A coleção do Atlas não tem trechos do FAQ.")
+            return 1
+        print(f"[faq_ingest] local: {len(indice)} trechos copiados do Atlas para {args.diretorio_indice}")
+        return 0
+
+    from dotenv import load_dotenv
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    from embedding_cache import EmbeddingsEmCache
+
+    load_dotenv()
+    # Com o cache, mudar o tamanho ou a sobreposição dos trechos só reembute os trechos realmente novos.
+    embeddings = EmbeddingsEmCache(
+        GoogleGenerativeAIEmbeddings(model=MODELO_EMBEDDINGS, google_api_key=os.getenv("GEMINI_API_KEY")),
+        modelo=MODELO_EMBEDDINGS
+    )
+    resultado = ingerir(
+        embeddings,
+        criar_destino(args.destino, args.diretorio_indice),
+        caminho_pdf=args.pdf,
+        tamanho=args.tamanho,
+        sobreposicao=args.sobreposicao,
+        tamanho_lote=args.lote
+    )
+    print(
+        f"[faq_ingest] {resultado['destino']}: {resultado['trechos']} trechos "
+        f"({resultado['novos']} novos, {resultado['mantidos']} mantidos, {resultado['removidos']} removidos), "
+        f"{resultado['chamadas_embedding']} chamadas de embedding em {resultado['duracao_s']} s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import os
+import re
+import math
+from functools import lru_cache
+from collections import Counter, defaultdict
+from pre_router import normalizar
+from history_window import estimar_tokens, CARACTERES_POR_TOKEN
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_FAQ_HIBRIDO = os.getenv("GAIA_FAQ_HIBRIDO", "1") == "1"
+# Quantos candidatos cada busca (vetorial e BM25) traz antes da fusão.
+GAIA_FAQ_CANDIDATOS = int(os.getenv("GAIA_FAQ_CANDIDATOS", "10"))
+# Orçamento do contexto enviado ao `prompt_faq`, em tokens estimados.
+GAIA_FAQ_CONTEXT_TOKENS = int(os.getenv("GAIA_FAQ_CONTEXT_TOKENS", "800"))
+# Dois trechos com essa fração (ou mais) de trigramas de palavras em comum contam como repetidos.
+GAIA_FAQ_DEDUP_SIMILARIDADE = float(os.getenv("GAIA_FAQ_DEDUP_SIMILARIDADE", "0.8"))
+
+RRF_K = 60
+
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das", "e", "ou",
+    "em", "no", "na", "nos", "nas", "por", "para", "com", "sem", "que", "se", "ao", "aos", "como",
+    "qual", "quais", "quando", "onde", "eu", "voce", "ela", "ele", "meu", "minha", "meus", "minhas",
+    "seu", "sua", "seus", "suas", "isso", "este", "esta", "esse", "essa", "pelo", "pela", "sao",
+    "ser", "ter", "ha", "mais", "muito", "posso", "pode", "me", "mim", "nao", "sim",
+}
+
+# =====================================
+# BM25
+# =====================================
+
+def tokenizar(texto: str):
+    return [p for p in re.findall(r"\w+", normalizar(texto)) if len(p) > 1 and p not in STOPWORDS]
+
+
+class IndiceBM25:
+    """Índice BM25 (Okapi) em memória sobre os trechos do FAQ."""
+
+    def __init__(self, textos, k1=1.5, b=0.75):
+        self.textos = list(textos)
+        self.k1 = k1
+        self.b = b
+        self._frequencias = [Counter(tokenizar(t)) for t in self.textos]
+        self._tamanhos = [sum(f.values()) for f in self._frequencias]
+        self._media_tamanho = (sum(self._tamanhos) / len(self._tamanhos)) if self._tamanhos else 0.0
+        self._postings = defaultdict(list)
+        for posicao, frequencias in enumerate(self._frequencias):
+            for termo in frequencias:
+                self._postings[termo].append(posicao)
+        n = len(self.textos)
+        self._idf = {
+            termo: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for termo, docs in self._postings.items()
+        }
+
+    def __len__(self):
+        return len(self.textos)
+
+    def buscar(self, consulta: str, k: int = GAIA_FAQ_CANDIDATOS):
+        """Retorna [(posição, pontuação)] dos `k` trechos com maior BM25 (só os com algum termo da consulta)."""
+        pontuacoes = defaultdict(float)
+        for termo in set(tokenizar(consulta)):
+            idf = self._idf.get(termo)
+            if idf is None:
+                continue
+            for posicao in self._postings[termo]:
+                tf = self._frequencias[posicao][termo]
+                normalizacao = 1 - self.b + self.b * self._tamanhos[posicao] / (self._media_tamanho or 1)
+                pontuacoes[posicao] += idf * tf * (self.k1 + 1) / (tf + self.k1 * normalizacao)
+        return sorted(pontuacoes.items(), key=lambda item: -item[1])[:k]
+
+    def buscar_textos(self, consulta: str, k: int = GAIA_FAQ_CANDIDATOS):
+        return [self.textos[posicao] for posicao, _ in self.buscar(consulta, k)]
+
+# =====================================
+# FUSÃO, DEDUPLICAÇÃO E ORÇAMENTO
+# =====================================
+
+def fundir_rrf(listas, k: int = RRF_K):
+    """Reciprocal-rank fusion: cada lista contribui 1/(k + posição) para cada texto que trouxe."""
+    pontuacoes = defaultdict(float)
+    for lista in listas:
+        for posicao, texto in enumerate(lista, start=1):
+            pontuacoes[texto] += 1.0 / (k + posicao)
+    return sorted(pontuacoes, key=lambda texto: -pontuacoes[texto])
+
+
+@lru_cache(maxsize=1024)
+def _trigramas(texto: str):
+    # Os trechos do FAQ se repetem entre perguntas, então os trigramas ficam em cache.
+    palavras = re.findall(r"\w+", normalizar(texto))
+    if len(palavras) < 3:
+        return frozenset({tuple(palavras)})
+    return frozenset(tuple(palavras[i:i + 3]) for i in range(len(palavras) - 2))
+
+
+def remover_quase_duplicados(textos, limiar: float = GAIA_FAQ_DEDUP_SIMILARIDADE):
+    """
+    Mantém a ordem e descarta um trecho quando a fração dos trigramas do menor dos dois
+    que aparece no outro passa de `limiar` (pega cópias e trechos contidos em outros).
+    """
+    mantidos = []
+    for texto in textos:
+        trigramas = _trigramas(texto)
+        repetido = any(
+            len(trigramas & outros) / max(1, min(len(trigramas), len(outros))) >= limiar
+            for _, outros in mantidos
+        )
+        if not repetido:
+            mantidos.append((texto, trigramas))
+    return [texto for texto, _ in mantidos]
+
+
+def montar_contexto(textos, max_tokens: int = GAIA_FAQ_CONTEXT_TOKENS, max_trechos: int = None):
+    """
+    Junta os trechos em ordem de relevância enquanto couberem em `max_tokens`.
+    Um trecho que não cabe é pulado (os seguintes, menores, ainda podem entrar);
+    se nem o primeiro cabe, ele entra cortado no limite do orçamento.
+    """
+    escolhidos = []
+    usados = 0
+    for texto in textos:
+        if max_trechos is not None and len(escolhidos) >= max_trechos:
+            break
+        custo = estimar_tokens(texto)
+        if usados + custo <= max_tokens:
+            escolhidos.append(texto)
+            usados += custo
+    if not escolhidos and textos:
+        escolhidos.append(textos[0][:max_tokens * CARACTERES_POR_TOKEN])
+    return "\n\n".join(escolhidos)
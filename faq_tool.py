@@ -1,21 +1,47 @@
 import os
-import pymongo
 from langchain_mongodb import MongoDBAtlasVectorSearch
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from mongo_client import get_client, MONGO_DB_NAME
+from faq_index import IndiceFaqLocal, GAIA_FAQ_INDEX_DIR, MODELO_EMBEDDINGS
+from faq_ingest import copiar_do_atlas
+from embedding_cache import EmbeddingsEmCache
+from faq_retrieval import (
+    IndiceBM25, fundir_rrf, remover_quase_duplicados, montar_contexto,
+    GAIA_FAQ_HIBRIDO, GAIA_FAQ_CANDIDATOS, GAIA_FAQ_CONTEXT_TOKENS
+)
+from telemetry import registro, Histograma
+from history_window import estimar_tokens
 
-MONGO_URL = os.getenv("MONGO_URL")
-
-DB_NAME = "dbInterEco"
+DB_NAME = MONGO_DB_NAME
 COLLECTION_NAME = "faq_embeddings"
 INDEX_NAME = "faq_vector_index" 
 
+# local: índice NumPy em processo (faq_index.py); atlas: MongoDB Atlas Vector Search;
+# auto: o índice local. Em local e auto, se o índice não foi gerado (faq_ingest.py no build da imagem),
+# ele é copiado do Atlas no startup; sem índice, `local` falha e `auto` usa o Atlas.
+GAIA_FAQ_BACKEND = os.getenv("GAIA_FAQ_BACKEND", "auto")
+# Máximo de trechos no contexto final (o orçamento em tokens também limita).
+GAIA_FAQ_K = int(os.getenv("GAIA_FAQ_K", "6"))
+
+tokens_contexto_faq = registro.registrar(Histograma(
+    "gaia_faq_contexto_tokens", "Tamanho estimado, em tokens, do contexto enviado ao prompt do FAQ.",
+    buckets=(100, 200, 400, 600, 800, 1200, 1600, 2400)
+))
+
+embeddings_model = None
+collection = None
+
 try:
-    client = pymongo.MongoClient(MONGO_URL)
-    collection = client[DB_NAME][COLLECTION_NAME]
+    collection = get_client()[DB_NAME][COLLECTION_NAME]
 
-    embeddings_model = GoogleGenerativeAIEmbeddings(
-        model="models/text-embedding-004",
-        google_api_key=os.getenv("GEMINI_API_KEY")
+    # Perguntas repetidas (e a mesma pergunta vista pelo cache de respostas e pela busca)
+    # reaproveitam o embedding em vez de chamar a API de novo.
+    embeddings_model = EmbeddingsEmCache(
+        GoogleGenerativeAIEmbeddings(
+            model=MODELO_EMBEDDINGS,
+            google_api_key=os.getenv("GEMINI_API_KEY")
+        ),
+        modelo=MODELO_EMBEDDINGS
     )
 
     vector_store = MongoDBAtlasVectorSearch(
@@ -29,25 +55,127 @@ except Exception as e:
     print(f"[faq_tool] ERRO CRÍTICO ao inicializar o Atlas Vector Search: {e}")
     vector_store = None
 
+# =====================================
+# RECUPERADORES
+# =====================================
+
+class RecuperadorAtlas:
+    """Busca os trechos no MongoDB Atlas (embedding da pergunta + `similarity_search` remoto)."""
+
+    nome = "atlas"
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+
+    def buscar(self, pergunta: str, k: int = GAIA_FAQ_K):
+        if self.vector_store is None:
+            raise RuntimeError("vector_store não foi inicializado.")
+        return [r.page_content for r in self.vector_store.similarity_search(pergunta, k=k)]
+
+
+class RecuperadorLocal:
+    """Busca os trechos no índice local memory-mapped; só o embedding da pergunta sai do processo."""
+
+    nome = "local"
+
+    def __init__(self, indice: IndiceFaqLocal, embeddings):
+        self.indice = indice
+        self.embeddings = embeddings
+
+    def buscar(self, pergunta: str, k: int = GAIA_FAQ_K):
+        vetor = self.embeddings.embed_query(pergunta)
+        return self.indice.textos(posicao for posicao, _ in self.indice.buscar(vetor, k))
+
+
+class RecuperadorHibrido:
+    """Funde, por reciprocal-rank fusion, os candidatos da busca vetorial com os do BM25 sobre os mesmos trechos."""
+
+    def __init__(self, vetorial, bm25: IndiceBM25):
+        self.vetorial = vetorial
+        self.bm25 = bm25
+        self.nome = f"hibrido({vetorial.nome})"
+
+    def buscar(self, pergunta: str, k: int = GAIA_FAQ_CANDIDATOS):
+        return fundir_rrf([self.vetorial.buscar(pergunta, k), self.bm25.buscar_textos(pergunta, k)])
+
+
+def _textos_do_atlas():
+    """Textos dos trechos gravados no Atlas pelo faq_ingest (campo `text`), para o BM25 sem índice local."""
+    if collection is None:
+        return []
+    try:
+        return [d["text"] for d in collection.find({}, {"text": 1, "_id": 0}) if d.get("text")]
+    except Exception as e:
+        print(f"[faq_tool] Falha ao ler os trechos do FAQ no Atlas para o BM25: {e}")
+        return []
+
+
+def criar_recuperador(backend=GAIA_FAQ_BACKEND, diretorio_indice=GAIA_FAQ_INDEX_DIR, hibrido=GAIA_FAQ_HIBRIDO):
+    indice = None
+    if IndiceFaqLocal.existe(diretorio_indice):
+        try:
+            indice = IndiceFaqLocal.carregar(diretorio_indice)
+            modelo = indice.metadados.get("modelo")
+            if modelo and modelo != MODELO_EMBEDDINGS:
+                print(f"[faq_tool] Aviso: índice local gerado com '{modelo}', mas as consultas usam '{MODELO_EMBEDDINGS}'.")
+        except Exception as e:
+            print(f"[faq_tool] Falha ao carregar o índice local do FAQ: {e}")
+
+    if backend in ("local", "auto") and indice is None and collection is not None:
+        # Os embeddings já estão no Atlas: copiá-los é uma leitura só, sem chamar a API de embeddings.
+        try:
+            indice = copiar_do_atlas(collection, diretorio_indice)
+            if indice is not None:
+                print(f"[faq_tool] Índice local do FAQ copiado do Atlas para {diretorio_indice}.")
+        except Exception as e:
+            print(f"[faq_tool] Falha ao copiar o índice do FAQ do Atlas: {e}")
+
+    if backend == "local" and indice is None:
+        raise RuntimeError(
+            f"GAIA_FAQ_BACKEND=local, mas não há índice do FAQ em {diretorio_indice} nem trechos no Atlas para copiar. "
+            "Gere o índice com `python faq_ingest.py` ou use GAIA_FAQ_BACKEND=auto/atlas."
+        )
+
+    if backend in ("local", "auto") and indice is not None:
+        print(f"[faq_tool] Usando o índice local do FAQ ({len(indice)} trechos).")
+        vetorial = RecuperadorLocal(indice, embeddings_model)
+    else:
+        if backend == "auto":
+            print(f"[faq_tool] Índice local do FAQ indisponível em {diretorio_indice}; usando o Atlas.")
+        vetorial = RecuperadorAtlas(vector_store)
+
+    # O BM25 usa os textos do índice local ou, sem ele, os mesmos trechos lidos do Atlas.
+    if hibrido:
+        textos = [t["texto"] for t in indice.trechos] if indice is not None else _textos_do_atlas()
+        if textos:
+            return RecuperadorHibrido(vetorial, IndiceBM25(textos))
+        print("[faq_tool] Sem trechos para o BM25; usando só a busca vetorial.")
+    return vetorial
+
+
+recuperador = criar_recuperador()
+
 
 def get_faq_context(question: str):
     """
-    Busca os trechos mais relevantes do MongoDB Atlas com base na pergunta do usuário.
-    Retorna uma string contendo os trechos mais parecidos.
+    Busca os trechos mais relevantes do FAQ (índice local ou MongoDB Atlas, conforme GAIA_FAQ_BACKEND,
+    fundidos com o BM25 quando GAIA_FAQ_HIBRIDO=1) com base na pergunta do usuário.
+    Retorna os trechos sem repetições, em ordem de relevância. O orçamento GAIA_FAQ_CONTEXT_TOKENS
+    só vale com a fusão híbrida: sem o BM25, os GAIA_FAQ_K trechos da busca vetorial vão inteiros,
+    porque cortá-los derruba a taxa de acerto do FAQ.
     """
-    if vector_store is None:
-        print("[faq_tool] Erro: vector_store não foi inicializado.")
-        return ""
-        
     try:
-        results = vector_store.similarity_search(question, k=6)
-
-        context_text = "\n\n".join([r.page_content for r in results])
+        if isinstance(recuperador, RecuperadorHibrido):
+            results = recuperador.buscar(question, k=GAIA_FAQ_CANDIDATOS)
+            context_text = montar_contexto(remover_quase_duplicados(results), GAIA_FAQ_CONTEXT_TOKENS, GAIA_FAQ_K)
+        else:
+            context_text = "\n\n".join(remover_quase_duplicados(recuperador.buscar(question, k=GAIA_FAQ_K)))
+        tokens_contexto_faq.observar(estimar_tokens(context_text))
         return context_text
         
     except Exception as e:
         try:
-            print(f"[faq_tool] erro ao buscar contexto do Atlas: {type(e).__name__}: {e}")
+            print(f"[faq_tool] erro ao buscar contexto ({recuperador.nome}): {type(e).__name__}: {e}")
         except Exception:
             pass
-        return ""
\ No newline at end of file
+        return ""
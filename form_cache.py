@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from mongo_client import get_db
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_CRACHA_CACHE_TTL = float(os.getenv("GAIA_CRACHA_CACHE_TTL", "300"))
+GAIA_CRACHA_CACHE_MAX_ITEMS = int(os.getenv("GAIA_CRACHA_CACHE_MAX_ITEMS", "5000"))
+GAIA_PERGUNTAS_REFRESH_SEGUNDOS = float(os.getenv("GAIA_PERGUNTAS_REFRESH_SEGUNDOS", "600"))
+
+# =====================================
+# CATÁLOGO DE PERGUNTAS
+# =====================================
+
+class CatalogoPerguntas:
+    """
+    Cópia em memória da coleção `perguntas`, carregada uma vez e recarregada
+    a cada GAIA_PERGUNTAS_REFRESH_SEGUNDOS, ou imediatamente quando um formulário
+    cita uma pergunta que o catálogo ainda não conhece.
+    """
+
+    def __init__(self, db_factory=get_db, intervalo_refresh=GAIA_PERGUNTAS_REFRESH_SEGUNDOS):
+        self._db_factory = db_factory
+        self.intervalo_refresh = intervalo_refresh
+        self._perguntas = None
+        self._carregado_em = 0.0
+        self._lock = threading.Lock()
+
+    def recarregar(self):
+        perguntas = {p["_id"]: p for p in self._db_factory().perguntas.find({})}
+        with self._lock:
+            self._perguntas = perguntas
+            self._carregado_em = time.monotonic()
+        return perguntas
+
+    def invalidar(self):
+        with self._lock:
+            self._perguntas = None
+
+    def todas(self) -> dict:
+        perguntas = self._perguntas
+        if perguntas is None or time.monotonic() - self._carregado_em > self.intervalo_refresh:
+            perguntas = self.recarregar()
+        return perguntas
+
+    def buscar_varias(self, ids) -> dict:
+        """Retorna {id: pergunta} para os ids pedidos, recarregando uma vez se faltar algum."""
+        perguntas = self.todas()
+        if any(i not in perguntas for i in ids):
+            perguntas = self.recarregar()
+        return {i: perguntas[i] for i in ids if i in perguntas}
+
+# =====================================
+# CACHE POR CRACHÁ
+# =====================================
+
+class CacheCrachas:
+    """
+    Cache com TTL do resultado de `query_formulario_funcionario`, por `numero_cracha`.
+    Entradas saem por TTL, por LRU ao passar de `max_itens`, ou por invalidação explícita
+    quando o formulário daquele crachá muda.
+    """
+
+    def __init__(self, ttl_segundos=GAIA_CRACHA_CACHE_TTL, max_itens=GAIA_CRACHA_CACHE_MAX_ITEMS):
+        self.ttl_segundos = ttl_segundos
+        self.max_itens = max_itens
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def buscar(self, numero_cracha):
+        with self._lock:
+            entrada = self._entradas.get(numero_cracha)
+            if entrada is None or entrada[0] < time.monotonic():
+                self._entradas.pop(numero_cracha, None)
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(numero_cracha)
+            self.hits += 1
+            return entrada[2]
+
+    def guardar(self, numero_cracha, resultado, form_id=None):
+        with self._lock:
+            self._entradas[numero_cracha] = (time.monotonic() + self.ttl_segundos, form_id, resultado)
+            self._entradas.move_to_end(numero_cracha)
+            while len(self._entradas) > self.max_itens:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, numero_cracha=None, form_id=None):
+        """Remove a entrada do crachá (ou a que veio do formulário `form_id`); sem argumentos, limpa tudo."""
+        with self._lock:
+            if numero_cracha is None and form_id is None:
+                self._entradas.clear()
+                return
+            if numero_cracha is not None:
+                self._entradas.pop(numero_cracha, None)
+            if form_id is not None:
+                for cracha in [c for c, e in self._entradas.items() if e[1] == form_id]:
+                    del self._entradas[cracha]
+
+    def ao_mudar_formulario(self, form_id, form=None):
+        """Listener para as mudanças de formulário vistas pelo resumo materializado."""
+        self.invalidar(numero_cracha=form.get("numero_cracha") if form else None, form_id=form_id)
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "itens": len(self._entradas),
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0,
+            }
+
+# =====================================
+# ÍNDICES
+# =====================================
+
+_indices_garantidos = False
+
+def garantir_indices(db):
+    """Cria (uma vez por processo) o índice único em `formulario.numero_cracha`."""
+    global _indices_garantidos
+    if _indices_garantidos:
+        return
+    try:
+        db.formulario.create_index("numero_cracha", unique=True, name="numero_cracha_unico")
+    except Exception as e:
+        print(f"[form_cache] Não foi possível criar o índice único em formulario.numero_cracha: {e}")
+    _indices_garantidos = True
+
+
+catalogo_perguntas = CatalogoPerguntas()
+cache_crachas = CacheCrachas()
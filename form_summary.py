@@ -0,0 +1,307 @@
+import os
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+from mongo_client import get_db
+from form_cache import catalogo_perguntas
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_RESUMO_MATERIALIZADO = os.getenv("GAIA_RESUMO_MATERIALIZADO", "1") == "1"
+GAIA_RESUMO_POLL_SEGUNDOS = float(os.getenv("GAIA_RESUMO_POLL_SEGUNDOS", "30"))
+GAIA_RESUMO_REBUILD_SEGUNDOS = float(os.getenv("GAIA_RESUMO_REBUILD_SEGUNDOS", "3600"))
+# Intervalo mínimo entre tentativas de `iniciar_em_segundo_plano` quando o MongoDB está fora.
+GAIA_RESUMO_RETENTAR_INICIO_SEGUNDOS = float(os.getenv("GAIA_RESUMO_RETENTAR_INICIO_SEGUNDOS", "30"))
+
+_PROJECAO = {"respostas": 1, "data_resposta": 1, "numero_cracha": 1}
+
+# =====================================
+# RESUMO MATERIALIZADO
+# =====================================
+
+class ResumoFormularios:
+    """
+    Snapshot em memória do resumo de todos os formulários (contagem de cada resposta por pergunta).
+
+    Cada formulário tem sua contribuição guardada por `_id`, então inserir, atualizar ou
+    remover um formulário só mexe nas contagens dele, e reaplicar o mesmo formulário é idempotente.
+    As mudanças chegam por um change stream (quando o servidor suporta) ou por um job
+    periódico que busca os formulários com `data_resposta` a partir da última vista,
+    complementado por reconstruções completas periódicas para capturar edições e remoções.
+    Os ouvintes registrados em `adicionar_ouvinte` recebem (form_id, form) a cada mudança
+    e (None, None) a cada reconstrução completa.
+    """
+
+    def __init__(self, db_factory=get_db, catalogo=catalogo_perguntas):
+        self._db_factory = db_factory
+        self._catalogo = catalogo
+        self._lock = threading.Lock()
+        self._contagens = {}
+        self._contribuicoes = {}
+        self._pares = {}
+        self._ouvintes = []
+        self._marca_data = None
+        self._ids_na_marca = set()
+        self._ultima_sincronizacao = None
+        self._ultima_reconstrucao = None
+        self._modo = "manual"
+        self._thread = None
+        self._inicio_stream = None
+        self._iniciando = False
+        self._ultima_tentativa_inicio = None
+        self._parar = threading.Event()
+
+    # ---------- aplicação de mudanças ----------
+
+    def _contribuicao(self, form):
+        pares = []
+        for r in form.get("respostas", []):
+            par = (r["id_pergunta"], r["resposta"])
+            pares.append(self._pares.setdefault(par, par))
+        return tuple(pares)
+
+    def _remover(self, form_id):
+        antiga = self._contribuicoes.pop(form_id, None)
+        if antiga is None:
+            return
+        for id_pergunta, resposta in antiga:
+            contagem = self._contagens[id_pergunta]
+            contagem[resposta] -= 1
+            if contagem[resposta] <= 0:
+                del contagem[resposta]
+
+    def _aplicar(self, form):
+        self._remover(form["_id"])
+        contribuicao = self._contribuicao(form)
+        self._contribuicoes[form["_id"]] = contribuicao
+        for id_pergunta, resposta in contribuicao:
+            self._contagens.setdefault(id_pergunta, Counter())[resposta] += 1
+        data = form.get("data_resposta")
+        if isinstance(data, datetime):
+            if self._marca_data is None or data > self._marca_data:
+                self._marca_data = data
+                self._ids_na_marca = {form["_id"]}
+            elif data == self._marca_data:
+                self._ids_na_marca.add(form["_id"])
+
+    def adicionar_ouvinte(self, ouvinte):
+        self._ouvintes.append(ouvinte)
+
+    def _notificar(self, form_id, form):
+        for ouvinte in self._ouvintes:
+            try:
+                ouvinte(form_id, form)
+            except Exception as e:
+                print(f"[form_summary] Falha em ouvinte de mudança de formulário: {e}")
+
+    def aplicar_formulario(self, form):
+        """Insere ou atualiza a contribuição de um formulário no snapshot."""
+        with self._lock:
+            self._aplicar(form)
+            self._ultima_sincronizacao = time.time()
+        self._notificar(form["_id"], form)
+
+    def remover_formulario(self, form_id):
+        with self._lock:
+            self._remover(form_id)
+            self._ultima_sincronizacao = time.time()
+        self._notificar(form_id, None)
+
+    # ---------- reconstrução e delta ----------
+
+    def reconstruir(self):
+        """Reconstrói o snapshot do zero a partir do MongoDB (comando de recuperação)."""
+        db = self._db_factory()
+        self._catalogo.recarregar()
+        formularios = db.formulario.find({}, _PROJECAO)
+
+        novo = ResumoFormularios(self._db_factory, self._catalogo)
+        for form in formularios:
+            novo._aplicar(form)
+
+        agora = time.time()
+        with self._lock:
+            self._contagens = novo._contagens
+            self._contribuicoes = novo._contribuicoes
+            self._pares = novo._pares
+            self._marca_data = novo._marca_data
+            self._ids_na_marca = novo._ids_na_marca
+            self._ultima_sincronizacao = agora
+            self._ultima_reconstrucao = agora
+        self._notificar(None, None)
+        return len(novo._contribuicoes)
+
+    def sincronizar_delta(self):
+        """
+        Aplica os formulários com `data_resposta` a partir da última data já vista.
+        A busca usa `$gte` (outro formulário pode chegar com a mesma data), então os que já
+        foram vistos exatamente nessa data são pulados, sem reaplicar nem notificar os ouvintes.
+        """
+        db = self._db_factory()
+        with self._lock:
+            marca, vistos = self._marca_data, set(self._ids_na_marca)
+        filtro = {} if marca is None else {"data_resposta": {"$gte": marca}}
+        aplicados = 0
+        for form in db.formulario.find(filtro, _PROJECAO):
+            if marca is not None and form.get("data_resposta") == marca and form["_id"] in vistos:
+                continue
+            with self._lock:
+                self._aplicar(form)
+            self._notificar(form["_id"], form)
+            aplicados += 1
+        with self._lock:
+            self._ultima_sincronizacao = time.time()
+        return aplicados
+
+    # ---------- atualização em segundo plano ----------
+
+    def _tempo_de_operacao(self):
+        """
+        `operationTime` atual do cluster (None fora de replica set). Capturado antes de uma
+        reconstrução e passado ao `watch`, faz o change stream começar antes da leitura completa:
+        nada que mude durante a reconstrução se perde (reaplicar um formulário é idempotente).
+        """
+        try:
+            return self._db_factory().command("ping").get("operationTime")
+        except Exception:
+            return None
+
+    def iniciar(self):
+        """Faz a primeira reconstrução e inicia a atualização em segundo plano (uma única vez)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._executar, name="gaia-resumo-formularios", daemon=True)
+        try:
+            self._inicio_stream = self._tempo_de_operacao()
+            self.reconstruir()
+        except Exception:
+            with self._lock:
+                self._thread = None
+            raise
+        self._thread.start()
+
+    def iniciar_em_segundo_plano(self):
+        """
+        `iniciar` numa thread, sem bloquear quem chama (startup da API, primeira consulta por crachá).
+        Se falhar (MongoDB fora), a próxima chamada tenta de novo, no máximo uma vez a cada
+        GAIA_RESUMO_RETENTAR_INICIO_SEGUNDOS.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            if self._thread is not None or self._iniciando:
+                return
+            if self._ultima_tentativa_inicio is not None and agora - self._ultima_tentativa_inicio < GAIA_RESUMO_RETENTAR_INICIO_SEGUNDOS:
+                return
+            self._iniciando = True
+            self._ultima_tentativa_inicio = agora
+        threading.Thread(target=self._iniciar_registrando_falha, name="gaia-resumo-inicio", daemon=True).start()
+
+    def _iniciar_registrando_falha(self):
+        try:
+            self.iniciar()
+        except Exception as e:
+            print(f"[form_summary] Não foi possível iniciar o resumo materializado: {e}")
+        finally:
+            with self._lock:
+                self._iniciando = False
+
+    def parar(self):
+        self._parar.set()
+
+    def _executar(self):
+        try:
+            self._ouvir_change_stream()
+        except Exception as e:
+            print(f"[form_summary] Change stream indisponível ({type(e).__name__}); usando sincronização periódica.")
+        self._sincronizar_periodicamente()
+
+    def _ouvir_change_stream(self):
+        colecao = self._db_factory().formulario
+        while not self._parar.is_set():
+            opcoes = {"full_document": "updateLookup"}
+            if self._inicio_stream is not None:
+                opcoes["start_at_operation_time"] = self._inicio_stream
+            with colecao.watch(**opcoes) as stream:
+                self._modo = "change_stream"
+                if self._consumir_stream(stream):
+                    return
+            # Coleção removida/renomeada: o stream foi invalidado; reconstrói e abre outro.
+            self._inicio_stream = self._tempo_de_operacao()
+            self.reconstruir()
+
+    def _consumir_stream(self, stream) -> bool:
+        """Aplica os eventos até parar (True) ou o stream ser invalidado (False)."""
+        while not self._parar.is_set():
+            evento = stream.try_next()
+            if evento is None:
+                with self._lock:
+                    self._ultima_sincronizacao = time.time()
+                # Edições que escapem do stream (ex.: catálogo de perguntas) são corrigidas na reconstrução periódica.
+                if time.time() - (self._ultima_reconstrucao or 0) >= GAIA_RESUMO_REBUILD_SEGUNDOS:
+                    try:
+                        self.reconstruir()
+                    except Exception as e:
+                        print(f"[form_summary] Falha ao reconstruir o resumo: {e}")
+                self._parar.wait(1)
+                continue
+            operacao = evento["operationType"]
+            if operacao in ("insert", "update", "replace") and evento.get("fullDocument"):
+                self.aplicar_formulario(evento["fullDocument"])
+            elif operacao == "delete":
+                self.remover_formulario(evento["documentKey"]["_id"])
+            elif operacao in ("drop", "rename", "invalidate"):
+                return False
+        return True
+
+    def _sincronizar_periodicamente(self):
+        self._modo = "periodico"
+        while not self._parar.wait(GAIA_RESUMO_POLL_SEGUNDOS):
+            try:
+                if time.time() - (self._ultima_reconstrucao or 0) >= GAIA_RESUMO_REBUILD_SEGUNDOS:
+                    self.reconstruir()
+                else:
+                    self.sincronizar_delta()
+            except Exception as e:
+                print(f"[form_summary] Falha ao sincronizar o resumo: {e}")
+
+    # ---------- leitura ----------
+
+    def pronto(self) -> bool:
+        return self._ultima_reconstrucao is not None
+
+    def resumo(self) -> dict:
+        """Monta o resumo no mesmo formato de `query_resumo_geral_formularios`, em O(perguntas)."""
+        perguntas = self._catalogo.todas()
+        with self._lock:
+            lista_resumo = []
+            for id_pergunta in sorted(self._contagens, key=lambda k: (type(k).__name__, k)):
+                pergunta_info = perguntas.get(id_pergunta)
+                contagem = self._contagens[id_pergunta]
+                if pergunta_info and contagem:
+                    lista_resumo.append({
+                        "pergunta": pergunta_info["pergunta"],
+                        "categoria": pergunta_info["categoria"],
+                        "respostas": dict(contagem)
+                    })
+            return {
+                "total_formularios_analisados": len(self._contribuicoes),
+                "resumo_por_pergunta": lista_resumo,
+                "snapshot": self.estado(),
+            }
+
+    def estado(self) -> dict:
+        atualizado_em = self._ultima_sincronizacao
+        return {
+            "modo": self._modo,
+            "atualizado_em": datetime.fromtimestamp(atualizado_em).isoformat() if atualizado_em else None,
+            "defasagem_segundos": round(time.time() - atualizado_em, 1) if atualizado_em else None,
+            "ultima_reconstrucao": datetime.fromtimestamp(self._ultima_reconstrucao).isoformat() if self._ultima_reconstrucao else None,
+            "formularios": len(self._contribuicoes),
+        }
+
+
+resumo_formularios = ResumoFormularios()
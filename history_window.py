@@ -0,0 +1,109 @@
+from langchain_core.messages import SystemMessage
+
+# =====================================
+# ESTIMATIVA DE TOKENS
+# =====================================
+
+CARACTERES_POR_TOKEN = 4
+
+def estimar_tokens(texto) -> int:
+    """
+    Estimativa barata (~4 caracteres por token) usada apenas para orçar o histórico;
+    não depende do tokenizer do Gemini.
+    """
+    if not isinstance(texto, str):
+        texto = str(texto)
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+# =====================================
+# JANELA POR CADEIA
+# =====================================
+
+class JanelaHistorico:
+    """
+    Quanto do histórico uma cadeia recebe:
+    - `max_tokens`: orçamento total (resumo + mensagens literais).
+    - `turnos_literais`: últimos K turnos (pergunta + resposta) mantidos na íntegra; None (padrão)
+      leva todos os turnos ainda não resumidos e só o orçamento corta.
+    - `incluir_resumo`: se o resumo dos turnos antigos entra no início da janela.
+
+    Uma janela com resumo deve usar `turnos_literais=None`: com um K fixo, os turnos entre os
+    últimos K e o fim do resumo (`resumo_ate`) não chegariam à cadeia nem na íntegra nem resumidos.
+    """
+
+    __slots__ = ("max_tokens", "turnos_literais", "incluir_resumo")
+
+    def __init__(self, max_tokens: int, turnos_literais: int = None, incluir_resumo: bool = True):
+        self.max_tokens = max_tokens
+        self.turnos_literais = turnos_literais
+        self.incluir_resumo = incluir_resumo
+
+
+def recortar_historico(chat_history, janela: JanelaHistorico, mensagens=None):
+    """
+    Monta o `chat_history` de uma cadeia: resumo da sessão (se houver e couber)
+    seguido dos turnos literais posteriores a ele, descartando os mais antigos até caber no orçamento.
+    """
+    if mensagens is None:
+        mensagens = chat_history.messages
+
+    # Só entram na janela literal as mensagens que ainda não foram resumidas.
+    inicio = max(0, chat_history.resumo_ate - chat_history.descartadas)
+    recentes = mensagens[inicio:]
+    if janela.turnos_literais is not None:
+        recentes = recentes[-2 * janela.turnos_literais:] if janela.turnos_literais else []
+
+    orcamento = janela.max_tokens
+    prefixo = []
+    if janela.incluir_resumo and chat_history.resumo:
+        resumo = SystemMessage(content=f"RESUMO DA CONVERSA ATÉ AQUI:\n{chat_history.resumo}")
+        custo = estimar_tokens(resumo.content)
+        if custo <= orcamento:
+            prefixo = [resumo]
+            orcamento -= custo
+
+    selecionadas = []
+    for mensagem in reversed(recentes):
+        custo = estimar_tokens(mensagem.content)
+        if custo > orcamento:
+            break
+        selecionadas.append(mensagem)
+        orcamento -= custo
+    selecionadas.reverse()
+
+    return prefixo + selecionadas
+
+# =====================================
+# RESUMO INCREMENTAL
+# =====================================
+
+def mensagens_para_resumir(chat_history, manter_turnos: int, passo_turnos: int, mensagens=None):
+    """
+    Retorna (mensagens, novo_resumo_ate) quando há pelo menos `passo_turnos` turnos além
+    dos `manter_turnos` mais recentes ainda fora do resumo; caso contrário retorna None.
+    Assim o resumo só é recalculado quando a janela desliza um passo inteiro.
+    """
+    if mensagens is None:
+        mensagens = chat_history.messages
+
+    total = chat_history.descartadas + len(mensagens)
+    resumo_ate = max(chat_history.resumo_ate, chat_history.descartadas)
+    novo_resumo_ate = total - 2 * manter_turnos
+
+    if novo_resumo_ate - resumo_ate < 2 * passo_turnos:
+        return None
+
+    inicio = resumo_ate - chat_history.descartadas
+    fim = novo_resumo_ate - chat_history.descartadas
+    return mensagens[inicio:fim], novo_resumo_ate
+
+
+def formatar_mensagens(mensagens) -> str:
+    rotulos = {"human": "Usuário", "ai": "Gaia"}
+    return "\n".join(f"{rotulos.get(m.type, m.type)}: {m.content}" for m in mensagens)
+
+
+def aplicar_resumo(chat_history, resumo: str, resumo_ate: int):
+    chat_history.resumo = resumo.strip()
+    chat_history.resumo_ate = resumo_ate
+    chat_history.marcar_alterado()
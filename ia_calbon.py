@@ -1,32 +1,44 @@
 from dotenv import load_dotenv
 import os
+import asyncio
+import contextvars
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, HumanMessagePromptTemplate, AIMessagePromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain.agents import create_tool_calling_agent
 from langchain.agents import AgentExecutor
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.prompts import FewShotChatMessagePromptTemplate
 from tools import TOOLS
+import faq_tool
 from faq_tool import get_faq_context
+from badwords_matcher import compilar_badwords
 from operator import itemgetter
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from concurrency import run_blocking, limite_fluxos
+from session_dispatch import despachante_sessoes
+from call_batching import AgrupadorChamadas
+from admission import controle_admissao
+from llm_resilience import ModeloResiliente, prazo_requisicao, config_prazo_atual, LLMIndisponivel
+from session_store import SessionStore, HistoricoCompacto, criar_backend_sessoes
+from pre_router import PreRoteador
+from response_cache import CacheRespostas
+from local_validator import ValidadorLocal
+from telemetry import medir_etapa, medir_fluxo, instrumentar
+from speculation import especular, estatisticas_especulacao, GAIA_ESPECULAR_ORQUESTRADOR
+from history_window import estimar_tokens, JanelaHistorico, recortar_historico, mensagens_para_resumir, formatar_mensagens, aplicar_resumo
 
 # =====================================
 # BASE
 # =====================================
 
-store = {}
+store = SessionStore(backend=criar_backend_sessoes())
 TZ = ZoneInfo("America/Sao_Paulo")
 today = datetime.now(TZ).date()
 
-def get_session_history(session_id: str) -> ChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
+def get_session_history(session_id: str) -> HistoricoCompacto:
+    return store.get(session_id)
 
 load_dotenv()
 
@@ -34,19 +46,30 @@ load_dotenv()
 # MODELOS LLM
 # =====================================
 
-llm = ChatGoogleGenerativeAI(
+# As retentativas, timeouts e a troca de modelo ficam com o `llm_resilience`,
+# então cada instância do Gemini faz uma única tentativa por chamada.
+gemini_25_flash = ChatGoogleGenerativeAI(
     model="gemini-2.5-flash",
     temperature=0.7,
     top_p=0.95,
+    max_retries=1,
     google_api_key=os.getenv("GEMINI_API_KEY")
 )
 
-llm_fast = ChatGoogleGenerativeAI(
+gemini_20_flash = ChatGoogleGenerativeAI(
     model="gemini-2.0-flash",
     temperature=0,
+    max_retries=1,
     google_api_key=os.getenv("GEMINI_API_KEY")
 )
 
+# `llm` cai para o 2.0-flash quando o 2.5 falha, está com o disjuntor aberto ou o prazo está curto.
+llm = ModeloResiliente(
+    principal=gemini_25_flash, nome="gemini-2.5-flash",
+    reserva=gemini_20_flash, nome_reserva="gemini-2.0-flash"
+)
+llm_fast = ModeloResiliente(principal=gemini_20_flash, nome="gemini-2.0-flash")
+
 # =====================================
 # FUNÇÃO DE BADWORDS
 # =====================================
@@ -60,6 +83,7 @@ def carregar_badwords(caminho="badwords.txt"):
         return []
 
 BAD_WORDS = carregar_badwords()
+BADWORDS_MATCHER = compilar_badwords(BAD_WORDS)
 
 # =====================================
 # PROMPTS
@@ -241,7 +265,7 @@ Você é um Analista de Dados Sênior, especialista em sustentabilidade. Sua mis
 1.  **Análise da Solicitação**: Identifique se a pergunta é sobre um indivíduo (`numero_cracha`) ou coletivo.
 2.  **Seleção e Execução da Ferramenta**:
     - Para análise individual, chame `query_formulario_funcionario`.
-    - Para análise geral/coletiva, chame `query_resumo_geral_formularios`.
+    - Para análise geral/coletiva, chame `query_resumo_geral_formularios`. Se a pergunta citar um período, uma categoria ou uma classificação de emissão, use os filtros opcionais da ferramenta.
 3.  **Análise Crítica do Resultado**: Analise CUIDADOSAMENTE os dados retornados pela ferramenta.
 4.  **Geração do JSON Final**: Com base na sua análise, construa o objeto JSON de saída.
 
@@ -405,152 +429,555 @@ prompt_faq = ChatPromptTemplate.from_messages([
      "Responda com base APENAS no CONTEXTO.")
 ])
 
+# 7. Resumo do Histórico
+
+system_prompt_resumo = ("system",
+"""
+### PAPEL
+Você mantém o resumo de uma conversa entre um usuário e a Gaia, para que os próximos turnos não precisem receber o histórico completo.
+
+### REGRAS
+- Atualize o RESUMO_ATUAL incorporando as NOVAS_MENSAGENS.
+- Preserve fatos úteis para os próximos turnos: números de crachá, dados consultados, metas e preferências do usuário.
+- Escreva em português, em no máximo 5 frases curtas, sem saudações.
+- Responda APENAS com o novo resumo.
+"""
+)
+
+prompt_resumo = ChatPromptTemplate.from_messages([
+    system_prompt_resumo,
+    ("human",
+     "RESUMO_ATUAL:\n{resumo_atual}\n\n"
+     "NOVAS_MENSAGENS:\n{mensagens}")
+])
+
 # =====================================
 # AGENTES E CADEIAS
 # =====================================
 
-# Roteador
-router_chain = RunnableWithMessageHistory(
-    prompt_roteador | llm_fast | StrOutputParser(),
-    get_session_history,
-    input_messages_key="input",
-    history_messages_key="chat_history",
-)
+# As cadeias não escrevem no histórico: elas recebem `chat_history` já pronto na entrada
+# e apenas `executar_fluxo_gaia` grava a pergunta e a resposta final, uma vez por turno.
+
+# Roteador (com pré-roteador determinístico para os casos óbvios)
+pre_roteador = PreRoteador()
+router_chain = instrumentar(prompt_roteador | llm_fast | StrOutputParser(), "roteador")
 
 # Especialista Carbono
-carbono_chain = RunnableWithMessageHistory(
-    prompt_carbono | llm_fast | StrOutputParser(),
-    get_session_history,
-    input_messages_key="input",
-    history_messages_key="chat_history",
-)
+carbono_chain = instrumentar(prompt_carbono | llm_fast | StrOutputParser(), "carbono")
 
 # Agente Diagnóstico
 diag_agente = create_tool_calling_agent(llm, TOOLS, prompt_diag)
 diag_exec = AgentExecutor(agent=diag_agente, tools=TOOLS, verbose=True)
-diag_chain = RunnableWithMessageHistory(
-    diag_exec,
-    get_session_history,
-    input_messages_key="input",
-    history_messages_key="chat_history",
-)
+diag_chain = instrumentar(diag_exec, "diagnostico")
 
 # Orquestrador 
-orquestrador_chain = RunnableWithMessageHistory(
-    prompt_orq | llm_fast | StrOutputParser(),
-    get_session_history,
-    input_messages_key="input",
-    history_messages_key="chat_history",
-)
+orquestrador_chain = instrumentar(prompt_orq | llm_fast | StrOutputParser(), "orquestrador")
 
-# Juiz
-juiz_chain = (
+# Juiz (precedido pela validação local de formato e toxicidade)
+validador_local = ValidadorLocal(BADWORDS_MATCHER)
+juiz_chain = instrumentar(
     prompt_juiz
     | llm_fast 
-    | StrOutputParser()
+    | StrOutputParser(),
+    "juiz"
 )
 
+# Nos lotes de /chat/batch, as chamadas ao roteador e ao juiz dos itens em andamento
+# são agrupadas em `abatch` (ver `executar_lote_gaia_async`).
+GAIA_LOTE_MAX_CONCORRENCIA = int(os.getenv("GAIA_LOTE_MAX_CONCORRENCIA", "16"))
+GAIA_LOTE_MAX_ITENS = int(os.getenv("GAIA_LOTE_MAX_ITENS", "1000"))
+_agrupar_chamadas = contextvars.ContextVar("gaia_agrupar_chamadas", default=False)
+roteador_agrupado = AgrupadorChamadas(router_chain, "roteador", config_da_chamada=config_prazo_atual)
+juiz_agrupado = AgrupadorChamadas(juiz_chain, "juiz", config_da_chamada=config_prazo_atual)
+
 # FAQ
-faq_chain = (
+def _faq_context(x):
+    with medir_etapa("faq_recuperacao"):
+        return get_faq_context(x["input"])
+
+async def _afaq_context(x):
+    return await run_blocking(_faq_context, x)
+
+faq_chain = instrumentar(
     RunnablePassthrough.assign(
         question=itemgetter("input"),
-        context=lambda x: get_faq_context(x["input"])
+        context=RunnableLambda(_faq_context, afunc=_afaq_context)
     )
     | prompt_faq
     | llm_fast
-    | StrOutputParser()
+    | StrOutputParser(),
+    "faq"
 )
 
+# Cache de respostas (carbono e FAQ; nunca diagnóstico)
+cache_respostas = CacheRespostas(embeddings=getattr(faq_tool, "embeddings_model", None))
+
+# Resumo do histórico
+resumo_chain = instrumentar(prompt_resumo | llm_fast | StrOutputParser(), "resumo_historico")
+
+# =====================================
+# JANELAS DE HISTÓRICO
+# =====================================
+
+# Quanto do histórico cada cadeia recebe. O roteador só precisa do contexto imediato (e não
+# recebe o resumo). As demais recebem o resumo e todos os turnos posteriores a ele, cortados
+# só pelo orçamento de tokens, para que nenhum turno fique de fora dos dois.
+JANELAS_HISTORICO = {
+    "roteador": JanelaHistorico(max_tokens=400, turnos_literais=2, incluir_resumo=False),
+    "carbono": JanelaHistorico(max_tokens=1200),
+    "diagnostico": JanelaHistorico(max_tokens=3000),
+    "orquestrador": JanelaHistorico(max_tokens=1200),
+}
+
+# Os turnos mais antigos que isso entram no resumo, em blocos de PASSO_RESUMO_TURNOS
+# para que o resumo não seja recalculado a cada turno. Seis turnos literais cobrem os
+# crachás e dados que o agente de diagnóstico costuma precisar de volta.
+TURNOS_ANTES_DO_RESUMO = 6
+PASSO_RESUMO_TURNOS = 4
+
+
+def _janelas(chat_history):
+    mensagens = chat_history.messages
+    return {
+        nome: recortar_historico(chat_history, janela, mensagens)
+        for nome, janela in JANELAS_HISTORICO.items()
+    }
+
+
+def preparar_historico(chat_history):
+    """Atualiza o resumo da sessão, se a janela deslizou, e monta o histórico de cada cadeia."""
+    pendente = mensagens_para_resumir(chat_history, TURNOS_ANTES_DO_RESUMO, PASSO_RESUMO_TURNOS)
+    if pendente:
+        mensagens, resumo_ate = pendente
+        try:
+            resumo = resumo_chain.invoke({
+                "resumo_atual": chat_history.resumo or "(vazio)",
+                "mensagens": formatar_mensagens(mensagens)
+            })
+            aplicar_resumo(chat_history, resumo, resumo_ate)
+        except Exception as e:
+            print(f"[ia_calbon] Falha ao atualizar o resumo do histórico: {e}")
+    return _janelas(chat_history)
+
+
+async def apreparar_historico(chat_history):
+    pendente = mensagens_para_resumir(chat_history, TURNOS_ANTES_DO_RESUMO, PASSO_RESUMO_TURNOS)
+    if pendente:
+        mensagens, resumo_ate = pendente
+        try:
+            resumo = await resumo_chain.ainvoke({
+                "resumo_atual": chat_history.resumo or "(vazio)",
+                "mensagens": formatar_mensagens(mensagens)
+            })
+            aplicar_resumo(chat_history, resumo, resumo_ate)
+        except Exception as e:
+            print(f"[ia_calbon] Falha ao atualizar o resumo do histórico: {e}")
+    return _janelas(chat_history)
+
 # =====================================
 # EXECUÇÃO DO FLUXO
 # =====================================
 
-def executar_fluxo_gaia(pergunta_usuario: str, session_id: str):
-    if any(word in pergunta_usuario.lower() for word in BAD_WORDS):
-        return "Por favor, vamos manter a conversa respeitosa e focada em sustentabilidade. 🌿"
+RESPOSTA_BADWORD = "Por favor, vamos manter a conversa respeitosa e focada em sustentabilidade. 🌿"
+RESPOSTA_FAQ_VAZIA = "Desculpe, não encontrei essa informação no nosso FAQ. 🌿"
+RESPOSTA_FORA_DE_ESCOPO = "Sou a Gaia e meu dever é ajudar com sustentabilidade. Como posso te ajudar com isso? 🌿"
+JSON_ERRO_DIAGNOSTICO = '{ "dominio": "diagnostico", "intencao": "erro", "resposta": "Ocorreu um erro interno na ferramenta.", "recomendacao": "Tente novamente mais tarde." }'
 
-    config = {"configurable": {"session_id": session_id}}
-    chat_history = get_session_history(session_id)
+RESPOSTAS_REPROVACAO = {
+    "REPROVADO_RELEVANCIA": "Eu preparei uma resposta, mas notei que ela saiu um pouco do tópico. Você poderia, por favor, reformular sua pergunta? 💡",
+    "REPROVADO_ALUCINACAO": "Hmm, não consegui encontrar os dados exatos para sua solicitação nos meus registros. Por favor, verifique sua pergunta (como o número do crachá) e tente novamente. 🌿",
+    "REPROVADO_TOXICIDADE": "Ops! A resposta que eu ia te dar não seguiu nossas diretrizes de comunidade. Por favor, tente perguntar de outra forma.",
+    "REPROVADO_FORMATO": "Tive um problema técnico ao gerar sua resposta (erro de formato). Por favor, tente novamente.",
+}
+RESPOSTA_REPROVACAO_PADRAO = "Não consegui processar sua solicitação com segurança no momento. Por favor, tente reformular sua pergunta. 💡"
 
-    resposta_roteador = router_chain.invoke({"input": pergunta_usuario}, config=config).strip()
 
-    resposta_final = "" 
+def interpretar_roteamento(resposta_roteador: str, pergunta_usuario: str):
+    """
+    Lê o PROTOCOLO DE ENCAMINHAMENTO do roteador e retorna (rota, pergunta para o especialista).
+    """
+    route_info = {}
+    for line in resposta_roteador.split("\n"):
+        if "=" in line:
+            partes = line.split("=", 1)
+            if len(partes) == 2:
+                route_info[partes[0].strip()] = partes[1].strip()
 
-    if not resposta_roteador.startswith("ROUTE="):
-        resposta_final = resposta_roteador
-    
-    else:
-        
-        route_info = {}
-        for line in resposta_roteador.split("\n"):
-            if "=" in line:
-                partes = line.split("=", 1)
-                if len(partes) == 2:
-                    route_info[partes[0].strip()] = partes[1].strip()
+    route = route_info.get("ROUTE", "fora_de_escopo")
+    especialista_input = route_info.get("PERGUNTA_ORIGINAL", pergunta_usuario)
+    return route, especialista_input
 
-        route = route_info.get("ROUTE", "fora_de_escopo")
 
-        especialista_input = route_info.get("PERGUNTA_ORIGINAL", pergunta_usuario)
+def resposta_reprovacao(validacao_juiz: str) -> str:
+    return RESPOSTAS_REPROVACAO.get(validacao_juiz, RESPOSTA_REPROVACAO_PADRAO)
 
-        json_especialista = "" 
+
+def executar_fluxo_gaia(pergunta_usuario: str, session_id: str):
+    with medir_fluxo() as rastro, prazo_requisicao():
+        with medir_etapa("pre_filtro"):
+            contem_badword = BADWORDS_MATCHER.contem(pergunta_usuario)
+        chat_history = get_session_history(session_id)
+        if contem_badword:
+            rastro.rota = "bloqueada"
+            chat_history.add_user_message(pergunta_usuario)
+            chat_history.add_ai_message(RESPOSTA_BADWORD)
+            return RESPOSTA_BADWORD
+
+        with medir_etapa("historico"):
+            historico = preparar_historico(chat_history)
+
+        with medir_etapa("pre_roteador"):
+            resposta_roteador = pre_roteador.rotear(pergunta_usuario, PERSONA_SISTEMA_GAIA)
+        if resposta_roteador is None:
+            with medir_etapa("roteador"):
+                resposta_roteador = router_chain.invoke({"input": pergunta_usuario, "chat_history": historico["roteador"]}).strip()
+
+        resposta_final = "" 
+
+        if not resposta_roteador.startswith("ROUTE="):
+            rastro.rota = "direta"
+            resposta_final = resposta_roteador
         
-        if route == "carbono":
-            json_especialista = carbono_chain.invoke(
-                {"input": especialista_input},
-                config=config
-            )
-
-        elif route == "diagnostico":
-            try:
-                resposta_agente = diag_chain.invoke(
-                    {"input": especialista_input},
-                    config=config
-                )
-                json_especialista = resposta_agente.get('output', str(resposta_agente))
-            except Exception as e:
-                json_especialista = '{ "dominio": "diagnostico", "intencao": "erro", "resposta": "Ocorreu um erro interno na ferramenta.", "recomendacao": "Tente novamente mais tarde." }'
+        else:
             
-        elif route == "faq":
+            route, especialista_input = interpretar_roteamento(resposta_roteador, pergunta_usuario)
+            rastro.rota = route
 
-            resposta_final = faq_chain.invoke(
-                {"input": especialista_input}
-            )
+            json_especialista = "" 
+            json_em_cache = False
+            
+            if route == "carbono":
+                with medir_etapa("cache"):
+                    json_especialista = cache_respostas.buscar("carbono", especialista_input)
+                json_em_cache = json_especialista is not None
+                if not json_em_cache:
+                    with medir_etapa("carbono"):
+                        json_especialista = carbono_chain.invoke(
+                            {"input": especialista_input, "chat_history": historico["carbono"]}
+                        )
+
+            elif route == "diagnostico":
+                try:
+                    with medir_etapa("diagnostico"):
+                        resposta_agente = diag_chain.invoke(
+                            {"input": especialista_input, "chat_history": historico["diagnostico"]}
+                        )
+                    json_especialista = resposta_agente.get('output', str(resposta_agente))
+                except Exception as e:
+                    json_especialista = JSON_ERRO_DIAGNOSTICO
+                
+            elif route == "faq":
 
-            if not resposta_final or not resposta_final.strip():
-                 resposta_final = "Desculpe, não encontrei essa informação no nosso FAQ. 🌿"
+                with medir_etapa("cache"):
+                    resposta_final = cache_respostas.buscar("faq", especialista_input)
+                if resposta_final is None:
+                    with medir_etapa("faq"):
+                        resposta_final = faq_chain.invoke(
+                            {"input": especialista_input}
+                        )
+                    if resposta_final and resposta_final.strip() not in ("", RESPOSTA_FAQ_VAZIA):
+                        cache_respostas.guardar("faq", especialista_input, resposta_final)
 
-        else:
-            resposta_final = "Sou a Gaia e meu dever é ajudar com sustentabilidade. Como posso te ajudar com isso? 🌿"
+                if not resposta_final or not resposta_final.strip():
+                     resposta_final = RESPOSTA_FAQ_VAZIA
 
-        if json_especialista and not resposta_final:
-            
-            validacao_juiz = juiz_chain.invoke({
-                "pergunta": especialista_input,
-                "json_output": json_especialista
-            }).strip()
-            
-            if validacao_juiz == "APROVADO":
-                resposta_final = orquestrador_chain.invoke(
-                    {"input": json_especialista},
-                    config=config
-                )
             else:
+                resposta_final = RESPOSTA_FORA_DE_ESCOPO
+
+            if json_especialista and not resposta_final:
+                
+                if json_em_cache:
+                    validacao_juiz = "APROVADO"
+                else:
+                    with medir_etapa("validacao_local"):
+                        validacao_local = validador_local.validar(json_especialista, route)
+                    json_especialista = validacao_local.json
+                    validacao_juiz = validacao_local.veredito
+                    if validacao_juiz is None:
+                        with medir_etapa("juiz"):
+                            validacao_juiz = juiz_chain.invoke({
+                                "pergunta": especialista_input,
+                                "json_output": json_especialista
+                            }).strip()
+                rastro.veredito = validacao_juiz
                 
-                if validacao_juiz == "REPROVADO_RELEVANCIA":
-                    resposta_final = "Eu preparei uma resposta, mas notei que ela saiu um pouco do tópico. Você poderia, por favor, reformular sua pergunta? 💡"
-                elif validacao_juiz == "REPROVADO_ALUCINACAO":
-                    resposta_final = "Hmm, não consegui encontrar os dados exatos para sua solicitação nos meus registros. Por favor, verifique sua pergunta (como o número do crachá) e tente novamente. 🌿"
-                elif validacao_juiz == "REPROVADO_TOXICIDADE":
-                    resposta_final = "Ops! A resposta que eu ia te dar não seguiu nossas diretrizes de comunidade. Por favor, tente perguntar de outra forma."
-                elif validacao_juiz == "REPROVADO_FORMATO":
-                    resposta_final = "Tive um problema técnico ao gerar sua resposta (erro de formato). Por favor, tente novamente."
+                if validacao_juiz == "APROVADO":
+                    if route == "carbono" and not json_em_cache:
+                        cache_respostas.guardar("carbono", especialista_input, json_especialista)
+                    with medir_etapa("orquestrador"):
+                        resposta_final = orquestrador_chain.invoke(
+                            {"input": json_especialista, "chat_history": historico["orquestrador"]}
+                        )
                 else:
-                    resposta_final = "Não consegui processar sua solicitação com segurança no momento. Por favor, tente reformular sua pergunta. 💡"
+                    resposta_final = resposta_reprovacao(validacao_juiz)
+
+        chat_history.add_user_message(pergunta_usuario)
+        chat_history.add_ai_message(resposta_final)
+        
+        return resposta_final
+
+
+def _evento_etapa(etapa: str, **dados):
+    return {"tipo": "etapa", "etapa": etapa, **dados}
+
+
+async def _gerar_texto(chain, entrada, transmitir: bool):
+    """Produz o texto da cadeia em pedaços (astream) ou de uma vez (ainvoke)."""
+    if transmitir:
+        async for pedaco in chain.astream(entrada):
+            if pedaco:
+                yield pedaco
+    else:
+        yield await chain.ainvoke(entrada)
+
+
+async def _gerar_texto_medido(etapa: str, chain, entrada, transmitir: bool):
+    """`_gerar_texto` medido como uma etapa (inclui o tempo de consumo de cada pedaço)."""
+    with medir_etapa(etapa):
+        async for pedaco in _gerar_texto(chain, entrada, transmitir):
+            yield pedaco
+
 
-    chat_history.add_user_message(pergunta_usuario)
-    chat_history.add_ai_message(resposta_final)
-    
-    return resposta_final
+async def _rotear(entrada_roteador):
+    chain = roteador_agrupado if _agrupar_chamadas.get() else router_chain
+    return (await chain.ainvoke(entrada_roteador)).strip()
+
+
+async def _validar(entrada_juiz):
+    chain = juiz_agrupado if _agrupar_chamadas.get() else juiz_chain
+    with medir_etapa("juiz"):
+        return (await chain.ainvoke(entrada_juiz)).strip()
+
+
+async def _validar_e_orquestrar(entrada_juiz, entrada_orquestrador, veredito_previo, transmitir: bool):
+    """
+    Gera ("veredito", ...) e, se aprovado, ("pedaco", ...) com a resposta do orquestrador.
+    `veredito_previo` é o veredito já decidido sem o juiz LLM (cache ou validação local), ou None.
+    Com GAIA_ESPECULAR_ORQUESTRADOR=1, juiz e orquestrador rodam em paralelo e a saída
+    do orquestrador só é liberada depois da aprovação.
+    """
+    if GAIA_ESPECULAR_ORQUESTRADOR and veredito_previo is None:
+        tokens_entrada = estimar_tokens(entrada_orquestrador["input"]) + sum(
+            estimar_tokens(m.content) for m in entrada_orquestrador["chat_history"]
+        )
+        async for item in especular(
+            lambda: _validar(entrada_juiz),
+            lambda: _gerar_texto_medido("orquestrador", orquestrador_chain, entrada_orquestrador, transmitir),
+            estatisticas_especulacao,
+            tokens_entrada
+        ):
+            yield item
+        return
+
+    veredito = veredito_previo if veredito_previo is not None else await _validar(entrada_juiz)
+    yield ("veredito", veredito)
+    if veredito == "APROVADO":
+        async for pedaco in _gerar_texto_medido("orquestrador", orquestrador_chain, entrada_orquestrador, transmitir):
+            yield ("pedaco", pedaco)
+
+
+async def fluxo_gaia_eventos(pergunta_usuario: str, session_id: str, transmitir: bool = True):
+    """
+    Versão assíncrona do fluxo da Gaia como um gerador de eventos:
+    - {"tipo": "etapa", "etapa": ...} ao fim de cada etapa (roteamento, consulta de dados, validação);
+    - {"tipo": "token", "conteudo": ...} com a resposta final em pedaços (orquestrador ou FAQ via `astream`);
+    - {"tipo": "fim", "resposta": ...} com a resposta completa, depois de gravada no histórico.
+    Com `transmitir=False` as cadeias usam `ainvoke` e a resposta sai em um único evento "token".
+    Fluxos da mesma sessão rodam um de cada vez (ver `session_dispatch`).
+    """
+    async with despachante_sessoes.sessao(session_id):
+        async for evento in _fluxo_gaia_eventos(pergunta_usuario, session_id, transmitir):
+            yield evento
+
+
+async def _fluxo_gaia_eventos(pergunta_usuario: str, session_id: str, transmitir: bool):
+    with medir_fluxo() as rastro, prazo_requisicao():
+        with medir_etapa("pre_filtro"):
+            contem_badword = BADWORDS_MATCHER.contem(pergunta_usuario)
+        if store.backend is not None:
+            # Revalidar a sessão no backend é I/O; sai do event loop.
+            chat_history = await run_blocking(get_session_history, session_id)
+        else:
+            chat_history = get_session_history(session_id)
+        if contem_badword:
+            rastro.rota = "bloqueada"
+            chat_history.add_user_message(pergunta_usuario)
+            chat_history.add_ai_message(RESPOSTA_BADWORD)
+            yield {"tipo": "token", "conteudo": RESPOSTA_BADWORD}
+            yield {"tipo": "fim", "resposta": RESPOSTA_BADWORD}
+            return
+
+        async with limite_fluxos:
+            with medir_etapa("historico"):
+                historico = await apreparar_historico(chat_history)
+
+            with medir_etapa("pre_roteador"):
+                resposta_roteador = pre_roteador.rotear(pergunta_usuario, PERSONA_SISTEMA_GAIA)
+            if resposta_roteador is None:
+                with medir_etapa("roteador"):
+                    resposta_roteador = await _rotear({"input": pergunta_usuario, "chat_history": historico["roteador"]})
+
+            resposta_final = ""
+
+            if not resposta_roteador.startswith("ROUTE="):
+                rastro.rota = "direta"
+                yield _evento_etapa("roteamento", rota="direta")
+                resposta_final = resposta_roteador
+                yield {"tipo": "token", "conteudo": resposta_final}
+
+            else:
+
+                route, especialista_input = interpretar_roteamento(resposta_roteador, pergunta_usuario)
+                rastro.rota = route
+                yield _evento_etapa("roteamento", rota=route)
+
+                json_especialista = ""
+                json_em_cache = False
+
+                if route == "carbono":
+                    with medir_etapa("cache"):
+                        json_especialista = await cache_respostas.abuscar("carbono", especialista_input)
+                    json_em_cache = json_especialista is not None
+                    if not json_em_cache:
+                        with medir_etapa("carbono"):
+                            json_especialista = await carbono_chain.ainvoke(
+                                {"input": especialista_input, "chat_history": historico["carbono"]}
+                            )
+                    yield _evento_etapa("especialista", em_cache=json_em_cache)
+
+                elif route == "diagnostico":
+                    try:
+                        with medir_etapa("diagnostico"):
+                            resposta_agente = await diag_chain.ainvoke(
+                                {"input": especialista_input, "chat_history": historico["diagnostico"]}
+                            )
+                        json_especialista = resposta_agente.get('output', str(resposta_agente))
+                    except Exception as e:
+                        json_especialista = JSON_ERRO_DIAGNOSTICO
+                    yield _evento_etapa("consulta_dados")
+
+                elif route == "faq":
+
+                    with medir_etapa("cache"):
+                        resposta_final = await cache_respostas.abuscar("faq", especialista_input)
+                    if resposta_final is not None:
+                        yield {"tipo": "token", "conteudo": resposta_final}
+                    else:
+                        resposta_final = ""
+                        async for pedaco in _gerar_texto_medido("faq", faq_chain, {"input": especialista_input}, transmitir):
+                            resposta_final += pedaco
+                            yield {"tipo": "token", "conteudo": pedaco}
+                        if resposta_final.strip() not in ("", RESPOSTA_FAQ_VAZIA):
+                            cache_respostas.guardar("faq", especialista_input, resposta_final)
+
+                    if not resposta_final or not resposta_final.strip():
+                        resposta_final = RESPOSTA_FAQ_VAZIA
+                        yield {"tipo": "token", "conteudo": resposta_final}
+
+                else:
+                    resposta_final = RESPOSTA_FORA_DE_ESCOPO
+                    yield {"tipo": "token", "conteudo": resposta_final}
+
+                if json_especialista and not resposta_final:
+
+                    veredito_previo = "APROVADO" if json_em_cache else None
+                    if not json_em_cache:
+                        with medir_etapa("validacao_local"):
+                            validacao_local = validador_local.validar(json_especialista, route)
+                        json_especialista = validacao_local.json
+                        veredito_previo = validacao_local.veredito
+
+                    entrada_juiz = {"pergunta": especialista_input, "json_output": json_especialista}
+                    entrada_orquestrador = {"input": json_especialista, "chat_history": historico["orquestrador"]}
+
+                    async for tipo, valor in _validar_e_orquestrar(entrada_juiz, entrada_orquestrador, veredito_previo, transmitir):
+                        if tipo == "veredito":
+                            validacao_juiz = valor
+                            rastro.veredito = validacao_juiz
+                            yield _evento_etapa("validacao", veredito=validacao_juiz)
+                            if validacao_juiz == "APROVADO":
+                                if route == "carbono" and not json_em_cache:
+                                    cache_respostas.guardar("carbono", especialista_input, json_especialista)
+                            else:
+                                resposta_final = resposta_reprovacao(validacao_juiz)
+                                yield {"tipo": "token", "conteudo": resposta_final}
+                        else:
+                            resposta_final += valor
+                            yield {"tipo": "token", "conteudo": valor}
+
+            chat_history.add_user_message(pergunta_usuario)
+            chat_history.add_ai_message(resposta_final)
+
+    yield {"tipo": "fim", "resposta": resposta_final}
+
+
+async def executar_fluxo_gaia_async(pergunta_usuario: str, session_id: str):
+    """
+    Mesmo fluxo de `executar_fluxo_gaia`, mas usando `ainvoke` em todas as cadeias.
+    As ferramentas síncronas (pymongo, Atlas) rodam no pool limitado de `concurrency`
+    e o número de fluxos simultâneos é limitado por GAIA_MAX_CONCURRENCY.
+    Requisições da mesma sessão são serializadas e as idênticas em andamento, coalescidas.
+    """
+    async def executar():
+        resposta_final = ""
+        async for evento in _fluxo_gaia_eventos(pergunta_usuario, session_id, transmitir=False):
+            if evento["tipo"] == "fim":
+                resposta_final = evento["resposta"]
+        return resposta_final
+
+    return await despachante_sessoes.executar(session_id, pergunta_usuario, executar)
+
+
+async def _executar_item_lote(indice: int, session_id: str, pergunta_usuario: str):
+    """Um item do lote: nunca levanta exceção, o erro volta no próprio resultado."""
+    _agrupar_chamadas.set(True)  # vale só para esta tarefa (cada uma tem sua cópia do contexto)
+    item = {"index": indice, "session_id": session_id}
+    if not pergunta_usuario or not pergunta_usuario.strip() or not session_id or not session_id.strip():
+        return {**item, "status": 400, "detail": "Os campos 'question' e 'session_id' não podem estar vazios."}
+    ingresso = await controle_admissao.entrar_lote()
+    try:
+        return {**item, "status": 200, "answer": await executar_fluxo_gaia_async(pergunta_usuario, session_id)}
+    except LLMIndisponivel as e:
+        print(f"[LOTE] Item {indice} (session_id {session_id}): {e}")
+        return {
+            **item, "status": 503,
+            "detail": "A Gaia está instável no momento. Tente novamente em instantes.",
+            "retry_after": max(1, round(e.tentar_apos_s)),
+        }
+    except Exception as e:
+        print(f"[LOTE] Item {indice} (session_id {session_id}) falhou: {e}")
+        return {**item, "status": 500, "detail": "Ocorreu um erro interno ao processar esta pergunta."}
+    finally:
+        ingresso.liberar()
+
+
+async def executar_lote_gaia_async(itens, concorrencia: int = GAIA_LOTE_MAX_CONCORRENCIA):
+    """
+    Roda vários (session_id, pergunta) pelo fluxo assíncrono com no máximo `concorrencia`
+    itens em andamento e gera os resultados na ordem em que terminam, cada um com o `index`
+    do item na entrada. Cada item pede uma vaga de lote ao `controle_admissao` (atrás das
+    requisições interativas e limitada a GAIA_ADMISSAO_MAX_LOTE no processo todo, somando os
+    lotes simultâneos). As chamadas ao roteador e ao juiz dos itens em andamento vão juntas
+    num `abatch` (`AgrupadorChamadas`). Uma falha vira o resultado do item (status 400/500/503)
+    sem afetar os demais; se quem consome o gerador desistir, os itens em andamento são cancelados.
+    """
+    concorrencia = max(1, min(concorrencia, GAIA_LOTE_MAX_CONCORRENCIA))
+    pendentes = iter(enumerate(itens))
+    em_andamento = set()
+    try:
+        while True:
+            for indice, (session_id, pergunta_usuario) in pendentes:
+                em_andamento.add(asyncio.ensure_future(_executar_item_lote(indice, session_id, pergunta_usuario)))
+                if len(em_andamento) >= concorrencia:
+                    break
+            if not em_andamento:
+                return
+            prontos, em_andamento = await asyncio.wait(em_andamento, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in prontos:
+                yield tarefa.result()
+    finally:
+        for tarefa in em_andamento:
+            tarefa.cancel()
 
 # =====================================
 # LOOP INTERATIVO
@@ -0,0 +1,652 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque, Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TimeoutFuturo
+from typing import Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from telemetry import registro, Contador, Histograma, Medidor
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+# Orçamento total de LLM de uma requisição, dividido entre as etapas do fluxo.
+GAIA_LLM_PRAZO_S = float(os.getenv("GAIA_LLM_PRAZO_S", "30"))
+# Tempo máximo de cada chamada, por etapa (limitado também pelo que resta do prazo).
+GAIA_LLM_TIMEOUTS = os.getenv(
+    "GAIA_LLM_TIMEOUTS",
+    "roteador=5,carbono=12,diagnostico=15,juiz=6,orquestrador=12,faq=10,resumo_historico=8"
+)
+GAIA_LLM_TIMEOUT_PADRAO_S = float(os.getenv("GAIA_LLM_TIMEOUT_PADRAO_S", "10"))
+# Parte do prazo que as etapas intermediárias deixam livre para a etapa que gera a resposta final.
+GAIA_LLM_RESERVA_FINAL_S = float(os.getenv("GAIA_LLM_RESERVA_FINAL_S", "4"))
+
+GAIA_LLM_TENTATIVAS = int(os.getenv("GAIA_LLM_TENTATIVAS", "3"))
+GAIA_LLM_BACKOFF_S = float(os.getenv("GAIA_LLM_BACKOFF_S", "0.25"))
+
+# Disjuntor por modelo: abre depois de N falhas transitórias seguidas e tenta de novo após a espera.
+GAIA_LLM_CB_FALHAS = int(os.getenv("GAIA_LLM_CB_FALHAS", "5"))
+GAIA_LLM_CB_ESPERA_S = float(os.getenv("GAIA_LLM_CB_ESPERA_S", "30"))
+
+# Hedging: se a chamada passar do percentil de latência observado, dispara uma cópia e fica com a primeira.
+GAIA_LLM_HEDGE = os.getenv("GAIA_LLM_HEDGE", "0") == "1"
+GAIA_LLM_HEDGE_PERCENTIL = float(os.getenv("GAIA_LLM_HEDGE_PERCENTIL", "95"))
+GAIA_LLM_HEDGE_MIN_AMOSTRAS = int(os.getenv("GAIA_LLM_HEDGE_MIN_AMOSTRAS", "20"))
+
+# Com menos que isso de orçamento (ou menos que o p95 observado), o modelo principal cede a vez ao reserva.
+GAIA_LLM_FALLBACK_ORCAMENTO_S = float(os.getenv("GAIA_LLM_FALLBACK_ORCAMENTO_S", "4"))
+
+ETAPAS_FINAIS = {"orquestrador", "faq"}
+
+# Nomes das exceções do google-api-core / httpx que valem nova tentativa.
+ERROS_TRANSITORIOS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "BadGateway", "ConnectError", "ReadTimeout",
+    "RemoteProtocolError",
+}
+
+
+def _ler_timeouts(texto: str) -> dict:
+    timeouts = {}
+    for parte in filter(None, texto.split(",")):
+        etapa, segundos = parte.split("=")
+        timeouts[etapa.strip()] = float(segundos)
+    return timeouts
+
+
+TIMEOUTS_ETAPA = _ler_timeouts(GAIA_LLM_TIMEOUTS)
+
+chamadas_llm = registro.registrar(Contador(
+    "gaia_llm_chamadas_total", "Tentativas de chamada aos modelos, por resultado.", ("modelo", "etapa", "resultado")
+))
+latencia_llm = registro.registrar(Histograma(
+    "gaia_llm_latencia_segundos", "Latência das chamadas bem-sucedidas aos modelos.", ("modelo", "etapa")
+))
+hedges_llm = registro.registrar(Contador(
+    "gaia_llm_hedges_total", "Chamadas duplicadas pelo hedging, por qual delas respondeu primeiro.", ("modelo", "etapa", "vencedora")
+))
+fallbacks_llm = registro.registrar(Contador(
+    "gaia_llm_fallbacks_total", "Chamadas desviadas para o modelo reserva, por motivo.", ("etapa", "motivo")
+))
+estado_circuito = registro.registrar(Medidor(
+    "gaia_llm_circuito_estado", "Estado do disjuntor de cada modelo (0 fechado, 1 meio aberto, 2 aberto).", ("modelo",)
+))
+
+
+class LLMIndisponivel(Exception):
+    """O modelo (e o reserva) não respondeu dentro do prazo, com o disjuntor aberto ou depois das retentativas."""
+
+    def __init__(self, mensagem, tentar_apos_s: float = 5.0):
+        super().__init__(mensagem)
+        self.tentar_apos_s = tentar_apos_s
+
+
+class _CircuitoAberto(Exception):
+    def __init__(self, nome):
+        super().__init__(f"Disjuntor do modelo {nome} aberto.")
+        self.nome = nome
+
+
+def erro_transitorio(erro: BaseException) -> bool:
+    """
+    Olha o erro e as causas encadeadas (`raise ... from`): o `ChatGoogleGenerativeAIError`
+    do langchain-google-genai embrulha o 400 InvalidArgument, que não adianta repetir.
+    """
+    while erro is not None:
+        if isinstance(erro, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+            return True
+        if getattr(erro, "code", None) in (429, 500, 502, 503, 504):
+            return True
+        if any(classe.__name__ in ERROS_TRANSITORIOS for classe in type(erro).__mro__):
+            return True
+        erro = erro.__cause__
+    return False
+
+# =====================================
+# PRAZO DA REQUISIÇÃO
+# =====================================
+
+class Prazo:
+    __slots__ = ("limite",)
+
+    def __init__(self, segundos: float):
+        self.limite = time.monotonic() + segundos
+
+    def restante(self) -> float:
+        return self.limite - time.monotonic()
+
+    @classmethod
+    def ate(cls, limite: float):
+        prazo = cls(0.0)
+        prazo.limite = limite
+        return prazo
+
+
+_prazo_atual = contextvars.ContextVar("gaia_prazo_llm", default=None)
+
+
+@contextmanager
+def prazo_requisicao(segundos: float = GAIA_LLM_PRAZO_S):
+    """Define o prazo das chamadas de LLM feitas dentro do bloco (herdado por tarefas e pelo pool)."""
+    prazo = Prazo(segundos)
+    token = _prazo_atual.set(prazo)
+    try:
+        yield prazo
+    finally:
+        _prazo_atual.reset(token)
+
+
+def config_prazo_atual() -> dict:
+    """
+    Config do LangChain que leva o prazo da requisição atual no metadado "prazo_limite",
+    para chamadas que rodam fora do contexto dela (ex.: o `abatch` do `call_batching`).
+    """
+    prazo = _prazo_atual.get()
+    return {"metadata": {"prazo_limite": prazo.limite}} if prazo is not None else {}
+
+
+@contextmanager
+def _prazo_dos_metadados(run_manager):
+    """Aplica o prazo vindo em `config_prazo_atual` (se houver) durante a chamada."""
+    limite = (getattr(run_manager, "metadata", None) or {}).get("prazo_limite")
+    if limite is None:
+        yield
+        return
+    token = _prazo_atual.set(Prazo.ate(limite))
+    try:
+        yield
+    finally:
+        _prazo_atual.reset(token)
+
+
+def tempo_para_etapa(etapa: str) -> float:
+    """Timeout de uma chamada: o da etapa, limitado ao prazo restante (menos a reserva da etapa final)."""
+    timeout = TIMEOUTS_ETAPA.get(etapa, GAIA_LLM_TIMEOUT_PADRAO_S)
+    prazo = _prazo_atual.get()
+    if prazo is None:
+        return timeout
+    restante = prazo.restante()
+    if etapa not in ETAPAS_FINAIS:
+        restante -= GAIA_LLM_RESERVA_FINAL_S
+    return min(timeout, restante)
+
+# =====================================
+# DISJUNTOR E LATÊNCIAS
+# =====================================
+
+class Disjuntor:
+    """Circuit breaker simples: fechado → aberto (após falhas seguidas) → meio aberto (uma chamada de teste)."""
+
+    FECHADO, MEIO_ABERTO, ABERTO = 0, 1, 2
+
+    def __init__(self, nome, max_falhas=GAIA_LLM_CB_FALHAS, espera_s=GAIA_LLM_CB_ESPERA_S):
+        self.nome = nome
+        self.max_falhas = max_falhas
+        self.espera_s = espera_s
+        self.estado = self.FECHADO
+        self.falhas_seguidas = 0
+        self.aberto_em = 0.0
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+        self.aberturas = 0
+
+    def permite(self) -> bool:
+        with self._lock:
+            if self.estado == self.ABERTO and time.monotonic() - self.aberto_em >= self.espera_s:
+                self._mudar(self.MEIO_ABERTO)
+            if self.estado == self.MEIO_ABERTO:
+                if self._teste_em_andamento:
+                    return False
+                self._teste_em_andamento = True
+                return True
+            return self.estado == self.FECHADO
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas_seguidas = 0
+            self._teste_em_andamento = False
+            if self.estado != self.FECHADO:
+                self._mudar(self.FECHADO)
+
+    def falha(self):
+        with self._lock:
+            self.falhas_seguidas += 1
+            self._teste_em_andamento = False
+            if self.estado == self.MEIO_ABERTO or self.falhas_seguidas >= self.max_falhas:
+                if self.estado != self.ABERTO:
+                    self.aberturas += 1
+                self.aberto_em = time.monotonic()
+                self._mudar(self.ABERTO)
+
+    def liberar(self):
+        """Devolve a vaga de teste do meio aberto quando a chamada termina sem sucesso nem falha transitória."""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def tentar_apos_s(self) -> float:
+        if self.estado != self.ABERTO:
+            return 0.0
+        return max(0.0, self.espera_s - (time.monotonic() - self.aberto_em))
+
+    def _mudar(self, estado):
+        self.estado = estado
+        estado_circuito.definir(estado, self.nome)
+
+
+_disjuntores = {}
+_latencias = {}
+_lock_registros = threading.Lock()
+_contadores = Counter()
+
+
+def disjuntor(nome: str) -> Disjuntor:
+    """Um disjuntor por modelo, compartilhado por todos os wrappers que o usam (principal ou reserva)."""
+    with _lock_registros:
+        if nome not in _disjuntores:
+            _disjuntores[nome] = Disjuntor(nome)
+            estado_circuito.definir(Disjuntor.FECHADO, nome)
+        return _disjuntores[nome]
+
+
+def registrar_latencia(nome: str, etapa: str, segundos: float):
+    latencia_llm.observar(segundos, nome, etapa)
+    with _lock_registros:
+        _latencias.setdefault((nome, etapa), deque(maxlen=200)).append(segundos)
+
+
+def percentil_latencia(nome: str, etapa: str, percentil: float = GAIA_LLM_HEDGE_PERCENTIL) -> Optional[float]:
+    """Percentil das últimas latências do modelo na etapa, ou None com poucas amostras."""
+    with _lock_registros:
+        amostras = sorted(_latencias.get((nome, etapa), ()))
+    if len(amostras) < GAIA_LLM_HEDGE_MIN_AMOSTRAS:
+        return None
+    return amostras[min(len(amostras) - 1, int(len(amostras) * percentil / 100))]
+
+
+def _contar(chave, valor=1):
+    with _lock_registros:
+        _contadores[chave] += valor
+
+
+def estatisticas_llm():
+    with _lock_registros:
+        contadores = dict(_contadores)
+        chaves = list(_latencias)
+    p95 = {}
+    for nome, etapa in chaves:
+        valor = percentil_latencia(nome, etapa, percentil=95)
+        if valor is not None:
+            p95[f"{nome}/{etapa}"] = round(valor, 3)
+    return {
+        "prazo_s": GAIA_LLM_PRAZO_S,
+        "hedge": GAIA_LLM_HEDGE,
+        "disjuntores": {
+            nome: {
+                "estado": ("fechado", "meio_aberto", "aberto")[d.estado],
+                "falhas_seguidas": d.falhas_seguidas,
+                "aberturas": d.aberturas,
+                "tentar_apos_s": round(d.tentar_apos_s(), 1),
+            }
+            for nome, d in list(_disjuntores.items())
+        },
+        "p95_s": p95,
+        **contadores,
+    }
+
+# =====================================
+# CHAMADA COM HEDGING
+# =====================================
+
+async def _corrida(fabrica, timeout: float, atraso_hedge: Optional[float]):
+    """
+    Aguarda `fabrica()` por até `timeout`. Se ela não responder em `atraso_hedge`, dispara uma
+    segunda cópia e fica com a primeira que terminar bem. Devolve (resultado, hedge), com hedge
+    None (não houve cópia), "original" ou "copia" (quem respondeu).
+    """
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    tarefas = [asyncio.ensure_future(fabrica())]
+    hedge = None
+    erro = None
+    try:
+        while tarefas:
+            agora = loop.time()
+            espera = inicio + timeout - agora
+            if hedge is None and atraso_hedge is not None:
+                espera = min(espera, inicio + atraso_hedge - agora)
+            prontas, _ = await asyncio.wait(tarefas, timeout=max(0.0, espera), return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in prontas:
+                tarefas.remove(tarefa)
+                if tarefa.exception() is None:
+                    if hedge is None:
+                        return tarefa.result(), None
+                    return tarefa.result(), "copia" if tarefa is hedge else "original"
+                erro = tarefa.exception()
+            if prontas:
+                continue
+            if hedge is None and atraso_hedge is not None and loop.time() - inicio >= atraso_hedge:
+                hedge = asyncio.ensure_future(fabrica())
+                tarefas.append(hedge)
+            elif loop.time() - inicio >= timeout:
+                raise asyncio.TimeoutError()
+        raise erro
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+# =====================================
+# MODELO RESILIENTE
+# =====================================
+
+def _como_pedaco(mensagem) -> AIMessageChunk:
+    """
+    Um modelo sem `_astream` nativo devolve, no `astream`, a `AIMessage` inteira. Ela vira um
+    único pedaço sem perder as chamadas de ferramenta (como `tool_call_chunks`, que é o que o
+    agente junta) nem o `usage_metadata`.
+    """
+    if isinstance(mensagem, AIMessageChunk):
+        return mensagem
+    return AIMessageChunk(
+        content=mensagem.content,
+        additional_kwargs=mensagem.additional_kwargs,
+        response_metadata=mensagem.response_metadata,
+        id=mensagem.id,
+        usage_metadata=getattr(mensagem, "usage_metadata", None),
+        tool_call_chunks=[
+            {"name": chamada["name"], "args": json.dumps(chamada["args"]), "id": chamada["id"], "index": indice}
+            for indice, chamada in enumerate(getattr(mensagem, "tool_calls", None) or [])
+        ],
+    )
+
+
+_pool_sincrono = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gaia-llm-sync")
+
+
+class ModeloResiliente(BaseChatModel):
+    """
+    Envolve um modelo de chat (o `ChatGoogleGenerativeAI`) com:
+    - timeout por etapa, limitado pelo prazo da requisição (`prazo_requisicao`);
+    - retentativas com backoff exponencial e jitter para erros transitórios (429, 5xx, timeout);
+    - disjuntor por modelo, que para de chamar um modelo que só falha;
+    - hedging opcional (GAIA_LLM_HEDGE=1): uma cópia da chamada depois do p95 observado;
+    - troca para o modelo `reserva` quando o orçamento restante é menor que o p95 do principal
+      (ou GAIA_LLM_FALLBACK_ORCAMENTO_S), quando o disjuntor dele está aberto ou quando ele falha.
+    A etapa vem do metadado "etapa" que `telemetry.instrumentar` põe em cada cadeia.
+    Esgotadas as opções, levanta `LLMIndisponivel`; erros não transitórios sobem como estão.
+    """
+
+    principal: BaseChatModel
+    nome: str
+    reserva: Optional[BaseChatModel] = None
+    nome_reserva: Optional[str] = None
+    tentativas: int = GAIA_LLM_TENTATIVAS
+    hedge: bool = GAIA_LLM_HEDGE
+
+    @property
+    def _llm_type(self) -> str:
+        return "gaia-resiliente"
+
+    @property
+    def _identifying_params(self):
+        return {"principal": self.nome, "reserva": self.nome_reserva}
+
+    def bind_tools(self, tools, **kwargs):
+        # O reserva é da mesma família, então as ferramentas formatadas pelo principal servem para os dois.
+        ligado = self.principal.bind_tools(tools, **kwargs)
+        return self.bind(**getattr(ligado, "kwargs", {}))
+
+    # ---------- decisões ----------
+
+    def _candidatos(self, etapa: str):
+        """Gera (nome, modelo) na ordem em que devem ser tentados, registrando os desvios para o reserva."""
+        if self.reserva is not None:
+            necessario = percentil_latencia(self.nome, etapa) or GAIA_LLM_FALLBACK_ORCAMENTO_S
+            if tempo_para_etapa(etapa) < necessario:
+                fallbacks_llm.inc(1, etapa, "orcamento")
+                _contar("fallbacks_orcamento")
+                yield self.nome_reserva, self.reserva
+                return
+        yield self.nome, self.principal
+        if self.reserva is not None:
+            yield self.nome_reserva, self.reserva
+
+    def _atraso_hedge(self, nome, etapa):
+        return percentil_latencia(nome, etapa) if self.hedge else None
+
+    @staticmethod
+    def _etapa(run_manager) -> str:
+        metadados = getattr(run_manager, "metadata", None) or {}
+        return metadados.get("etapa", "desconhecida")
+
+    def _desviar(self, etapa, motivo, e=None):
+        fallbacks_llm.inc(1, etapa, motivo)
+        _contar(f"fallbacks_{motivo}")
+        if e is not None:
+            print(f"[llm_resilience] {self.nome} falhou na etapa {etapa} ({type(e).__name__}); usando {self.nome_reserva}.")
+
+    def _indisponivel(self, etapa, ultimo_erro):
+        espera = max([disjuntor(n).tentar_apos_s() for n in (self.nome, self.nome_reserva) if n] + [1.0])
+        _contar("indisponivel")
+        return LLMIndisponivel(
+            f"LLM indisponível na etapa {etapa}: {type(ultimo_erro).__name__ if ultimo_erro else 'prazo esgotado'}",
+            tentar_apos_s=espera
+        )
+
+    # ---------- assíncrono ----------
+
+    async def _tentar_modelo(self, nome, etapa, chamar, permitir_hedge=True):
+        """Retentativas de `chamar()` em um modelo. Retorna o resultado ou levanta o último erro transitório."""
+        circuito = disjuntor(nome)
+        ultimo_erro = None
+        for tentativa in range(self.tentativas):
+            timeout = tempo_para_etapa(etapa)
+            if timeout <= 0:
+                raise ultimo_erro or asyncio.TimeoutError()
+            if not circuito.permite():
+                raise ultimo_erro or _CircuitoAberto(nome)
+            if tentativa:
+                _contar("retentativas")
+            atraso = self._atraso_hedge(nome, etapa) if permitir_hedge else None
+            inicio = time.perf_counter()
+            try:
+                resultado, hedge = await _corrida(chamar, timeout, atraso if atraso is not None and atraso < timeout else None)
+            except asyncio.CancelledError:
+                circuito.liberar()
+                raise
+            except Exception as e:
+                if not erro_transitorio(e):
+                    circuito.liberar()
+                    chamadas_llm.inc(1, nome, etapa, "erro")
+                    raise
+                circuito.falha()
+                chamadas_llm.inc(1, nome, etapa, "timeout" if isinstance(e, (asyncio.TimeoutError, TimeoutError)) else "erro")
+                ultimo_erro = e
+                atraso_backoff = random.uniform(0, GAIA_LLM_BACKOFF_S * 2 ** tentativa)
+                if tentativa + 1 < self.tentativas and tempo_para_etapa(etapa) > atraso_backoff:
+                    await asyncio.sleep(atraso_backoff)
+                continue
+            circuito.sucesso()
+            chamadas_llm.inc(1, nome, etapa, "ok")
+            registrar_latencia(nome, etapa, time.perf_counter() - inicio)
+            if hedge is not None:
+                hedges_llm.inc(1, nome, etapa, hedge)
+                _contar(f"hedges_{hedge}_venceu")
+            return resultado
+        raise ultimo_erro or asyncio.TimeoutError()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        with _prazo_dos_metadados(run_manager):
+            return await self._agenerate_no_prazo(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate_no_prazo(self, messages, stop=None, run_manager=None, **kwargs):
+        etapa = self._etapa(run_manager)
+        ultimo_erro = None
+        for nome, modelo in self._candidatos(etapa):
+            if ultimo_erro is not None:
+                self._desviar(etapa, "falha", ultimo_erro)
+            try:
+                mensagem = await self._tentar_modelo(
+                    nome, etapa, lambda: modelo.ainvoke(messages, stop=stop, **kwargs)
+                )
+                return ChatResult(generations=[ChatGeneration(message=mensagem)])
+            except _CircuitoAberto as e:
+                ultimo_erro = e
+            except Exception as e:
+                if not erro_transitorio(e):
+                    raise
+                ultimo_erro = e
+        raise self._indisponivel(etapa, ultimo_erro) from ultimo_erro
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        """
+        Streaming: timeout, retentativas e troca de modelo valem até o primeiro pedaço chegar
+        (sem hedging). Depois disso o resto do texto só é limitado pelo prazo da requisição.
+        """
+        etapa = self._etapa(run_manager)
+        ultimo_erro = None
+        for nome, modelo in self._candidatos(etapa):
+            if ultimo_erro is not None:
+                self._desviar(etapa, "falha", ultimo_erro)
+
+            async def primeiro_pedaco():
+                iterador = modelo.astream(messages, stop=stop, **kwargs).__aiter__()
+                try:
+                    return iterador, await iterador.__anext__()
+                except StopAsyncIteration:
+                    return iterador, None
+
+            try:
+                iterador, pedaco = await self._tentar_modelo(nome, etapa, primeiro_pedaco, permitir_hedge=False)
+            except _CircuitoAberto as e:
+                ultimo_erro = e
+                continue
+            except Exception as e:
+                if not erro_transitorio(e):
+                    raise
+                ultimo_erro = e
+                continue
+
+            prazo = _prazo_atual.get()
+            while pedaco is not None:
+                yield ChatGenerationChunk(message=_como_pedaco(pedaco))
+                try:
+                    if prazo is None:
+                        pedaco = await iterador.__anext__()
+                    else:
+                        pedaco = await asyncio.wait_for(iterador.__anext__(), max(0.0, prazo.restante()))
+                except StopAsyncIteration:
+                    pedaco = None
+                except asyncio.TimeoutError as e:
+                    raise self._indisponivel(etapa, e) from e
+            return
+        raise self._indisponivel(etapa, ultimo_erro) from ultimo_erro
+
+    # ---------- síncrono ----------
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        """
+        Versão síncrona (terminal e `executar_fluxo_gaia`): mesmas regras, sem hedging.
+        O timeout é aplicado esperando a chamada no pool `gaia-llm-sync`; uma chamada
+        que estoura o tempo é abandonada (a thread termina sozinha).
+        """
+        etapa = self._etapa(run_manager)
+        ultimo_erro = None
+        for nome, modelo in self._candidatos(etapa):
+            if ultimo_erro is not None:
+                self._desviar(etapa, "falha", ultimo_erro)
+            circuito = disjuntor(nome)
+            for tentativa in range(self.tentativas):
+                timeout = tempo_para_etapa(etapa)
+                if timeout <= 0 or not circuito.permite():
+                    ultimo_erro = ultimo_erro or (_CircuitoAberto(nome) if timeout > 0 else TimeoutError())
+                    break
+                inicio = time.perf_counter()
+                contexto = contextvars.copy_context()
+                futuro = _pool_sincrono.submit(contexto.run, modelo.invoke, messages, stop=stop, **kwargs)
+                try:
+                    mensagem = futuro.result(timeout=timeout)
+                except Exception as e:
+                    erro = TimeoutError() if isinstance(e, TimeoutFuturo) else e
+                    if not erro_transitorio(erro):
+                        circuito.liberar()
+                        chamadas_llm.inc(1, nome, etapa, "erro")
+                        raise
+                    circuito.falha()
+                    chamadas_llm.inc(1, nome, etapa, "timeout" if isinstance(erro, TimeoutError) else "erro")
+                    ultimo_erro = erro
+                    if tentativa + 1 < self.tentativas:
+                        _contar("retentativas")
+                        time.sleep(min(random.uniform(0, GAIA_LLM_BACKOFF_S * 2 ** tentativa), max(0.0, tempo_para_etapa(etapa))))
+                    continue
+                circuito.sucesso()
+                chamadas_llm.inc(1, nome, etapa, "ok")
+                registrar_latencia(nome, etapa, time.perf_counter() - inicio)
+                return ChatResult(generations=[ChatGeneration(message=mensagem)])
+        raise self._indisponivel(etapa, ultimo_erro) from ultimo_erro
+
+
+# =====================================
+# BENCHMARK OFFLINE
+# =====================================
+
+async def _medir(modelo, chamadas: int):
+    from langchain_core.messages import SystemMessage, HumanMessage
+    from telemetry import instrumentar
+    cadeia = instrumentar(modelo, "juiz")
+    mensagens = [SystemMessage(content="Você é o Juiz de QA"), HumanMessage(content="benchmark")]
+    latencias, falhas = [], 0
+    for _ in range(chamadas):
+        inicio = time.perf_counter()
+        try:
+            await cadeia.ainvoke(mensagens)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        except LLMIndisponivel:
+            falhas += 1
+    latencias.sort()
+    return {
+        "p50_ms": round(latencias[len(latencias) // 2], 1) if latencias else None,
+        "p99_ms": round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))], 1) if latencias else None,
+        "falhas": falhas,
+    }
+
+
+def main(argv=None):
+    """
+    Compara as latências de uma etapa com o LLM falso do load_test (sem rede), com e sem hedging:
+
+        $ python llm_resilience.py --chamadas 300 --taxa-lentidao 0.03 --taxa-erro 0.05
+    """
+    import argparse
+    from load_test import ChatModelFake
+
+    parser = argparse.ArgumentParser(description="Benchmark offline de retentativas e hedging das chamadas ao LLM.")
+    parser.add_argument("--chamadas", type=int, default=300)
+    parser.add_argument("--latencia-ms", type=float, default=40)
+    parser.add_argument("--taxa-lentidao", type=float, default=0.03)
+    parser.add_argument("--taxa-erro", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    latencias = {"juiz": (args.latencia_ms / 1000, args.latencia_ms / 4000)}
+    for hedge in (False, True):
+        modelo = ModeloResiliente(
+            principal=ChatModelFake(latencias=latencias, taxa_erro=args.taxa_erro, taxa_lentidao=args.taxa_lentidao),
+            nome=f"fake-hedge-{int(hedge)}",
+            hedge=hedge
+        )
+        r = asyncio.run(_medir(modelo, args.chamadas))
+        print(f"  hedge={'sim' if hedge else 'não':<4} p50 {r['p50_ms']} ms | p99 {r['p99_ms']} ms | falhas {r['falhas']}")
+    print(f"  {estatisticas_llm()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,800 @@
+"""
+Teste de carga da API da Gaia sem Gemini e sem Atlas.
+
+Substitui `ChatGoogleGenerativeAI` por um modelo falso com latência configurável e saídas
+no protocolo do roteador e nos esquemas JSON dos especialistas, `GoogleGenerativeAIEmbeddings`
+por embeddings determinísticos, o Atlas Vector Search pelo índice local do FAQ e o MongoDB
+por um mongomock (ou um mongod local) com formulários sintéticos. Em seguida dispara uma mistura
+de perguntas contra `/chat` com concorrência fixa e mede latência (p50/p95/p99) e vazão.
+
+    $ pip install -r requirements-dev.txt   # mongomock, fakeredis e httpx não vão para a imagem
+    $ python load_test.py --requisicoes 500 --concorrencia 32
+    $ python load_test.py --saida-json base.json
+    $ python load_test.py --baseline base.json --tolerancia 0.10   # falha (exit 1) se regredir
+
+Os limites --max-p95-ms, --max-p99-ms, --min-rps e --max-erros também fazem o script sair com
+código 1, para que ele sirva de gate de regressão em cada mudança de desempenho. Um 200 com
+`answer` vazio conta como erro (e reprova a execução): latência boa de uma resposta vazia não vale.
+
+Com --workers N, sobe N servidores (um processo cada, como `uvicorn --workers`) que compartilham
+o backend de sessões escolhido em --armazenamento-sessoes, distribui as requisições entre eles sem
+afinidade de sessão e, no fim, confere em todos os workers se o histórico de cada sessão está completo:
+
+    $ python load_test.py --workers 4 --armazenamento-sessoes redis    # Redis falso via TCP (fakeredis)
+    $ python load_test.py --workers 4 --armazenamento-sessoes sqlite
+    $ python load_test.py --workers 4 --armazenamento-sessoes memoria  # histórico se divide: falha
+
+Respostas 429/503 do controle de admissão contam como recusadas (não como erros) e ficam fora das
+latências. Para ver o p99 das admitidas ficar estável em sobrecarga, compare com e sem admissão:
+
+    $ python load_test.py --concorrencia 128 --admissao-max 16 --admissao-fila 16
+    $ python load_test.py --concorrencia 128 --sem-admissao
+
+Com --lote, as mesmas perguntas vão uma a uma para /chat e depois num único /chat/batch
+(com --concorrencia itens em andamento), e o script compara a vazão dos dois:
+
+    $ python load_test.py --lote --requisicoes 200 --concorrencia 16
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import math
+import random
+import asyncio
+import hashlib
+import argparse
+import socket
+import tempfile
+import threading
+import contextlib
+import statistics
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# =====================================
+# MODELO DE CHAT FALSO
+# =====================================
+
+# Latência (mediana em segundos, sigma do log-normal) de cada papel.
+# Os valores padrão imitam a ordem de grandeza observada com o Gemini.
+LATENCIAS_PADRAO = {
+    "roteador": (0.35, 0.3),
+    "carbono": (0.9, 0.35),
+    "diagnostico": (1.2, 0.4),
+    "juiz": (0.4, 0.3),
+    "orquestrador": (0.8, 0.35),
+    "faq": (0.7, 0.3),
+    "resumo": (0.6, 0.3),
+}
+
+# Trecho do prompt de sistema que identifica cada cadeia de `ia_calbon`.
+MARCADORES_PAPEL = [
+    ("Decidir a rota", "roteador"),
+    ("Sábio da Sustentabilidade", "carbono"),
+    ("Analista de Dados Sênior", "diagnostico"),
+    ("Juiz de QA", "juiz"),
+    ("Voz de Gaia", "orquestrador"),
+    ("documento de FAQ", "faq"),
+    ("mantém o resumo", "resumo"),
+]
+
+
+def _texto(mensagem) -> str:
+    return mensagem.content if isinstance(mensagem.content, str) else str(mensagem.content)
+
+
+def _estimar_tokens(texto: str) -> int:
+    return max(1, len(texto) // 4)
+
+
+class ErroGeminiFake(Exception):
+    """Imita um 503 do Gemini (transitório)."""
+
+    code = 503
+
+
+class ChatModelFake(BaseChatModel):
+    """
+    Modelo de chat que responde como cada cadeia da Gaia espera, depois de esperar uma latência
+    sorteada de um log-normal por papel. `bind_tools` devolve o próprio modelo, e o papel
+    "diagnostico" faz uma chamada de ferramenta antes de devolver o JSON final.
+    Com `taxa_erro`, uma fração das chamadas falha com `ErroGeminiFake` (depois da latência);
+    com `taxa_lentidao`, uma fração demora `fator_lentidao` vezes mais (cauda de latência).
+    """
+
+    latencias: Dict[str, Tuple[float, float]] = LATENCIAS_PADRAO
+    escala_latencia: float = 1.0
+    taxa_erro: float = 0.0
+    taxa_lentidao: float = 0.0
+    fator_lentidao: float = 10.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "gaia-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _papel(self, mensagens) -> str:
+        sistema = _texto(mensagens[0]) if mensagens else ""
+        for marcador, papel in MARCADORES_PAPEL:
+            if marcador in sistema:
+                return papel
+        return "desconhecido"
+
+    def _latencia(self, papel: str) -> float:
+        mediana, sigma = self.latencias.get(papel, (0.5, 0.3))
+        latencia = random.lognormvariate(math.log(mediana), sigma) * self.escala_latencia if mediana > 0 else 0.0
+        if self.taxa_lentidao and random.random() < self.taxa_lentidao:
+            latencia *= self.fator_lentidao
+        return latencia
+
+    def _talvez_falhar(self):
+        if self.taxa_erro and random.random() < self.taxa_erro:
+            raise ErroGeminiFake("503 Service Unavailable (falso)")
+
+    def _responder(self, papel: str, mensagens) -> AIMessage:
+        ultima = _texto(mensagens[-1])
+        pergunta = next((_texto(m) for m in reversed(mensagens) if isinstance(m, HumanMessage)), ultima)
+
+        if papel == "roteador":
+            p = pergunta.lower()
+            if re.match(r"^(oi|olá|ola|bom dia|boa tarde|boa noite)\b", p):
+                return AIMessage(content="Olá! Sou a Gaia 🌿. Quer dicas de CO2 ou analisar dados?")
+            if "previsão do tempo" in p or "futebol" in p:
+                return AIMessage(content="Meu foco é 100% em sustentabilidade. Posso te dar dicas de CO2?")
+            if "crachá" in p or "equipe" in p or "time" in p or "média" in p:
+                rota = "diagnostico"
+            elif "gaia" in p or "projeto" in p or "dados são" in p:
+                rota = "faq"
+            else:
+                rota = "carbono"
+            return AIMessage(content=f"ROUTE={rota}\nPERGUNTA_ORIGINAL={pergunta}\nPERSONA=Gaia")
+
+        if papel == "carbono":
+            return AIMessage(content=json.dumps({
+                "dominio": "carbono",
+                "intencao": "informar",
+                "resposta": f"Sobre '{pergunta[:60]}': transporte e energia são as maiores fontes de emissão.",
+                "recomendacao": "Prefira transporte coletivo e desligue aparelhos em stand-by."
+            }, ensure_ascii=False))
+
+        if papel == "diagnostico":
+            if isinstance(mensagens[-1], ToolMessage):
+                return AIMessage(content=json.dumps({
+                    "dominio": "diagnostico",
+                    "intencao": "analisar",
+                    "resposta": f"Analisei os dados: {ultima[:120]}",
+                    "recomendacao": "Reduza o uso de carro nos dias de pico."
+                }, ensure_ascii=False))
+            cracha = re.search(r"\d+", pergunta)
+            if cracha:
+                chamada = {"name": "query_formulario_funcionario", "args": {"numero_cracha": int(cracha.group())}}
+            else:
+                chamada = {"name": "query_resumo_geral_formularios", "args": {}}
+            return AIMessage(content="", tool_calls=[{**chamada, "id": f"call_{random.getrandbits(32):x}", "type": "tool_call"}])
+
+        if papel == "juiz":
+            return AIMessage(content="APROVADO")
+        if papel == "orquestrador":
+            return AIMessage(content="Que ótima pergunta! 🌿 " + ultima[:200])
+        if papel == "faq":
+            return AIMessage(content="Segundo o nosso FAQ, a Gaia ajuda a acompanhar e reduzir as emissões da equipe. 🌿")
+        if papel == "resumo":
+            return AIMessage(content="O usuário conversou sobre emissões de carbono e pediu dicas.")
+        return AIMessage(content="?")
+
+    def _resultado(self, papel, mensagens) -> ChatResult:
+        resposta = self._responder(papel, mensagens)
+        entrada = sum(_estimar_tokens(_texto(m)) for m in mensagens)
+        saida = _estimar_tokens(_texto(resposta))
+        resposta.usage_metadata = {"input_tokens": entrada, "output_tokens": saida, "total_tokens": entrada + saida}
+        return ChatResult(generations=[ChatGeneration(message=resposta)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        papel = self._papel(messages)
+        time.sleep(self._latencia(papel))
+        self._talvez_falhar()
+        return self._resultado(papel, messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        papel = self._papel(messages)
+        await asyncio.sleep(self._latencia(papel))
+        self._talvez_falhar()
+        return self._resultado(papel, messages)
+
+# =====================================
+# EMBEDDINGS FALSOS
+# =====================================
+
+class EmbeddingsFake(Embeddings):
+    """
+    Embeddings determinísticos por hashing das palavras (saco de palavras normalizado):
+    textos com palavras em comum ficam próximos, o que basta para o FAQ e o cache semântico.
+    """
+
+    def __init__(self, dimensoes: int = 256, latencia_s: float = 0.05):
+        self.dimensoes = dimensoes
+        self.latencia_s = latencia_s
+
+    def _vetor(self, texto: str):
+        vetor = np.zeros(self.dimensoes, dtype=np.float32)
+        for palavra in re.findall(r"\w+", texto.lower()):
+            indice = int.from_bytes(hashlib.blake2b(palavra.encode(), digest_size=4).digest(), "little")
+            vetor[indice % self.dimensoes] += 1.0
+        norma = np.linalg.norm(vetor)
+        return (vetor / norma if norma else vetor).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latencia_s)
+        return [self._vetor(t) for t in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latencia_s)
+        return self._vetor(text)
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latencia_s)
+        return [self._vetor(t) for t in texts]
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latencia_s)
+        return self._vetor(text)
+
+
+TRECHOS_FAQ = [
+    "O projeto Gaia ajuda os funcionários a entender e reduzir a sua pegada de carbono.",
+    "Os dados dos formulários são usados apenas de forma agregada para análises da equipe.",
+    "Cada funcionário responde um formulário identificado pelo número do crachá.",
+    "A classificação de emissão pode ser baixa, média ou alta.",
+    "A Gaia não compartilha dados individuais com terceiros.",
+    "O formulário pode ser respondido novamente a cada trimestre.",
+]
+
+# =====================================
+# MONGODB SINTÉTICO
+# =====================================
+
+CATEGORIAS = ["transporte", "energia", "alimentacao", "residuos"]
+
+
+def semear_mongo(db, n_formularios: int, n_perguntas: int = 20, semente: int = 7):
+    """Recria as coleções `perguntas` e `formulario` com dados sintéticos (crachás 1..n_formularios)."""
+    aleatorio = random.Random(semente)
+    db.perguntas.drop()
+    db.formulario.drop()
+    db.perguntas.insert_many([
+        {"_id": i, "pergunta": f"Pergunta {i}", "categoria": CATEGORIAS[i % len(CATEGORIAS)]}
+        for i in range(1, n_perguntas + 1)
+    ])
+    db.formulario.insert_many([
+        {
+            "numero_cracha": cracha,
+            "data_resposta": datetime(2025, 1, 1) + timedelta(days=cracha % 300),
+            "nivel_emissao": round(aleatorio.uniform(10, 200), 1),
+            "classificacao_emissao": aleatorio.choice(["baixa", "media", "alta"]),
+            "respostas": [
+                {"id_pergunta": i, "resposta": aleatorio.choice(["A", "B", "C", "D"])}
+                for i in range(1, n_perguntas + 1)
+            ],
+        }
+        for cracha in range(1, n_formularios + 1)
+    ])
+
+
+def instalar_backends_falsos(args):
+    """
+    Troca Gemini, embeddings, Atlas e MongoDB pelos falsos. Precisa rodar antes de importar `api`.
+    Retorna uma descrição do backend do MongoDB usado.
+    """
+    import pymongo
+    import langchain_google_genai
+
+    latencias = dict(LATENCIAS_PADRAO)
+    if args.sem_latencia:
+        latencias = {papel: (0.0, 0.0) for papel in latencias}
+    langchain_google_genai.ChatGoogleGenerativeAI = lambda **kwargs: ChatModelFake(
+        latencias=latencias, escala_latencia=args.escala_latencia,
+        taxa_erro=args.taxa_erro_llm, taxa_lentidao=args.taxa_lentidao_llm
+    )
+    if args.hedge:
+        os.environ["GAIA_LLM_HEDGE"] = "1"
+    os.environ["GAIA_ADMISSAO"] = "0" if args.sem_admissao else "1"
+    os.environ["GAIA_ADMISSAO_TAXA_SESSAO"] = str(args.taxa_sessao)
+    if args.admissao_max is not None:
+        os.environ["GAIA_ADMISSAO_MAX_EM_ANDAMENTO"] = str(args.admissao_max)
+    if args.admissao_fila is not None:
+        os.environ["GAIA_ADMISSAO_FILA"] = str(args.admissao_fila)
+    embeddings = EmbeddingsFake(latencia_s=0.0 if args.sem_latencia else args.latencia_embeddings)
+    langchain_google_genai.GoogleGenerativeAIEmbeddings = lambda **kwargs: embeddings
+
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    os.environ.setdefault("GAIA_EMBED_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="gaia-emb-"), "cache.sqlite3"))
+    os.environ["GAIA_MONGO_DB"] = args.mongo_db
+    backend = f"mongod ({args.mongo_url})"
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+        cliente = pymongo.MongoClient(args.mongo_url, serverSelectionTimeoutMS=2000)
+    else:
+        import mongomock
+        cliente = mongomock.MongoClient()
+        # Todos os clientes criados pela aplicação precisam enxergar os mesmos dados em memória.
+        pymongo.MongoClient = lambda *a, **kw: mongomock.MongoClient(*a, _store=cliente._store, **kw)
+        backend = "mongomock"
+    semear_mongo(cliente[args.mongo_db], args.formularios)
+
+    import faq_tool
+    from faq_index import IndiceFaqLocal
+    indice = IndiceFaqLocal.salvar(
+        tempfile.mkdtemp(prefix="gaia-faq-"),
+        [{"texto": t, "pagina": 1} for t in TRECHOS_FAQ],
+        embeddings.embed_documents(TRECHOS_FAQ)
+    )
+    faq_tool.recuperador = faq_tool.RecuperadorLocal(indice, embeddings)
+    return backend
+
+# =====================================
+# CARGA
+# =====================================
+
+PERGUNTAS_POR_ROTA = {
+    "carbono": [
+        "Como reduzir minha emissão de carbono no transporte?",
+        "Quais hábitos em casa mais emitem CO2?",
+        "Vale a pena trocar o carro por bicicleta?",
+        "O que é pegada de carbono?",
+        "Como economizar energia no escritório?",
+    ],
+    "faq": [
+        "O que é o projeto Gaia?",
+        "Como meus dados são usados pela Gaia?",
+        "Quem pode ver as respostas do projeto Gaia?",
+    ],
+    "diagnostico": [
+        "Me mostre os dados do crachá {cracha}.",
+        "Qual a média de emissão do time?",
+        "Analise o formulário do crachá {cracha}.",
+    ],
+    "direta": [
+        "Oi, tudo bem?",
+        "Bom dia",
+        "Qual a previsão do tempo?",
+    ],
+}
+
+MIX_PADRAO = "carbono=0.4,faq=0.2,diagnostico=0.25,direta=0.15"
+
+
+def interpretar_mix(texto: str) -> dict:
+    mix = {}
+    for parte in texto.split(","):
+        rota, peso = parte.split("=")
+        if rota.strip() not in PERGUNTAS_POR_ROTA:
+            raise ValueError(f"Rota desconhecida no mix: {rota}")
+        mix[rota.strip()] = float(peso)
+    return mix
+
+
+def percentil(valores, p: float) -> float:
+    """Percentil por posição mais próxima (valores já ordenados)."""
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, max(0, math.ceil(p / 100 * len(valores)) - 1))]
+
+
+def _resumir_latencias(latencias_ms) -> dict:
+    ordenadas = sorted(latencias_ms)
+    return {
+        "requisicoes": len(ordenadas),
+        "p50_ms": round(percentil(ordenadas, 50), 1),
+        "p95_ms": round(percentil(ordenadas, 95), 1),
+        "p99_ms": round(percentil(ordenadas, 99), 1),
+        "media_ms": round(statistics.fmean(ordenadas), 1) if ordenadas else 0.0,
+    }
+
+
+def montar_plano(args, total: int) -> list:
+    """Sorteia [(rota, pergunta, sessão)] pelo mix, com sessões novas a cada chamada."""
+    mix = interpretar_mix(args.mix)
+    rotas, pesos = list(mix), list(mix.values())
+    aleatorio = random.Random(args.semente)
+    # Sessões novas a cada execução, para não herdar histórico de um Redis ou SQLite já usado.
+    execucao = uuid.uuid4().hex[:8]
+    plano = []
+    for _ in range(total):
+        rota = aleatorio.choices(rotas, pesos)[0]
+        pergunta = aleatorio.choice(PERGUNTAS_POR_ROTA[rota]).format(cracha=aleatorio.randint(1, args.formularios))
+        plano.append((rota, pergunta, f"carga-{execucao}-{aleatorio.randrange(args.sessoes)}"))
+    return plano
+
+
+def _resposta_preenchida(corpo: dict) -> bool:
+    return bool(str(corpo.get("answer") or "").strip())
+
+
+async def executar_carga(clientes, args) -> dict:
+    """
+    Dispara `args.requisicoes` perguntas (mais `args.aquecimento` não medidas) com no máximo
+    `args.concorrencia` em andamento, sorteando a rota pelo mix e a sessão entre `args.sessoes`.
+    Com --workers as requisições se revezam entre os `clientes` (um por worker), sem afinidade
+    de sessão, e cada sessão tem uma pergunta por vez, com `args.pausa_sessao_ms` entre a
+    resposta e a próxima pergunta, como um usuário de verdade.
+    """
+    rotas = list(interpretar_mix(args.mix))
+    total = args.aquecimento + args.requisicoes
+    plano = montar_plano(args, total)
+
+    varios_workers = bool(args.workers)
+    travas_sessao = defaultdict(asyncio.Lock)
+    ultima_resposta = {}
+    turnos_ok = defaultdict(int)
+    latencias = defaultdict(list)
+    erros = defaultdict(int)
+    vazias = defaultdict(int)
+    recusadas = defaultdict(int)
+    latencias_recusa = []
+    proxima = 0
+    inicio_medicao = None
+
+    async def enviar(indice, pergunta, sessao):
+        if varios_workers:
+            espera = ultima_resposta.get(sessao, 0.0) + args.pausa_sessao_ms / 1000 - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+        cliente = clientes[indice % len(clientes)]
+        try:
+            resposta = await cliente.post("/chat", json={"question": pergunta, "session_id": sessao})
+            vazia = resposta.status_code == 200 and not _resposta_preenchida(resposta.json())
+            return resposta.status_code, float(resposta.headers.get("Retry-After", 0)), vazia
+        except Exception:
+            return None, 0.0, False
+        finally:
+            ultima_resposta[sessao] = time.perf_counter()
+
+    async def trabalhador():
+        nonlocal proxima, inicio_medicao
+        while proxima < total:
+            indice = proxima
+            proxima += 1
+            if indice == args.aquecimento and inicio_medicao is None:
+                inicio_medicao = time.perf_counter()
+            rota, pergunta, sessao = plano[indice]
+            inicio = time.perf_counter()
+            if varios_workers:
+                async with travas_sessao[sessao]:
+                    status, tentar_apos, vazia = await enviar(indice, pergunta, sessao)
+            else:
+                status, tentar_apos, vazia = await enviar(indice, pergunta, sessao)
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            turnos_ok[sessao] += status == 200
+            if indice < args.aquecimento:
+                continue
+            if vazia:
+                # Um 200 com a resposta vazia é uma falha do fluxo, não um sucesso rápido.
+                vazias[rota] += 1
+                erros[rota] += 1
+            elif status == 200:
+                latencias[rota].append(duracao_ms)
+            elif status in (429, 503):
+                recusadas[rota] += 1
+                latencias_recusa.append(duracao_ms)
+                # Como um cliente bem-comportado: espera o Retry-After antes da próxima pergunta.
+                await asyncio.sleep(tentar_apos)
+            else:
+                erros[rota] += 1
+
+    inicio_total = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(args.concorrencia)))
+    duracao_s = time.perf_counter() - (inicio_medicao or inicio_total)
+
+    todas = [l for valores in latencias.values() for l in valores]
+    resultado = {
+        "workers": len(clientes),
+        "concorrencia": args.concorrencia,
+        "duracao_s": round(duracao_s, 2),
+        "rps": round(len(todas) / duracao_s, 2) if duracao_s else 0.0,
+        "erros": sum(erros.values()),
+        "vazias": sum(vazias.values()),
+        "recusadas": sum(recusadas.values()),
+        "p99_recusa_ms": _resumir_latencias(latencias_recusa)["p99_ms"],
+        **_resumir_latencias(todas),
+        "por_rota": {
+            rota: {**_resumir_latencias(latencias[rota]), "erros": erros[rota], "vazias": vazias[rota], "recusadas": recusadas[rota]}
+            for rota in rotas
+        },
+    }
+    if varios_workers:
+        resultado["historico"] = await conferir_historicos(clientes, turnos_ok)
+    return resultado
+
+
+async def conferir_historicos(clientes, turnos_ok) -> dict:
+    """
+    Pede o histórico de cada sessão a cada worker e confere se todos enxergam todas as
+    perguntas respondidas (uma mensagem do usuário por turno). Espera antes a gravação em lote.
+    """
+    from session_store import GAIA_SESSION_FLUSH_INTERVAL
+
+    await asyncio.sleep(max(0.2, 4 * GAIA_SESSION_FLUSH_INTERVAL))
+    completas = 0
+    for sessao, esperadas in turnos_ok.items():
+        vistas = []
+        for cliente in clientes:
+            resposta = await cliente.get(f"/history/{sessao}")
+            mensagens = resposta.json().get("messages", []) if resposta.status_code == 200 else []
+            vistas.append(sum(1 for m in mensagens if m.get("kwargs", {}).get("type") == "human"))
+        completas += all(n == esperadas for n in vistas)
+    return {"sessoes": len(turnos_ok), "completas": completas}
+
+async def comparar_lote(cliente, args) -> dict:
+    """
+    Manda as mesmas `args.requisicoes` perguntas uma a uma para /chat e depois num único
+    /chat/batch com `args.concorrencia` itens em andamento (sessões diferentes em cada modo).
+    """
+    for _, pergunta, sessao in montar_plano(args, args.aquecimento):
+        await cliente.post("/chat", json={"question": pergunta, "session_id": sessao})
+
+    plano = montar_plano(args, args.requisicoes)
+    inicio = time.perf_counter()
+    falhas = vazias = 0
+    for _, pergunta, sessao in plano:
+        resposta = await cliente.post("/chat", json={"question": pergunta, "session_id": sessao})
+        vazia = resposta.status_code == 200 and not _resposta_preenchida(resposta.json())
+        falhas += resposta.status_code != 200 or vazia
+        vazias += vazia
+    sequencial = {"itens": len(plano), "falhas": falhas, "vazias": vazias, "duracao_s": time.perf_counter() - inicio}
+
+    plano = montar_plano(args, args.requisicoes)
+    itens = [{"question": pergunta, "session_id": sessao} for _, pergunta, sessao in plano]
+    inicio = time.perf_counter()
+    resposta = await cliente.post("/chat/batch", json={"items": itens, "concurrency": args.concorrencia})
+    linhas = [json.loads(linha) for linha in resposta.text.splitlines() if linha.strip()]
+    vazias = sum(linha["status"] == 200 and not _resposta_preenchida(linha) for linha in linhas)
+    falhas = sum(linha["status"] != 200 for linha in linhas) + vazias + len(itens) - len(linhas)
+    lote = {"itens": len(itens), "falhas": falhas, "vazias": vazias, "duracao_s": time.perf_counter() - inicio}
+
+    for modo in (sequencial, lote):
+        modo["itens_por_s"] = round(modo["itens"] / modo["duracao_s"], 2) if modo["duracao_s"] else 0.0
+        modo["duracao_s"] = round(modo["duracao_s"], 2)
+    estatisticas = (await cliente.get("/batch/stats")).json()
+    return {"concorrencia": args.concorrencia, "sequencial": sequencial, "lote": lote, "agrupamento": estatisticas}
+
+
+def verificar_regressao(resultado: dict, args) -> list:
+    """Lista as violações dos limites e da comparação com a linha de base."""
+    falhas = []
+    if args.max_p95_ms is not None and resultado["p95_ms"] > args.max_p95_ms:
+        falhas.append(f"p95 {resultado['p95_ms']} ms > {args.max_p95_ms} ms")
+    if args.max_p99_ms is not None and resultado["p99_ms"] > args.max_p99_ms:
+        falhas.append(f"p99 {resultado['p99_ms']} ms > {args.max_p99_ms} ms")
+    if args.min_rps is not None and resultado["rps"] < args.min_rps:
+        falhas.append(f"RPS {resultado['rps']} < {args.min_rps}")
+    if resultado["erros"] > args.max_erros:
+        falhas.append(f"{resultado['erros']} erros > {args.max_erros}")
+    if resultado["vazias"]:
+        rotas = ", ".join(f"{rota}={r['vazias']}" for rota, r in resultado["por_rota"].items() if r["vazias"])
+        falhas.append(f"{resultado['vazias']} respostas 200 vazias ({rotas})")
+    historico = resultado.get("historico")
+    if historico and historico["completas"] < historico["sessoes"]:
+        falhas.append(f"histórico incompleto em {historico['sessoes'] - historico['completas']} de {historico['sessoes']} sessões")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        limite = 1 + args.tolerancia
+        if resultado["p95_ms"] > base["p95_ms"] * limite:
+            falhas.append(f"p95 {resultado['p95_ms']} ms piorou mais de {args.tolerancia:.0%} sobre a base ({base['p95_ms']} ms)")
+        if resultado["rps"] < base["rps"] / limite:
+            falhas.append(f"RPS {resultado['rps']} caiu mais de {args.tolerancia:.0%} sobre a base ({base['rps']})")
+    return falhas
+
+
+def imprimir_relatorio(resultado: dict, backend: str):
+    print(f"Backend: {backend} | workers {resultado['workers']} | concorrência {resultado['concorrencia']} | {resultado['duracao_s']} s")
+    print(f"  {'rota':<12} {'req':>6} {'erros':>6} {'recus.':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for rota, r in resultado["por_rota"].items():
+        print(f"  {rota:<12} {r['requisicoes']:>6} {r['erros']:>6} {r['recusadas']:>6} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}")
+    print(f"  {'total':<12} {resultado['requisicoes']:>6} {resultado['erros']:>6} {resultado['recusadas']:>6} "
+          f"{resultado['p50_ms']:>9} {resultado['p95_ms']:>9} {resultado['p99_ms']:>9}")
+    print(f"  RPS: {resultado['rps']}")
+    if resultado["vazias"]:
+        print(f"  Respostas vazias (200 sem texto, contadas como erros): {resultado['vazias']}")
+    if resultado["recusadas"]:
+        print(f"  Recusadas (429/503): {resultado['recusadas']} | p99 da recusa {resultado['p99_recusa_ms']} ms")
+    if "historico" in resultado:
+        h = resultado["historico"]
+        print(f"  Histórico completo em todos os workers: {h['completas']}/{h['sessoes']} sessões")
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Teste de carga offline da API da Gaia (/chat).")
+    parser.add_argument("--requisicoes", type=int, default=200)
+    parser.add_argument("--aquecimento", type=int, default=10, help="Requisições iniciais não medidas.")
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--sessoes", type=int, default=50)
+    parser.add_argument("--mix", default=MIX_PADRAO, help="Pesos por rota, ex.: carbono=0.5,faq=0.5")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--formularios", type=int, default=500, help="Formulários sintéticos no MongoDB.")
+    parser.add_argument("--mongo-url", default=None, help="mongod local; sem isso, usa o mongomock.")
+    parser.add_argument("--mongo-db", default="gaia_carga")
+    parser.add_argument("--escala-latencia", type=float, default=1.0, help="Multiplica as latências do LLM falso.")
+    parser.add_argument("--latencia-embeddings", type=float, default=0.05)
+    parser.add_argument("--sem-latencia", action="store_true", help="LLM e embeddings respondem na hora (mede só o overhead).")
+    parser.add_argument("--taxa-erro-llm", type=float, default=0.0, help="Fração das chamadas ao LLM falso que falham com 503.")
+    parser.add_argument("--taxa-lentidao-llm", type=float, default=0.0, help="Fração das chamadas ao LLM falso 10x mais lentas.")
+    parser.add_argument("--hedge", action="store_true", help="Liga o hedging do llm_resilience (GAIA_LLM_HEDGE=1).")
+    parser.add_argument("--sem-admissao", action="store_true", help="Desliga o controle de admissão (GAIA_ADMISSAO=0).")
+    parser.add_argument("--admissao-max", type=int, default=None, help="Fluxos simultâneos admitidos (GAIA_ADMISSAO_MAX_EM_ANDAMENTO).")
+    parser.add_argument("--admissao-fila", type=int, default=None, help="Posições na fila de admissão (GAIA_ADMISSAO_FILA).")
+    parser.add_argument("--taxa-sessao", type=float, default=0.0,
+                        help="Perguntas por segundo por sessão (GAIA_ADMISSAO_TAXA_SESSAO); 0 desliga o limite.")
+    parser.add_argument("--lote", action="store_true", help="Compara /chat sequencial com um único /chat/batch.")
+    parser.add_argument("--url", default=None, help="Mede um servidor já rodando em vez de `api.app` em processo.")
+    parser.add_argument("--workers", type=int, default=0, help="Sobe N servidores com o backend de sessões compartilhado.")
+    parser.add_argument("--armazenamento-sessoes", choices=["memoria", "sqlite", "redis"], default="memoria")
+    parser.add_argument("--redis-url", default=None, help="Redis para as sessões; sem isso, sobe um fakeredis via TCP.")
+    parser.add_argument("--pausa-sessao-ms", type=float, default=100.0,
+                        help="Com --workers, pausa entre a resposta e a próxima pergunta da mesma sessão.")
+    parser.add_argument("--servir", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--verboso", action="store_true", help="Mantém os logs da aplicação durante a carga.")
+    parser.add_argument("--saida-json", default=None)
+    parser.add_argument("--baseline", default=None, help="JSON de uma execução anterior para comparar.")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--min-rps", type=float, default=None)
+    parser.add_argument("--max-erros", type=int, default=0)
+    return parser
+
+
+def configurar_sessoes(args):
+    """
+    Define o backend de sessões pelas variáveis lidas pelo `session_store` (herdadas pelos workers).
+    Para o Redis sem --redis-url, sobe um fakeredis que fala o protocolo via TCP numa thread.
+    """
+    os.environ["GAIA_SESSION_BACKEND"] = args.armazenamento_sessoes
+    if args.armazenamento_sessoes == "sqlite":
+        os.environ["GAIA_SESSION_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="gaia-sessoes-"), "sessoes.sqlite3")
+        return "sqlite"
+    if args.armazenamento_sessoes == "redis":
+        if args.redis_url:
+            os.environ["GAIA_REDIS_URL"] = args.redis_url
+            return f"redis ({args.redis_url})"
+        from fakeredis import TcpFakeServer
+        servidor = TcpFakeServer(("127.0.0.1", _porta_livre()), server_type="redis")
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        host, porta = servidor.server_address
+        os.environ["GAIA_REDIS_URL"] = f"redis://{host}:{porta}/0"
+        return "fakeredis (tcp)"
+    return "memoria"
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def servir(args):
+    """Processo de um worker: backends falsos + `api.app` no uvicorn, na porta `args.servir`."""
+    import uvicorn
+
+    instalar_backends_falsos(args)
+    import api
+    uvicorn.run(api.app, host="127.0.0.1", port=args.servir, log_level="warning")
+
+
+async def subir_workers(args, argv, cliente_http):
+    """Sobe `args.workers` processos com `--servir` e espera cada um responder."""
+    portas = [_porta_livre() for _ in range(args.workers)]
+    saida = None if args.verboso else subprocess.DEVNULL
+    processos = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), *argv, "--servir", str(porta)], stdout=saida, stderr=saida)
+        for porta in portas
+    ]
+    urls = [f"http://127.0.0.1:{porta}" for porta in portas]
+    limite = time.monotonic() + 120
+    for url, processo in zip(urls, processos):
+        while True:
+            if processo.poll() is not None:
+                raise RuntimeError(f"O worker em {url} terminou ao subir (código {processo.returncode}).")
+            try:
+                if (await cliente_http.get(f"{url}/sessions/stats")).status_code == 200:
+                    break
+            except Exception:
+                pass
+            if time.monotonic() > limite:
+                raise RuntimeError(f"O worker em {url} não respondeu a tempo.")
+            await asyncio.sleep(0.2)
+    return urls, processos
+
+
+async def _principal(args, argv):
+    import httpx
+
+    limites = httpx.Limits(max_connections=args.concorrencia, max_keepalive_connections=args.concorrencia)
+    processos = []
+    async with contextlib.AsyncExitStack() as pilha:
+        if args.workers:
+            sessoes = configurar_sessoes(args)
+            cliente_http = await pilha.enter_async_context(httpx.AsyncClient(timeout=120, limits=limites))
+            urls, processos = await subir_workers(args, argv, cliente_http)
+            pilha.callback(lambda: [p.terminate() for p in processos])
+            backend = f"{args.workers} workers | sessões em {sessoes}"
+            clientes = [
+                await pilha.enter_async_context(httpx.AsyncClient(base_url=url, timeout=120, limits=limites))
+                for url in urls
+            ]
+        elif args.url:
+            backend = f"servidor {args.url}"
+            clientes = [await pilha.enter_async_context(httpx.AsyncClient(base_url=args.url, timeout=120, limits=limites))]
+        else:
+            configurar_sessoes(args)
+            backend = instalar_backends_falsos(args)
+            import api
+            clientes = [await pilha.enter_async_context(httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=api.app), base_url="http://gaia", timeout=120, limits=limites
+            ))]
+
+        with contextlib.ExitStack() as silencio:
+            if not args.verboso:
+                silencio.enter_context(contextlib.redirect_stdout(silencio.enter_context(open(os.devnull, "w"))))
+            if args.lote:
+                resultado = await comparar_lote(clientes[0], args)
+            else:
+                resultado = await executar_carga(clientes, args)
+    for processo in processos:
+        processo.wait(timeout=10)
+    return resultado, backend
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = criar_parser().parse_args(argv)
+    if args.servir is not None:
+        servir(args)
+        return 0
+    resultado, backend = asyncio.run(_principal(args, argv))
+    if args.lote:
+        print(f"Backend: {backend} | /chat sequencial x /chat/batch (concorrência {resultado['concorrencia']})")
+        for modo in ("sequencial", "lote"):
+            r = resultado[modo]
+            print(f"  {modo:<12} {r['itens']:>6} itens {r['falhas']:>4} falhas ({r['vazias']} vazias) "
+                  f"{r['duracao_s']:>8} s {r['itens_por_s']:>8} itens/s")
+        for cadeia, r in resultado["agrupamento"].items():
+            if not r["chamadas"]:
+                print(f"  {cadeia}: nenhuma chamada agrupada (a cadeia não rodou nos itens do lote)")
+                continue
+            print(f"  {cadeia}: {r['chamadas']} chamadas em {r['lotes']} abatch (média {r['tamanho_medio']:.1f})")
+        falhas = resultado["lote"]["falhas"]
+        vazias = resultado["sequencial"]["vazias"] + resultado["lote"]["vazias"]
+        if falhas > args.max_erros:
+            print(f"[load_test] REGRESSÃO: {falhas} itens do lote falharam > {args.max_erros}")
+        if vazias:
+            print(f"[load_test] REGRESSÃO: {vazias} respostas 200 vazias")
+        return 1 if falhas > args.max_erros or vazias else 0
+    imprimir_relatorio(resultado, backend)
+
+    if args.saida_json:
+        with open(args.saida_json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    falhas = verificar_regressao(resultado, args)
+    for falha in falhas:
+        print(f"[load_test] REGRESSÃO: {falha}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import os
+import json
+import random
+import threading
+from collections import Counter
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+# Fração das respostas que passam nas checagens locais e ainda assim vão para o juiz LLM.
+# 1.0 = sempre chama o juiz (padrão); 0.2 = chama o juiz em 20% das respostas daquela rota.
+AMOSTRAGEM_JUIZ = {
+    "carbono": float(os.getenv("GAIA_JUIZ_AMOSTRAGEM_CARBONO", "1.0")),
+    "diagnostico": float(os.getenv("GAIA_JUIZ_AMOSTRAGEM_DIAGNOSTICO", "1.0")),
+}
+
+CAMPOS_OBRIGATORIOS = ("dominio", "intencao", "resposta", "recomendacao")
+
+# =====================================
+# REPARO E VALIDAÇÃO
+# =====================================
+
+def reparar_json(texto: str):
+    """
+    Extrai o objeto JSON da saída do especialista, tolerando cercas de código (```json)
+    e texto antes ou depois do objeto. Retorna o dicionário ou None se não houver JSON válido.
+    """
+    if not isinstance(texto, str):
+        return None
+    inicio = texto.find("{")
+    if inicio < 0:
+        return None
+    try:
+        objeto, _ = json.JSONDecoder().raw_decode(texto[inicio:])
+    except json.JSONDecodeError:
+        return None
+    return objeto if isinstance(objeto, dict) else None
+
+
+def esquema_valido(objeto: dict) -> bool:
+    return (
+        all(isinstance(objeto.get(campo), str) for campo in CAMPOS_OBRIGATORIOS)
+        and bool(objeto["resposta"].strip())
+    )
+
+
+class ResultadoValidacao:
+    """
+    `veredito`: código no formato do juiz quando a decisão é local, ou None quando o juiz LLM deve decidir.
+    `json`: a saída do especialista já reparada (ou a original, se não foi possível reparar).
+    """
+
+    __slots__ = ("veredito", "json")
+
+    def __init__(self, veredito, json_texto):
+        self.veredito = veredito
+        self.json = json_texto
+
+
+class ValidadorLocal:
+    """
+    Etapa que roda antes do `juiz_chain`:
+    - regra 4 (formato): o JSON é reparado e checado contra o esquema; se falhar, REPROVADO_FORMATO;
+    - regra 2 (toxicidade), em parte: `resposta` e `recomendacao` passam pelo autômato de badwords,
+      só com palavras inteiras (na saída do modelo, "cu" em "cuidado" não é palavrão);
+    - o que passa localmente vai ao juiz conforme a amostragem configurada para a rota.
+    """
+
+    def __init__(self, matcher_badwords, amostragem=AMOSTRAGEM_JUIZ):
+        self.matcher_badwords = matcher_badwords
+        self.amostragem = amostragem
+        self._lock = threading.Lock()
+        self._contadores = Counter()
+
+    def validar(self, json_especialista: str, rota: str) -> ResultadoValidacao:
+        objeto = reparar_json(json_especialista)
+        if objeto is None or not esquema_valido(objeto):
+            return self._decidir(rota, "REPROVADO_FORMATO", json_especialista, "formato")
+
+        json_reparado = json.dumps(objeto, ensure_ascii=False)
+
+        if self.matcher_badwords.contem_palavra(f"{objeto['resposta']}\n{objeto['recomendacao']}"):
+            return self._decidir(rota, "REPROVADO_TOXICIDADE", json_reparado, "toxicidade")
+
+        if random.random() >= self.amostragem.get(rota, 1.0):
+            return self._decidir(rota, "APROVADO", json_reparado, "amostragem")
+
+        with self._lock:
+            self._contadores["enviadas_ao_juiz"] += 1
+        return ResultadoValidacao(None, json_reparado)
+
+    def _decidir(self, rota, veredito, json_texto, motivo):
+        with self._lock:
+            self._contadores[f"evitadas_{motivo}"] += 1
+            self._contadores[f"evitadas_{rota}"] += 1
+        return ResultadoValidacao(veredito, json_texto)
+
+    def estatisticas(self):
+        with self._lock:
+            por_motivo = {
+                motivo: self._contadores[f"evitadas_{motivo}"]
+                for motivo in ("formato", "toxicidade", "amostragem")
+            }
+            return {
+                "chamadas_ao_juiz": self._contadores["enviadas_ao_juiz"],
+                "chamadas_evitadas": sum(por_motivo.values()),
+                "evitadas_por_motivo": por_motivo,
+                "evitadas_por_rota": {
+                    rota: self._contadores[f"evitadas_{rota}"] for rota in self.amostragem
+                },
+                "amostragem": dict(self.amostragem),
+            }
@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+import pymongo
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+MONGO_DB_NAME = os.getenv("GAIA_MONGO_DB", "dbInterEco")
+GAIA_MONGO_MAX_POOL = int(os.getenv("GAIA_MONGO_MAX_POOL", "50"))
+GAIA_MONGO_MIN_POOL = int(os.getenv("GAIA_MONGO_MIN_POOL", "0"))
+GAIA_MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("GAIA_MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+GAIA_MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("GAIA_MONGO_CONNECT_TIMEOUT_MS", "5000"))
+GAIA_MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("GAIA_MONGO_SOCKET_TIMEOUT_MS", "10000"))
+
+_client = None
+_lock = threading.Lock()
+
+# =====================================
+# CLIENTE COMPARTILHADO
+# =====================================
+
+def get_client() -> pymongo.MongoClient:
+    """
+    Retorna o MongoClient único do processo, criado na primeira chamada.
+    O próprio MongoClient mantém o pool de conexões e é seguro entre threads,
+    então `tools.py` e `faq_tool.py` reutilizam as mesmas conexões.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = pymongo.MongoClient(
+                    os.getenv("MONGO_URL"),
+                    maxPoolSize=GAIA_MONGO_MAX_POOL,
+                    minPoolSize=GAIA_MONGO_MIN_POOL,
+                    serverSelectionTimeoutMS=GAIA_MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=GAIA_MONGO_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=GAIA_MONGO_SOCKET_TIMEOUT_MS,
+                )
+    return _client
+
+
+def get_db():
+    return get_client()[MONGO_DB_NAME]
+
+
+def close_client():
+    """Fecha o cliente compartilhado (o próximo `get_client` cria outro)."""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def health_check() -> dict:
+    """Faz um `ping` no servidor e retorna o status e a latência da ida e volta."""
+    inicio = time.perf_counter()
+    try:
+        get_client().admin.command("ping")
+        return {"status": "ok", "latencia_ms": round((time.perf_counter() - inicio) * 1000, 2)}
+    except Exception as e:
+        return {"status": "error", "message": f"{type(e).__name__}: {e}"}
+
+# =====================================
+# BENCHMARK
+# =====================================
+
+if __name__ == "__main__":
+    """
+    Compara a latência das ferramentas criando um MongoClient por chamada (comportamento antigo)
+    com o cliente compartilhado, com o cache por crachá e o resumo materializado desligados. Usa o mongod de BENCH_MONGO_URL (padrão localhost:27017)
+    e, se ele não estiver disponível, o mongomock:
+    $ python mongo_client.py
+    """
+    import random
+    import statistics
+    from datetime import datetime, timedelta
+
+    url = os.getenv("BENCH_MONGO_URL", "mongodb://localhost:27017")
+    os.environ["MONGO_URL"] = url
+    MONGO_DB_NAME = "gaia_bench"
+    n_formularios = int(os.getenv("BENCH_FORMULARIOS", "500"))
+    repeticoes = int(os.getenv("BENCH_REPETICOES", "50"))
+
+    cliente_bench = pymongo.MongoClient(url, serverSelectionTimeoutMS=1000)
+    try:
+        cliente_bench.admin.command("ping")
+        backend = f"mongod ({url})"
+    except Exception:
+        import mongomock
+        cliente_bench = mongomock.MongoClient()
+        # Todos os clientes do benchmark precisam enxergar os mesmos dados em memória.
+        pymongo.MongoClient = lambda *args, **kwargs: mongomock.MongoClient(*args, _store=cliente_bench._store, **kwargs)
+        backend = "mongomock (sem rede: a diferença real é maior)"
+
+    db_bench = cliente_bench[MONGO_DB_NAME]
+    db_bench.perguntas.drop()
+    db_bench.formulario.drop()
+    categorias = ["transporte", "energia", "alimentacao", "residuos"]
+    db_bench.perguntas.insert_many([
+        {"_id": i, "pergunta": f"Pergunta {i}", "categoria": categorias[i % len(categorias)]}
+        for i in range(1, 21)
+    ])
+    random.seed(7)
+    db_bench.formulario.insert_many([
+        {
+            "numero_cracha": cracha,
+            "data_resposta": datetime(2025, 1, 1) + timedelta(days=cracha % 300),
+            "nivel_emissao": round(random.uniform(10, 200), 1),
+            "classificacao_emissao": random.choice(["baixa", "media", "alta"]),
+            "respostas": [
+                {"id_pergunta": i, "resposta": random.choice(["A", "B", "C", "D"])}
+                for i in range(1, 21)
+            ],
+        }
+        for cracha in range(1, n_formularios + 1)
+    ])
+
+    import tools
+
+    # O cache por crachá e o resumo materializado respondem sem ir ao MongoDB depois da primeira
+    # chamada; desligados, as duas medições comparam só a conexão por chamada com o pool.
+    tools.cache_crachas.max_itens = 0
+    tools.GAIA_RESUMO_MATERIALIZADO = False
+
+    def conexao_por_chamada():
+        return pymongo.MongoClient(url)[MONGO_DB_NAME]
+
+    def medir(func, **kwargs):
+        duracoes = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            func(**kwargs)
+            duracoes.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(duracoes)
+
+    cenarios = [
+        ("query_formulario_funcionario", tools.query_formulario_funcionario.func, {"numero_cracha": 42}),
+        ("query_resumo_geral_formularios", tools.query_resumo_geral_formularios.func, {}),
+    ]
+
+    print(f"Backend: {backend} | {n_formularios} formulários | {repeticoes} repetições (p50)")
+    for nome, func, kwargs in cenarios:
+        tools.get_db_connection = conexao_por_chamada
+        assert func(**kwargs)["status"] == "ok"
+        antes = medir(func, **kwargs)
+        tools.get_db_connection = get_db
+        depois = medir(func, **kwargs)
+        print(f"  {nome:<32} antes {antes:8.2f} ms | depois {depois:8.2f} ms")
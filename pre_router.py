@@ -0,0 +1,249 @@
+import os
+import re
+import math
+import threading
+import unicodedata
+from collections import Counter
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_PRE_ROUTER = os.getenv("GAIA_PRE_ROUTER", "1") == "1"
+GAIA_PRE_ROUTER_MIN_CONFIDENCE = float(os.getenv("GAIA_PRE_ROUTER_MIN_CONFIDENCE", "0.9"))
+# Conjunto rotulado de onde sai a confiança de cada regra (ver `calibrar`).
+GAIA_PRE_ROUTER_ROTULOS = os.getenv(
+    "GAIA_PRE_ROUTER_ROTULOS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pre_router_rotulos.tsv")
+)
+# z do limite inferior de Wilson (1.645 = unilateral de 95%).
+GAIA_PRE_ROUTER_Z = float(os.getenv("GAIA_PRE_ROUTER_Z", "1.645"))
+
+RESPOSTAS_SAUDACAO = [
+    "Olá! Sou a Gaia 🌿. Posso analisar dados de emissão da equipe ou dar dicas para reduzir sua pegada de carbono. Por onde começamos?",
+    "Oi! Que bom te ver por aqui 🌿. Quer analisar dados de sustentabilidade ou receber dicas de CO2?",
+    "Olá! 💡 Sobre o que vamos conversar hoje: análise de dados ou dicas de sustentabilidade?",
+]
+
+# =====================================
+# REGRAS
+# =====================================
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos e com espaços simples, para as regras não dependerem de grafia."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+class Regra:
+    """
+    Uma regra do pré-roteador: se `padrao` casar com a pergunta normalizada, sugere `rota`.
+    A `confianca` não é escolhida à mão: sai de `calibrar`, sobre o conjunto rotulado.
+    """
+
+    __slots__ = ("nome", "rota", "padrao", "confianca", "casos", "acertos")
+
+    def __init__(self, nome, rota, padrao):
+        self.nome = nome
+        self.rota = rota
+        self.padrao = re.compile(padrao)
+        self.confianca = 0.0
+        self.casos = 0
+        self.acertos = 0
+
+
+_TERMOS_CARBONO = r"(pegada|co2|carbono|efeito estufa|gases? de efeito estufa|gee|creditos? de carbono|neutralidade|emissoes de co2)"
+_GAIA = r"(gaia|projeto)"
+
+# A ordem importa: a primeira regra que casar decide. Conceitos de carbono vêm antes do FAQ
+# ("o que é co2 e como o projeto ajuda?" é uma pergunta sobre CO2), e o FAQ exige "gaia"/"projeto".
+REGRAS = [
+    Regra(
+        "saudacao", "saudacao",
+        r"^(oi+|ola|ei|eai|e ai|hey|bom dia|boa tarde|boa noite|tudo bem|tudo bom)"
+        r"( gaia)?( ?[,!.]? ?(tudo bem|tudo bom|como vai)?)?[ !?.]*$"
+    ),
+    Regra(
+        # O número tem que vir logo depois de "crachá" ("crachá 12", "crachá nº 12", "crachá: 12").
+        "cracha", "diagnostico",
+        r"\bcracha\b( e)?( (numero|num|no|n|nº|n°))?[ .:#-]*\d+\b"
+    ),
+    Regra(
+        "emissao_coletiva", "diagnostico",
+        r"\b(media|resumo|total|ranking)\b.*\b(emiss\w*|pegada|co2)\b.*"
+        r"\b(da|do|de|dos|das|nossa|nosso|por|entre os|entre as) (equipe|time|empresa|setor|funcionarios|colaboradores|todos)\b"
+    ),
+    Regra(
+        # O termo de carbono é o assunto da pergunta (até três palavras depois do início, sem passar por "gaia"/"projeto").
+        "conceito_carbono", "carbono",
+        rf"^(o que (e|sao)|o que significa|como funciona(m)?|qual a diferenca entre) ((?!{_GAIA}\b)\w+ ){{0,3}}{_TERMOS_CARBONO}\b"
+    ),
+    Regra(
+        "projeto_gaia", "faq",
+        rf"^(o que e|como funciona|quem (criou|fez|desenvolveu))\b.*\b{_GAIA}\b"
+    ),
+    Regra(
+        "dados_usuario", "faq",
+        rf"\b(meus dados|minhas informacoes|minhas respostas|privacidade|lgpd)\b.*\b{_GAIA}\b"
+        rf"|\b{_GAIA}\b.*\b(meus dados|minhas informacoes|minhas respostas|privacidade|lgpd)\b"
+    ),
+]
+
+# =====================================
+# CALIBRAÇÃO
+# =====================================
+
+def carregar_rotulos(caminho=GAIA_PRE_ROUTER_ROTULOS):
+    """Lê o conjunto rotulado (`rota<TAB>pergunta` por linha, `#` para comentários)."""
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            linhas = [linha.rstrip("\n") for linha in f]
+    except FileNotFoundError:
+        print(f"[pre_router] Aviso: '{caminho}' não encontrado; sem calibração, nenhuma regra é usada.")
+        return []
+    rotulos = []
+    for linha in linhas:
+        if not linha.strip() or linha.startswith("#"):
+            continue
+        rota, pergunta = linha.split("\t", 1)
+        rotulos.append((pergunta.strip(), rota.strip()))
+    return rotulos
+
+
+def limite_inferior_wilson(acertos: int, casos: int, z: float = GAIA_PRE_ROUTER_Z) -> float:
+    if not casos:
+        return 0.0
+    p = acertos / casos
+    z2 = z * z
+    centro = p + z2 / (2 * casos)
+    margem = z * math.sqrt(p * (1 - p) / casos + z2 / (4 * casos * casos))
+    return (centro - margem) / (1 + z2 / casos)
+
+
+def calibrar(regras, rotulos, z: float = GAIA_PRE_ROUTER_Z):
+    """
+    Define a confiança de cada regra como o limite inferior de Wilson da sua precisão no
+    conjunto rotulado, contando só as perguntas em que ela é a primeira a casar (como em
+    `PreRoteador.classificar`). Com z=1.645, passar de 0.9 exige uns 25 acertos sem erro;
+    uma regra com poucos exemplos ou que erra fica abaixo do limiar e a pergunta vai ao LLM.
+    """
+    for regra in regras:
+        regra.casos = regra.acertos = 0
+    for pergunta, rota in rotulos:
+        texto = normalizar(pergunta)
+        regra = next((r for r in regras if r.padrao.search(texto)), None)
+        if regra is not None:
+            regra.casos += 1
+            regra.acertos += regra.rota == rota
+    for regra in regras:
+        regra.confianca = limite_inferior_wilson(regra.acertos, regra.casos, z)
+    return regras
+
+
+calibrar(REGRAS, carregar_rotulos())
+
+# =====================================
+# PRÉ-ROTEADOR
+# =====================================
+
+class PreRoteador:
+    """
+    Classificador determinístico que fica na frente do `router_chain`.
+    Quando uma regra casa com confiança suficiente, a decisão sai sem chamar o LLM;
+    caso contrário o fluxo segue para o roteador normal.
+    """
+
+    def __init__(self, regras=REGRAS, confianca_minima=GAIA_PRE_ROUTER_MIN_CONFIDENCE, ativo=GAIA_PRE_ROUTER):
+        self.regras = regras
+        self.confianca_minima = confianca_minima
+        self.ativo = ativo
+        self._lock = threading.Lock()
+        self._total = 0
+        self._acertos = Counter()
+        self._proxima_saudacao = 0
+
+    def classificar(self, pergunta: str):
+        """Retorna (rota, regra, confiança) da primeira regra que casar, ou None."""
+        texto = normalizar(pergunta)
+        for regra in self.regras:
+            if regra.padrao.search(texto):
+                return regra.rota, regra.nome, regra.confianca
+        return None
+
+    def rotear(self, pergunta: str, persona: str):
+        """
+        Retorna a resposta no mesmo formato do `router_chain` (texto direto para saudações,
+        PROTOCOLO DE ENCAMINHAMENTO para as rotas) ou None quando o LLM deve decidir.
+        """
+        if not self.ativo:
+            return None
+
+        decisao = self.classificar(pergunta)
+        with self._lock:
+            self._total += 1
+            if decisao is None or decisao[2] < self.confianca_minima:
+                return None
+            rota, nome_regra, _ = decisao
+            self._acertos[nome_regra] += 1
+            if rota == "saudacao":
+                resposta = RESPOSTAS_SAUDACAO[self._proxima_saudacao % len(RESPOSTAS_SAUDACAO)]
+                self._proxima_saudacao += 1
+                return resposta
+
+        return f"ROUTE={rota}\nPERGUNTA_ORIGINAL={pergunta}\nPERSONA={persona}"
+
+    def estatisticas(self):
+        with self._lock:
+            acertos = sum(self._acertos.values())
+            return {
+                "ativo": self.ativo,
+                "confianca_minima": self.confianca_minima,
+                "mensagens": self._total,
+                "resolvidas_sem_llm": acertos,
+                "enviadas_ao_llm": self._total - acertos,
+                "taxa_acerto": acertos / self._total if self._total else 0.0,
+                "acertos_por_regra": dict(self._acertos),
+                "confianca_por_regra": {regra.nome: round(regra.confianca, 3) for regra in self.regras},
+            }
+
+# =====================================
+# BENCHMARK
+# =====================================
+
+if __name__ == "__main__":
+    """
+    Mostra a confiança calibrada de cada regra, a taxa de acerto no conjunto rotulado e a latência
+    economizada por mensagem roteada, dada a p50 do roteador LLM:
+    $ GAIA_ROUTER_P50_MS=650 python pre_router.py
+    """
+    import statistics
+    import time
+
+    rotulos = carregar_rotulos()
+    for regra in REGRAS:
+        print(f"  {regra.nome:<18} {regra.acertos}/{regra.casos} acertos -> confiança {regra.confianca:.3f}")
+
+    p50_roteador_ms = float(os.getenv("GAIA_ROUTER_P50_MS", "650"))
+    pre_roteador = PreRoteador(ativo=True)
+
+    erros = 0
+    duracoes = []
+    for pergunta, rota_esperada in rotulos:
+        inicio = time.perf_counter()
+        resposta = pre_roteador.rotear(pergunta, persona="")
+        duracoes.append(time.perf_counter() - inicio)
+        if resposta is None:
+            continue
+        rota = resposta.split("\n", 1)[0].removeprefix("ROUTE=") if resposta.startswith("ROUTE=") else "saudacao"
+        if rota != rota_esperada:
+            erros += 1
+            print(f"  ERRO: {pergunta!r} -> {rota} (esperado {rota_esperada})")
+
+    stats = pre_roteador.estatisticas()
+    p50_regras_ms = statistics.median(duracoes) * 1000
+    economia_ms = stats["taxa_acerto"] * p50_roteador_ms - p50_regras_ms
+
+    print(f"Mensagens: {stats['mensagens']} | resolvidas sem LLM: {stats['resolvidas_sem_llm']} "
+          f"({stats['taxa_acerto']:.0%}) | rotas erradas: {erros}")
+    print(f"p50 do pré-roteador: {p50_regras_ms * 1000:.1f} µs")
+    print(f"Economia de p50 por mensagem roteada (roteador LLM a {p50_roteador_ms:.0f} ms): {economia_ms:.0f} ms")
@@ -0,0 +1,219 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, Counter
+import numpy as np
+from pre_router import normalizar
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_CACHE_MAX_ITEMS = int(os.getenv("GAIA_CACHE_MAX_ITEMS", "1000"))
+GAIA_CACHE_TTL = float(os.getenv("GAIA_CACHE_TTL", "86400"))
+GAIA_CACHE_SEMANTIC = os.getenv("GAIA_CACHE_SEMANTIC", "1") == "1"
+GAIA_CACHE_SIMILARITY = float(os.getenv("GAIA_CACHE_SIMILARITY", "0.92"))
+
+# Respostas de diagnóstico dependem do crachá e dos dados do usuário: nunca entram no cache.
+ROTAS_CACHEAVEIS = {"carbono", "faq"}
+
+CAMINHO_FAQ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "GAIA_FAQ.pdf")
+
+
+def chave_pergunta(pergunta: str) -> str:
+    return re.sub(r"[^\w ]", "", normalizar(pergunta)).strip()
+
+
+def _versao_arquivo(caminho):
+    try:
+        info = os.stat(caminho)
+        return (info.st_mtime_ns, info.st_size)
+    except OSError:
+        return None
+
+# =====================================
+# CACHE DE RESPOSTAS
+# =====================================
+
+class _Entrada:
+    __slots__ = ("rota", "valor", "vetor", "expira_em")
+
+    def __init__(self, rota, valor, vetor, expira_em):
+        self.rota = rota
+        self.valor = valor
+        self.vetor = vetor
+        self.expira_em = expira_em
+
+
+class CacheRespostas:
+    """
+    Cache das respostas de `carbono` (JSON validado pelo juiz) e `faq` (resposta final).
+    1º nível: texto normalizado da pergunta.
+    2º nível: similaridade de cosseno entre embeddings, acima de `limiar_similaridade`.
+    Tem TTL, limite de itens com descarte LRU e invalida as respostas de FAQ
+    quando o arquivo `GAIA_FAQ.pdf` muda.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        max_itens=GAIA_CACHE_MAX_ITEMS,
+        ttl_segundos=GAIA_CACHE_TTL,
+        limiar_similaridade=GAIA_CACHE_SIMILARITY,
+        caminho_faq=CAMINHO_FAQ
+    ):
+        self.embeddings = embeddings if GAIA_CACHE_SEMANTIC else None
+        self.max_itens = max_itens
+        self.ttl_segundos = ttl_segundos
+        self.limiar_similaridade = limiar_similaridade
+        self.caminho_faq = caminho_faq
+        self._versao_faq = _versao_arquivo(caminho_faq)
+        self._entradas = OrderedDict()
+        self._vetores_pendentes = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = Counter()
+
+    # ---------- consulta ----------
+
+    def buscar(self, rota: str, pergunta: str):
+        """Retorna o valor em cache para a pergunta ou None."""
+        if rota not in ROTAS_CACHEAVEIS:
+            return None
+        chave = chave_pergunta(pergunta)
+        valor = self._buscar_exato(rota, chave)
+        if valor is not None:
+            return valor
+        if self.embeddings is None:
+            return self._registrar_miss(rota)
+        try:
+            vetor = self.embeddings.embed_query(pergunta)
+        except Exception as e:
+            print(f"[response_cache] Falha ao gerar embedding: {e}")
+            return self._registrar_miss(rota)
+        return self._buscar_semantico(rota, chave, vetor)
+
+    async def abuscar(self, rota: str, pergunta: str):
+        if rota not in ROTAS_CACHEAVEIS:
+            return None
+        chave = chave_pergunta(pergunta)
+        valor = self._buscar_exato(rota, chave)
+        if valor is not None:
+            return valor
+        if self.embeddings is None:
+            return self._registrar_miss(rota)
+        try:
+            vetor = await self.embeddings.aembed_query(pergunta)
+        except Exception as e:
+            print(f"[response_cache] Falha ao gerar embedding: {e}")
+            return self._registrar_miss(rota)
+        return self._buscar_semantico(rota, chave, vetor)
+
+    def _buscar_exato(self, rota, chave):
+        with self._lock:
+            if rota == "faq":
+                self._verificar_faq()
+            entrada = self._entradas.get((rota, chave))
+            if entrada is not None and entrada.expira_em < time.monotonic():
+                del self._entradas[(rota, chave)]
+                entrada = None
+            if entrada is None:
+                return None
+            self._entradas.move_to_end((rota, chave))
+            self._contadores[f"{rota}_hits_exatos"] += 1
+            return entrada.valor
+
+    def _buscar_semantico(self, rota, chave, vetor):
+        vetor = _normalizar_vetor(vetor)
+        with self._lock:
+            self._vetores_pendentes[(rota, chave)] = vetor
+            while len(self._vetores_pendentes) > 256:
+                self._vetores_pendentes.popitem(last=False)
+
+            agora = time.monotonic()
+            candidatas = [
+                (k, e) for k, e in self._entradas.items()
+                if e.rota == rota and e.vetor is not None and e.expira_em >= agora
+            ]
+            if candidatas:
+                matriz = np.stack([e.vetor for _, e in candidatas])
+                similaridades = matriz @ vetor
+                melhor = int(np.argmax(similaridades))
+                if similaridades[melhor] >= self.limiar_similaridade:
+                    chave_melhor, entrada = candidatas[melhor]
+                    self._entradas.move_to_end(chave_melhor)
+                    self._contadores[f"{rota}_hits_semanticos"] += 1
+                    return entrada.valor
+
+            self._contadores[f"{rota}_misses"] += 1
+            return None
+
+    def _registrar_miss(self, rota):
+        with self._lock:
+            self._contadores[f"{rota}_misses"] += 1
+        return None
+
+    # ---------- escrita ----------
+
+    def guardar(self, rota: str, pergunta: str, valor: str):
+        if rota not in ROTAS_CACHEAVEIS or not valor:
+            return
+        chave = chave_pergunta(pergunta)
+        with self._lock:
+            vetor = self._vetores_pendentes.pop((rota, chave), None)
+            self._entradas[(rota, chave)] = _Entrada(rota, valor, vetor, time.monotonic() + self.ttl_segundos)
+            self._entradas.move_to_end((rota, chave))
+            while len(self._entradas) > self.max_itens:
+                self._entradas.popitem(last=False)
+                self._contadores["removidas_lru"] += 1
+
+    # ---------- invalidação ----------
+
+    def invalidar(self, rota: str = None):
+        """Remove todas as entradas (ou apenas as da rota informada). Retorna quantas saíram."""
+        with self._lock:
+            return self._invalidar(rota)
+
+    def _invalidar(self, rota):
+        chaves = [k for k in self._entradas if rota is None or k[0] == rota]
+        for k in chaves:
+            del self._entradas[k]
+        self._contadores["invalidacoes"] += 1
+        return len(chaves)
+
+    def _verificar_faq(self):
+        versao = _versao_arquivo(self.caminho_faq)
+        if versao != self._versao_faq:
+            print("[response_cache] GAIA_FAQ.pdf mudou: invalidando respostas de FAQ em cache.")
+            self._versao_faq = versao
+            self._invalidar("faq")
+
+    def estatisticas(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            por_rota = {}
+            for rota in sorted(ROTAS_CACHEAVEIS):
+                hits = contadores.get(f"{rota}_hits_exatos", 0) + contadores.get(f"{rota}_hits_semanticos", 0)
+                misses = contadores.get(f"{rota}_misses", 0)
+                por_rota[rota] = {
+                    "hits_exatos": contadores.get(f"{rota}_hits_exatos", 0),
+                    "hits_semanticos": contadores.get(f"{rota}_hits_semanticos", 0),
+                    "misses": misses,
+                    "taxa_acerto": hits / (hits + misses) if hits + misses else 0.0,
+                }
+            return {
+                "itens": len(self._entradas),
+                "max_itens": self.max_itens,
+                "ttl_segundos": self.ttl_segundos,
+                "semantico": self.embeddings is not None,
+                "limiar_similaridade": self.limiar_similaridade,
+                "removidas_lru": contadores.get("removidas_lru", 0),
+                "invalidacoes": contadores.get("invalidacoes", 0),
+                "rotas": por_rota,
+            }
+
+
+def _normalizar_vetor(vetor):
+    vetor = np.asarray(vetor, dtype=np.float32)
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
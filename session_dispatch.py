@@ -0,0 +1,134 @@
+import os
+import asyncio
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager
+from pre_router import normalizar
+from telemetry import registro, Contador, Medidor
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+# Requisições idênticas (mesma sessão e mesma pergunta) em andamento esperam o resultado da primeira.
+GAIA_COALESCER_REQUISICOES = os.getenv("GAIA_COALESCER_REQUISICOES", "1") == "1"
+
+requisicoes_coalescidas = registro.registrar(Contador(
+    "gaia_sessao_coalescidas_total", "Requisições que aguardaram o resultado de uma idêntica já em andamento."
+))
+requisicoes_enfileiradas = registro.registrar(Contador(
+    "gaia_sessao_enfileiradas_total", "Requisições que esperaram outra da mesma sessão terminar."
+))
+profundidade_fila = registro.registrar(Medidor(
+    "gaia_sessao_fila_profundidade", "Requisições esperando a vez da sua sessão neste momento."
+))
+
+# =====================================
+# DESPACHANTE POR SESSÃO
+# =====================================
+
+class _FilaSessao:
+    __slots__ = ("lock", "pendentes")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pendentes = 0
+
+
+class DespachanteSessoes:
+    """
+    Garante que os fluxos de uma mesma sessão rodem um de cada vez, na ordem de chegada
+    (o `asyncio.Lock` é FIFO), para que duas requisições não leiam e gravem o mesmo
+    histórico intercaladas. Sessões diferentes continuam em paralelo.
+
+    Com `coalescer`, uma requisição idêntica a outra ainda em andamento (mesma sessão e
+    mesma pergunta normalizada, ex.: retry do cliente ou clique duplo) não roda o fluxo de
+    novo: aguarda o resultado da primeira, que grava o histórico uma única vez.
+    """
+
+    def __init__(self, coalescer=GAIA_COALESCER_REQUISICOES):
+        self.coalescer = coalescer
+        self._filas = {}
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        self._contadores = Counter()
+        self._maior_fila = 0
+
+    @asynccontextmanager
+    async def sessao(self, session_id: str):
+        """Reserva a sessão até o fim do bloco; quem chega depois espera na fila dela."""
+        fila = self._filas.get(session_id)
+        if fila is None:
+            fila = self._filas[session_id] = _FilaSessao()
+        fila.pendentes += 1
+        esperou = fila.lock.locked()
+        if esperou:
+            requisicoes_enfileiradas.inc()
+            with self._lock:
+                self._contadores["enfileiradas"] += 1
+                self._maior_fila = max(self._maior_fila, fila.pendentes - 1)
+        profundidade_fila.inc()
+        try:
+            try:
+                await fila.lock.acquire()
+            finally:
+                profundidade_fila.dec()
+            try:
+                yield
+            finally:
+                fila.lock.release()
+        finally:
+            fila.pendentes -= 1
+            if fila.pendentes == 0 and self._filas.get(session_id) is fila:
+                del self._filas[session_id]
+
+    async def executar(self, session_id: str, pergunta: str, fabrica):
+        """
+        Roda `fabrica()` (uma corrotina com o fluxo) com a sessão reservada e retorna o resultado.
+        O fluxo roda numa tarefa própria: se o cliente que o iniciou desconectar,
+        as requisições coalescidas nele ainda recebem a resposta.
+        """
+        with self._lock:
+            self._contadores["requisicoes"] += 1
+        if not self.coalescer:
+            async with self.sessao(session_id):
+                return await fabrica()
+
+        chave = (session_id, normalizar(pergunta))
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is not None:
+            requisicoes_coalescidas.inc()
+            with self._lock:
+                self._contadores["coalescidas"] += 1
+            return await asyncio.shield(tarefa)
+
+        async def liderar():
+            try:
+                async with self.sessao(session_id):
+                    return await fabrica()
+            finally:
+                self._em_andamento.pop(chave, None)
+
+        tarefa = asyncio.ensure_future(liderar())
+        # Evita o aviso de "exception was never retrieved" quando todos os clientes já desistiram.
+        tarefa.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._em_andamento[chave] = tarefa
+        return await asyncio.shield(tarefa)
+
+    def estatisticas(self):
+        with self._lock:
+            requisicoes = self._contadores["requisicoes"]
+            return {
+                "coalescer": self.coalescer,
+                "requisicoes": requisicoes,
+                "coalescidas": self._contadores["coalescidas"],
+                "taxa_coalescidas": self._contadores["coalescidas"] / requisicoes if requisicoes else 0.0,
+                "enfileiradas": self._contadores["enfileiradas"],
+                "maior_fila": self._maior_fila,
+                "aguardando_agora": int(profundidade_fila.valor()),
+                "sessoes_ativas": len(self._filas),
+                "fluxos_em_andamento": len(self._em_andamento),
+            }
+
+
+despachante_sessoes = DespachanteSessoes()
@@ -0,0 +1,484 @@
+import os
+import sys
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from functools import partial
+from collections import OrderedDict, Counter
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ChatMessage
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_MAX_SESSIONS = int(os.getenv("GAIA_MAX_SESSIONS", "10000"))
+GAIA_SESSION_TTL = float(os.getenv("GAIA_SESSION_TTL", "3600"))
+GAIA_MAX_MESSAGES_PER_SESSION = int(os.getenv("GAIA_MAX_MESSAGES_PER_SESSION", "100"))
+
+# Onde os históricos persistem: "memoria" (só no processo), "sqlite" ou "redis".
+GAIA_SESSION_BACKEND = os.getenv("GAIA_SESSION_BACKEND", "memoria")
+GAIA_SESSION_SQLITE_PATH = os.getenv(
+    "GAIA_SESSION_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.sqlite3")
+)
+# "fakeredis://" usa um Redis falso em processo (desenvolvimento e testes; fakeredis vem do requirements-dev.txt).
+GAIA_REDIS_URL = os.getenv("GAIA_REDIS_URL", "redis://localhost:6379/0")
+# Intervalo entre as gravações em lote (write-behind) e quantas sessões alteradas antecipam a gravação.
+GAIA_SESSION_FLUSH_INTERVAL = float(os.getenv("GAIA_SESSION_FLUSH_INTERVAL", "0.02"))
+GAIA_SESSION_FLUSH_BATCH = int(os.getenv("GAIA_SESSION_FLUSH_BATCH", "200"))
+
+_TIPOS_MENSAGEM = {
+    "human": HumanMessage,
+    "ai": AIMessage,
+    "system": SystemMessage,
+}
+
+# =====================================
+# HISTÓRICO COMPACTO
+# =====================================
+
+class MensagemCompacta:
+    """Representação mínima de uma mensagem: tipo internado + texto."""
+
+    __slots__ = ("tipo", "conteudo")
+
+    def __init__(self, tipo, conteudo):
+        self.tipo = sys.intern(tipo)
+        self.conteudo = conteudo
+
+    def para_mensagem(self):
+        classe = _TIPOS_MENSAGEM.get(self.tipo)
+        if classe is None:
+            return ChatMessage(role=self.tipo, content=self.conteudo)
+        return classe(content=self.conteudo)
+
+    def tamanho_bytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.conteudo)
+
+
+class HistoricoCompacto(BaseChatMessageHistory):
+    """
+    Histórico de chat que guarda apenas (tipo, texto) por mensagem e descarta
+    as mensagens mais antigas ao passar de `max_mensagens`.
+    Os objetos `BaseMessage` só são criados quando `messages` é lido.
+    `resumo` guarda o resumo incremental das mensagens anteriores a `resumo_ate`
+    (índice absoluto, contando as `descartadas` pelo limite de mensagens).
+
+    Sem `__slots__`: `BaseChatMessageHistory` não os declara, então a instância tem `__dict__`
+    de qualquer jeito; declará-los economizava só 8 bytes por sessão (225 contra 233, tracemalloc). A economia está nas
+    mensagens: uma `MensagemCompacta` custa ~57 bytes além do texto, um `HumanMessage` ~770.
+    """
+
+    def __init__(self, max_mensagens=GAIA_MAX_MESSAGES_PER_SESSION):
+        self._mensagens = []
+        self.max_mensagens = max_mensagens
+        self.ultimo_acesso = time.monotonic()
+        self.descartadas = 0
+        self.resumo = ""
+        self.resumo_ate = 0
+        self.versao = 0
+        self.ao_alterar = None
+
+    def marcar_alterado(self):
+        """Sobe a versão e avisa o store (que agenda a gravação no backend, se houver)."""
+        self.versao += 1
+        if self.ao_alterar is not None:
+            self.ao_alterar(self)
+
+    def para_estado(self) -> dict:
+        # A versão é lida antes das mensagens: se uma mensagem entrar no meio da leitura,
+        # a próxima gravação (já agendada pelo `marcar_alterado`) leva a versão nova.
+        versao = self.versao
+        return {
+            "versao": versao,
+            "mensagens": [[m.tipo, m.conteudo] for m in list(self._mensagens)],
+            "descartadas": self.descartadas,
+            "resumo": self.resumo,
+            "resumo_ate": self.resumo_ate,
+        }
+
+    @classmethod
+    def de_estado(cls, estado: dict, max_mensagens=GAIA_MAX_MESSAGES_PER_SESSION):
+        historico = cls(max_mensagens=max_mensagens)
+        historico._mensagens = [MensagemCompacta(tipo, conteudo) for tipo, conteudo in estado["mensagens"]]
+        historico.descartadas = estado.get("descartadas", 0)
+        historico.resumo = estado.get("resumo", "")
+        historico.resumo_ate = estado.get("resumo_ate", 0)
+        historico.versao = estado.get("versao", 0)
+        return historico
+
+    @property
+    def messages(self):
+        return [m.para_mensagem() for m in self._mensagens]
+
+    def add_messages(self, messages):
+        for message in messages:
+            conteudo = message.content
+            tipo = message.role if isinstance(message, ChatMessage) else message.type
+            self._mensagens.append(MensagemCompacta(tipo, conteudo))
+        excesso = len(self._mensagens) - self.max_mensagens
+        if self.max_mensagens and excesso > 0:
+            del self._mensagens[:excesso]
+            self.descartadas += excesso
+        self.marcar_alterado()
+
+    def clear(self):
+        self._mensagens = []
+        self.descartadas = 0
+        self.resumo = ""
+        self.resumo_ate = 0
+        self.marcar_alterado()
+
+    def __len__(self):
+        return len(self._mensagens)
+
+    def tamanho_bytes(self):
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self._mensagens)
+            + sum(m.tamanho_bytes() for m in self._mensagens)
+            + sys.getsizeof(self.resumo)
+        )
+
+# =====================================
+# BACKENDS DE PERSISTÊNCIA
+# =====================================
+# Um backend guarda o estado serializado de cada sessão (`HistoricoCompacto.para_estado`)
+# e implementa:
+# - `carregar(session_id, versao_minima=-1)`: o estado, só se a versão guardada for maior
+#   que `versao_minima` (senão None), para que revalidar uma sessão em cache custe uma leitura curta;
+# - `salvar_varios({session_id: estado})`: grava um lote de uma vez;
+# - `remover(session_id)` e `__len__`.
+
+class BackendSqlite:
+    """Sessões em um arquivo SQLite (modo WAL), compartilhável entre os workers de uma máquina."""
+
+    nome = "sqlite"
+
+    def __init__(self, caminho=GAIA_SESSION_SQLITE_PATH, ttl_segundos=GAIA_SESSION_TTL):
+        self.caminho = caminho
+        self.ttl_segundos = ttl_segundos
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, timeout=10)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS sessoes ("
+            "session_id TEXT PRIMARY KEY, versao INTEGER, estado TEXT, atualizado_em REAL)"
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS sessoes_atualizado_em ON sessoes (atualizado_em)")
+        self._conexao.commit()
+
+    def carregar(self, session_id, versao_minima=-1):
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT estado FROM sessoes WHERE session_id = ? AND versao > ?", (session_id, versao_minima)
+            ).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def salvar_varios(self, estados: dict):
+        agora = time.time()
+        with self._lock:
+            self._conexao.executemany(
+                "INSERT INTO sessoes (session_id, versao, estado, atualizado_em) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET "
+                "versao = excluded.versao, estado = excluded.estado, atualizado_em = excluded.atualizado_em",
+                [
+                    (session_id, estado["versao"], json.dumps(estado, ensure_ascii=False), agora)
+                    for session_id, estado in estados.items()
+                ]
+            )
+            if self.ttl_segundos:
+                self._conexao.execute("DELETE FROM sessoes WHERE atualizado_em < ?", (agora - self.ttl_segundos,))
+            self._conexao.commit()
+
+    def remover(self, session_id):
+        with self._lock:
+            self._conexao.execute("DELETE FROM sessoes WHERE session_id = ?", (session_id,))
+            self._conexao.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conexao.execute("SELECT COUNT(*) FROM sessoes").fetchone()[0]
+
+
+class BackendRedis:
+    """
+    Sessões em um Redis (ou qualquer servidor do mesmo protocolo), compartilháveis entre
+    workers e réplicas. Cada sessão é um hash com `versao` e `estado`, expirado pelo próprio
+    Redis após `ttl_segundos` sem gravação.
+    """
+
+    nome = "redis"
+
+    def __init__(self, cliente, prefixo="gaia:sessao:", ttl_segundos=GAIA_SESSION_TTL):
+        self.cliente = cliente
+        self.prefixo = prefixo
+        self.ttl_segundos = ttl_segundos
+
+    @classmethod
+    def de_url(cls, url=GAIA_REDIS_URL, **kwargs):
+        if url.startswith("fakeredis://"):
+            import fakeredis
+            return cls(fakeredis.FakeRedis(), **kwargs)
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def carregar(self, session_id, versao_minima=-1):
+        chave = self.prefixo + session_id
+        if versao_minima < 0:
+            versao, estado = self.cliente.hmget(chave, ("versao", "estado"))
+        else:
+            # Revalidação: só traz o estado (maior) se a versão guardada for mais nova.
+            versao = self.cliente.hget(chave, "versao")
+            if versao is None or int(versao) <= versao_minima:
+                return None
+            estado = self.cliente.hget(chave, "estado")
+        return json.loads(estado) if estado else None
+
+    def salvar_varios(self, estados: dict):
+        pipeline = self.cliente.pipeline(transaction=False)
+        for session_id, estado in estados.items():
+            chave = self.prefixo + session_id
+            pipeline.hset(chave, mapping={"versao": estado["versao"], "estado": json.dumps(estado, ensure_ascii=False)})
+            if self.ttl_segundos:
+                pipeline.expire(chave, int(self.ttl_segundos))
+        pipeline.execute()
+
+    def remover(self, session_id):
+        self.cliente.delete(self.prefixo + session_id)
+
+    def __len__(self):
+        return sum(1 for _ in self.cliente.scan_iter(match=self.prefixo + "*", count=1000))
+
+
+def criar_backend_sessoes(nome=GAIA_SESSION_BACKEND):
+    """Retorna o backend configurado, ou None para manter as sessões só na memória do processo."""
+    if nome == "memoria":
+        return None
+    if nome == "sqlite":
+        return BackendSqlite()
+    if nome == "redis":
+        return BackendRedis.de_url()
+    raise ValueError(f"Backend de sessões desconhecido: {nome}")
+
+# =====================================
+# GRAVAÇÃO EM SEGUNDO PLANO (WRITE-BEHIND)
+# =====================================
+
+class GravadorSessoes:
+    """
+    Grava no backend, numa thread própria, as sessões alteradas desde a última gravação.
+    O caminho da requisição só marca a sessão como alterada; várias alterações da mesma
+    sessão dentro de um intervalo viram uma única gravação, e todas as sessões do intervalo
+    vão no mesmo lote. Se a gravação falhar, as sessões voltam para a próxima rodada.
+    """
+
+    def __init__(self, backend, intervalo_s=GAIA_SESSION_FLUSH_INTERVAL, tamanho_lote=GAIA_SESSION_FLUSH_BATCH):
+        self.backend = backend
+        self.intervalo_s = intervalo_s
+        self.tamanho_lote = tamanho_lote
+        self._alteradas = {}
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = False
+        self._contadores = Counter()
+        self._ultima_gravacao_ms = 0.0
+        self._thread = threading.Thread(target=self._executar, name="gaia-session-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    def marcar(self, session_id, historico):
+        with self._lock:
+            self._alteradas[session_id] = historico
+            cheio = len(self._alteradas) >= self.tamanho_lote
+        if cheio:
+            self._acordar.set()
+
+    def _executar(self):
+        while not self._parar:
+            self._acordar.wait(self.intervalo_s)
+            self._acordar.clear()
+            self.descarregar()
+
+    def descarregar(self) -> int:
+        """Grava agora tudo o que está pendente e retorna quantas sessões foram gravadas."""
+        with self._lock:
+            alteradas, self._alteradas = self._alteradas, {}
+        if not alteradas:
+            return 0
+        inicio = time.perf_counter()
+        try:
+            self.backend.salvar_varios({session_id: h.para_estado() for session_id, h in alteradas.items()})
+        except Exception as e:
+            print(f"[session_store] Falha ao gravar {len(alteradas)} sessões no backend {self.backend.nome}: {e}")
+            with self._lock:
+                for session_id, historico in alteradas.items():
+                    self._alteradas.setdefault(session_id, historico)
+                self._contadores["erros"] += 1
+            return 0
+        with self._lock:
+            self._contadores["lotes"] += 1
+            self._contadores["sessoes_gravadas"] += len(alteradas)
+            self._contadores["maior_lote"] = max(self._contadores["maior_lote"], len(alteradas))
+            self._ultima_gravacao_ms = (time.perf_counter() - inicio) * 1000
+        return len(alteradas)
+
+    def fechar(self):
+        """Para a thread e grava o que ainda estiver pendente (chamado também no `atexit`)."""
+        if self._parar:
+            return
+        self._parar = True
+        self._acordar.set()
+        self._thread.join(timeout=5)
+        self.descarregar()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "pendentes": len(self._alteradas),
+                "lotes": self._contadores["lotes"],
+                "sessoes_gravadas": self._contadores["sessoes_gravadas"],
+                "maior_lote": self._contadores["maior_lote"],
+                "erros": self._contadores["erros"],
+                "ultima_gravacao_ms": round(self._ultima_gravacao_ms, 2),
+                "intervalo_ms": self.intervalo_s * 1000,
+            }
+
+# =====================================
+# STORE DE SESSÕES
+# =====================================
+
+class SessionStore:
+    """
+    Guarda os históricos por session_id com limite de sessões (LRU),
+    expiração por inatividade (TTL) e limite de mensagens por sessão.
+    A ordem do OrderedDict é a ordem do último acesso, então tanto o LRU
+    quanto o TTL só precisam olhar o início do dicionário.
+
+    Com um `backend`, a memória vira um cache na frente dele: as alterações vão para o
+    backend em segundo plano (`GravadorSessoes`) e cada `get` revalida a sessão pela versão,
+    recarregando-a se outro worker gravou uma mais nova. Assim vários workers (ou réplicas)
+    atendem a mesma sessão e um reinício não perde as conversas. Um turno gravado por outro
+    worker só aparece depois da gravação em lote dele (GAIA_SESSION_FLUSH_INTERVAL), e duas
+    requisições simultâneas da mesma sessão em workers diferentes não são serializadas
+    (`session_dispatch` serializa dentro do processo).
+    """
+
+    def __init__(
+        self,
+        max_sessoes=GAIA_MAX_SESSIONS,
+        ttl_segundos=GAIA_SESSION_TTL,
+        max_mensagens=GAIA_MAX_MESSAGES_PER_SESSION,
+        backend=None
+    ):
+        self.max_sessoes = max_sessoes
+        self.ttl_segundos = ttl_segundos
+        self.max_mensagens = max_mensagens
+        self.backend = backend
+        self.gravador = GravadorSessoes(backend) if backend is not None else None
+        self._sessoes = OrderedDict()
+        self._lock = threading.Lock()
+        self.removidas_lru = 0
+        self.removidas_ttl = 0
+        self.recarregadas = 0
+
+    def get(self, session_id):
+        """Retorna o histórico da sessão, criando-o (ou trazendo-o do backend) se necessário."""
+        agora = time.monotonic()
+        with self._lock:
+            self._expirar(agora)
+            historico = self._sessoes.get(session_id)
+
+        recarregada = False
+        if self.backend is not None:
+            # Fora do lock: é I/O, e não deve segurar as outras sessões.
+            estado = self._carregar(session_id, historico.versao if historico is not None else -1)
+            if estado is not None:
+                historico = HistoricoCompacto.de_estado(estado, max_mensagens=self.max_mensagens)
+                historico.ao_alterar = partial(self.gravador.marcar, session_id)
+                recarregada = True
+
+        with self._lock:
+            if historico is None:
+                historico = HistoricoCompacto(max_mensagens=self.max_mensagens)
+                if self.gravador is not None:
+                    historico.ao_alterar = partial(self.gravador.marcar, session_id)
+            self._sessoes[session_id] = historico
+            self._sessoes.move_to_end(session_id)
+            self.recarregadas += recarregada
+            while self.max_sessoes and len(self._sessoes) > self.max_sessoes:
+                self._sessoes.popitem(last=False)
+                self.removidas_lru += 1
+            historico.ultimo_acesso = agora
+            return historico
+
+    def _carregar(self, session_id, versao_minima):
+        try:
+            return self.backend.carregar(session_id, versao_minima)
+        except Exception as e:
+            print(f"[session_store] Falha ao ler a sessão {session_id} do backend {self.backend.nome}: {e}")
+            return None
+
+    def _expirar(self, agora):
+        if not self.ttl_segundos:
+            return
+        while self._sessoes:
+            session_id, historico = next(iter(self._sessoes.items()))
+            if agora - historico.ultimo_acesso <= self.ttl_segundos:
+                break
+            del self._sessoes[session_id]
+            self.removidas_ttl += 1
+
+    def __contains__(self, session_id):
+        with self._lock:
+            self._expirar(time.monotonic())
+            if session_id in self._sessoes:
+                return True
+        return self.backend is not None and self._carregar(session_id, -1) is not None
+
+    def __getitem__(self, session_id):
+        with self._lock:
+            return self._sessoes[session_id]
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            del self._sessoes[session_id]
+        if self.backend is not None:
+            self.backend.remover(session_id)
+
+    def __len__(self):
+        return len(self._sessoes)
+
+    def descarregar(self):
+        """Grava já no backend as alterações pendentes (ex.: antes de encerrar o processo)."""
+        return self.gravador.descarregar() if self.gravador is not None else 0
+
+    def estatisticas(self):
+        """Contagem de sessões, mensagens e memória estimada do store (e o estado do backend)."""
+        with self._lock:
+            self._expirar(time.monotonic())
+            historicos = list(self._sessoes.values())
+            total_bytes = sys.getsizeof(self._sessoes) + sum(h.tamanho_bytes() for h in historicos)
+            estatisticas = {
+                "sessoes": len(historicos),
+                "mensagens": sum(len(h) for h in historicos),
+                "memoria_estimada_bytes": total_bytes,
+                "max_sessoes": self.max_sessoes,
+                "ttl_segundos": self.ttl_segundos,
+                "max_mensagens_por_sessao": self.max_mensagens,
+                "removidas_lru": self.removidas_lru,
+                "removidas_ttl": self.removidas_ttl,
+                "backend": self.backend.nome if self.backend is not None else "memoria",
+            }
+        if self.backend is not None:
+            estatisticas["recarregadas_do_backend"] = self.recarregadas
+            estatisticas["gravacao"] = self.gravador.estatisticas()
+            try:
+                estatisticas["sessoes_no_backend"] = len(self.backend)
+            except Exception as e:
+                estatisticas["sessoes_no_backend"] = f"indisponível: {e}"
+        return estatisticas
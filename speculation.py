@@ -0,0 +1,107 @@
+import os
+import time
+import asyncio
+import threading
+from history_window import estimar_tokens
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_ESPECULAR_ORQUESTRADOR = os.getenv("GAIA_ESPECULAR_ORQUESTRADOR", "0") == "1"
+
+# =====================================
+# ESTATÍSTICAS
+# =====================================
+
+class EstatisticasEspeculacao:
+    """Latência economizada pelas especulações aprovadas e tokens gastos nas rejeitadas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.aprovadas = 0
+        self.rejeitadas = 0
+        self.latencia_economizada_s = 0.0
+        self.tokens_entrada_desperdicados = 0
+        self.tokens_saida_desperdicados = 0
+
+    def registrar_aprovacao(self, economia_s: float):
+        with self._lock:
+            self.aprovadas += 1
+            self.latencia_economizada_s += economia_s
+
+    def registrar_rejeicao(self, tokens_entrada: int, tokens_saida: int):
+        with self._lock:
+            self.rejeitadas += 1
+            self.tokens_entrada_desperdicados += tokens_entrada
+            self.tokens_saida_desperdicados += tokens_saida
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "ativo": GAIA_ESPECULAR_ORQUESTRADOR,
+                "aprovadas": self.aprovadas,
+                "rejeitadas": self.rejeitadas,
+                "latencia_economizada_total_ms": round(self.latencia_economizada_s * 1000, 1),
+                "latencia_economizada_media_ms": round(self.latencia_economizada_s * 1000 / self.aprovadas, 1) if self.aprovadas else 0.0,
+                "tokens_entrada_desperdicados": self.tokens_entrada_desperdicados,
+                "tokens_saida_desperdicados": self.tokens_saida_desperdicados,
+            }
+
+# =====================================
+# EXECUÇÃO ESPECULATIVA
+# =====================================
+
+async def especular(validar, gerar, estatisticas: EstatisticasEspeculacao, tokens_entrada: int = 0):
+    """
+    Executa `validar()` (o juiz) e `gerar()` (o orquestrador) ao mesmo tempo.
+    Gera ("veredito", veredito) assim que o juiz responde; se for "APROVADO", gera em seguida
+    ("pedaco", texto) com a saída do orquestrador, que ficou em buffer até a aprovação.
+    Se o juiz reprovar (ou falhar), o orquestrador é cancelado e sua saída descartada.
+    """
+    fila = asyncio.Queue()
+    gerado = []
+    inicio = time.perf_counter()
+    fim_geracao = None
+
+    async def produzir():
+        nonlocal fim_geracao
+        try:
+            async for pedaco in gerar():
+                gerado.append(pedaco)
+                fila.put_nowait(pedaco)
+        finally:
+            fim_geracao = time.perf_counter()
+            fila.put_nowait(None)
+
+    tarefa = asyncio.create_task(produzir())
+    try:
+        veredito = await validar()
+    except BaseException:
+        tarefa.cancel()
+        raise
+    fim_validacao = time.perf_counter()
+
+    if veredito != "APROVADO":
+        tarefa.cancel()
+        estatisticas.registrar_rejeicao(tokens_entrada, estimar_tokens("".join(gerado)) if gerado else 0)
+        yield ("veredito", veredito)
+        return
+
+    yield ("veredito", veredito)
+    try:
+        while True:
+            pedaco = await fila.get()
+            if pedaco is None:
+                break
+            yield ("pedaco", pedaco)
+        await tarefa
+    finally:
+        if not tarefa.done():
+            tarefa.cancel()
+
+    # Em sequência, o total seria juiz + orquestrador; em paralelo, o maior dos dois.
+    estatisticas.registrar_aprovacao(min(fim_validacao - inicio, fim_geracao - inicio))
+
+
+estatisticas_especulacao = EstatisticasEspeculacao()
@@ -0,0 +1,370 @@
+import os
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+from history_window import estimar_tokens
+
+# =====================================
+# CONFIGURAÇÃO
+# =====================================
+
+GAIA_TELEMETRIA = os.getenv("GAIA_TELEMETRIA", "1") == "1"
+# Imprime uma linha por fluxo com a duração de cada etapa (útil em desenvolvimento).
+GAIA_TELEMETRIA_LOG = os.getenv("GAIA_TELEMETRIA_LOG", "0") == "1"
+
+# Limites (em segundos) dos buckets dos histogramas de duração.
+BUCKETS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CABECALHO_TRACE = "X-Trace-Id"
+
+# =====================================
+# MÉTRICAS (formato de texto do Prometheus)
+# =====================================
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes, valores, extra=None) -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Contador:
+    """Contador monotônico com rótulos (`inc(valor, *rotulos)`)."""
+
+    tipo = "counter"
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, *rotulos):
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def valor(self, *rotulos):
+        return self._valores.get(rotulos, 0)
+
+    def amostras(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        for rotulos, valor in sorted(itens):
+            yield f"{self.nome}{_formatar_rotulos(self.rotulos, rotulos)} {valor}"
+
+
+class Histograma:
+    """Histograma com buckets fixos e rótulos (`observar(valor, *rotulos)`)."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, rotulos=(), buckets=BUCKETS_DURACAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *rotulos):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def contagem(self, *rotulos):
+        serie = self._series.get(rotulos)
+        return serie[2] if serie else 0
+
+    def amostras(self):
+        with self._lock:
+            itens = [(r, (list(s[0]), s[1], s[2])) for r, s in self._series.items()]
+        for rotulos, (contagens, soma, total) in sorted(itens):
+            acumulado = 0
+            for limite, n in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += n
+                le = 'le="+Inf"' if limite == float("inf") else f'le="{limite!r}"'
+                yield f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, rotulos, le)} {acumulado}"
+            yield f"{self.nome}_sum{_formatar_rotulos(self.rotulos, rotulos)} {soma}"
+            yield f"{self.nome}_count{_formatar_rotulos(self.rotulos, rotulos)} {total}"
+
+
+class Medidor:
+    """Valor que sobe e desce (ex.: tamanho de fila), com rótulos (`inc`, `dec`, `definir`)."""
+
+    tipo = "gauge"
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, *rotulos):
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def dec(self, valor=1, *rotulos):
+        self.inc(-valor, *rotulos)
+
+    def definir(self, valor, *rotulos):
+        with self._lock:
+            self._valores[rotulos] = valor
+
+    def valor(self, *rotulos):
+        return self._valores.get(rotulos, 0)
+
+    def amostras(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        for rotulos, valor in sorted(itens):
+            yield f"{self.nome}{_formatar_rotulos(self.rotulos, rotulos)} {valor}"
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def exportar(self) -> str:
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.descricao}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.amostras())
+        return "\n".join(linhas) + "\n"
+
+
+registro = RegistroMetricas()
+
+duracao_etapa = registro.registrar(Histograma(
+    "gaia_etapa_duracao_segundos", "Duração de cada etapa do fluxo da Gaia.", ("etapa",)
+))
+erros_etapa = registro.registrar(Contador(
+    "gaia_etapa_erros_total", "Exceções levantadas em cada etapa do fluxo.", ("etapa", "erro")
+))
+tokens_etapa = registro.registrar(Contador(
+    "gaia_etapa_tokens_total", "Tokens de entrada e saída dos LLMs, por etapa.", ("etapa", "direcao")
+))
+duracao_ferramenta = registro.registrar(Histograma(
+    "gaia_ferramenta_duracao_segundos", "Duração das ferramentas do agente de diagnóstico.", ("ferramenta", "status")
+))
+duracao_fluxo = registro.registrar(Histograma(
+    "gaia_fluxo_duracao_segundos", "Duração do fluxo completo, por rota.", ("rota",)
+))
+fluxos = registro.registrar(Contador(
+    "gaia_fluxos_total", "Fluxos concluídos, por rota e veredito do juiz.", ("rota", "veredito")
+))
+duracao_http = registro.registrar(Histograma(
+    "gaia_http_duracao_segundos", "Duração das requisições HTTP até o envio dos cabeçalhos.", ("metodo", "caminho", "status")
+))
+
+# =====================================
+# RASTRO POR REQUISIÇÃO
+# =====================================
+
+class Rastro:
+    """Etapas de uma requisição, identificadas pelo mesmo `trace_id`."""
+
+    __slots__ = ("trace_id", "rota", "veredito", "etapas", "inicio")
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.rota = None
+        self.veredito = None
+        self.etapas = []
+        self.inicio = time.perf_counter()
+
+    def resumo(self) -> str:
+        etapas = " ".join(f"{nome}={duracao * 1000:.0f}ms" for nome, duracao in self.etapas)
+        return f"trace={self.trace_id} rota={self.rota} veredito={self.veredito} {etapas}"
+
+
+_rastro_atual = contextvars.ContextVar("gaia_rastro", default=None)
+
+
+def rastro_atual():
+    return _rastro_atual.get()
+
+
+def iniciar_rastro(trace_id=None) -> Rastro:
+    """Cria o rastro da requisição atual (o contexto é herdado pelas tarefas e pelo pool de `concurrency`)."""
+    rastro = Rastro(trace_id)
+    _rastro_atual.set(rastro)
+    return rastro
+
+
+@contextmanager
+def medir_etapa(etapa: str):
+    """Mede a duração de uma etapa e conta as exceções que saírem dela."""
+    if not GAIA_TELEMETRIA:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        erros_etapa.inc(1, etapa, type(e).__name__)
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        duracao_etapa.observar(duracao, etapa)
+        rastro = _rastro_atual.get()
+        if rastro is not None:
+            rastro.etapas.append((etapa, duracao))
+
+
+@contextmanager
+def medir_fluxo():
+    """
+    Envolve um fluxo completo com um rastro novo (que herda o `trace_id` da requisição, se houver).
+    O fluxo preenche `rastro.rota` e `rastro.veredito`; ao sair, a duração total e o veredito
+    são registrados por rota.
+    """
+    anterior = _rastro_atual.get()
+    rastro = iniciar_rastro(anterior.trace_id if anterior is not None else None)
+    inicio = time.perf_counter()
+    try:
+        yield rastro
+    finally:
+        _rastro_atual.set(anterior)
+        if GAIA_TELEMETRIA:
+            rota = rastro.rota or "desconhecida"
+            duracao_fluxo.observar(time.perf_counter() - inicio, rota)
+            fluxos.inc(1, rota, rastro.veredito or "sem_juiz")
+            if GAIA_TELEMETRIA_LOG:
+                print(f"[telemetria] {rastro.resumo()}")
+
+
+def medir_ferramenta(func, nome=None):
+    """Envolve a função de uma ferramenta para registrar sua duração e se terminou em erro."""
+    nome = nome or func.__name__
+
+    def _medida(*args, **kwargs):
+        inicio = time.perf_counter()
+        status = "ok"
+        try:
+            resultado = func(*args, **kwargs)
+            if isinstance(resultado, dict) and resultado.get("status") == "error":
+                status = "error"
+            return resultado
+        except Exception:
+            status = "exception"
+            raise
+        finally:
+            duracao = time.perf_counter() - inicio
+            duracao_ferramenta.observar(duracao, nome, status)
+            rastro = _rastro_atual.get()
+            if rastro is not None:
+                rastro.etapas.append((f"ferramenta:{nome}", duracao))
+
+    _medida.__name__ = func.__name__
+    _medida.__doc__ = func.__doc__
+    return _medida if GAIA_TELEMETRIA else func
+
+# =====================================
+# TOKENS (callback do LangChain)
+# =====================================
+
+class CallbackTokens(BaseCallbackHandler):
+    """
+    Soma os tokens de entrada e saída das chamadas de LLM feitas por uma cadeia,
+    atribuídos à `etapa` desta instância. Usa o `usage_metadata` devolvido pelo modelo
+    e, na falta dele, a estimativa de `history_window.estimar_tokens`.
+    """
+
+    run_inline = True
+
+    def __init__(self, etapa: str):
+        self.etapa = etapa
+        self._entrada_estimada = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._entrada_estimada[run_id] = sum(
+            estimar_tokens(m.content) for lote in messages for m in lote if isinstance(m.content, str)
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        entrada_estimada = self._entrada_estimada.pop(run_id, 0)
+        entrada = saida = 0
+        tem_uso = False
+        for geracoes in response.generations:
+            for geracao in geracoes:
+                uso = getattr(getattr(geracao, "message", None), "usage_metadata", None)
+                if uso:
+                    tem_uso = True
+                    entrada += uso.get("input_tokens", 0)
+                    saida += uso.get("output_tokens", 0)
+                else:
+                    saida += estimar_tokens(geracao.text)
+        if not tem_uso:
+            entrada = entrada_estimada
+        tokens_etapa.inc(entrada, self.etapa, "entrada")
+        tokens_etapa.inc(saida, self.etapa, "saida")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._entrada_estimada.pop(run_id, None)
+
+
+def instrumentar(chain, etapa: str):
+    """
+    Marca a cadeia com a etapa (metadado "etapa", lido pelo `llm_resilience`) e anexa
+    o callback de tokens da etapa (só com a telemetria ligada).
+    """
+    if not GAIA_TELEMETRIA:
+        return chain.with_config(metadata={"etapa": etapa})
+    return chain.with_config(metadata={"etapa": etapa}, callbacks=[CallbackTokens(etapa)])
+
+# =====================================
+# BENCHMARK
+# =====================================
+
+if __name__ == "__main__":
+    """
+    Mede o custo da instrumentação por etapa e por fluxo:
+    $ python telemetry.py
+    """
+    n = int(os.getenv("BENCH_REPETICOES", "100000"))
+
+    inicio = time.perf_counter()
+    for _ in range(n):
+        pass
+    base = time.perf_counter() - inicio
+
+    iniciar_rastro()
+    inicio = time.perf_counter()
+    for _ in range(n):
+        with medir_etapa("bench"):
+            pass
+    custo_etapa = (time.perf_counter() - inicio - base) / n
+
+    inicio = time.perf_counter()
+    for _ in range(n // 10):
+        iniciar_rastro()
+        with medir_fluxo() as rastro:
+            rastro.rota = "bench"
+    custo_fluxo = (time.perf_counter() - inicio) / (n // 10)
+
+    # Um fluxo típico tem ~8 etapas e leva de 1 a 5 s (chamadas ao Gemini).
+    por_requisicao = custo_fluxo + 8 * custo_etapa
+    print(f"medir_etapa: {custo_etapa * 1e6:.2f} µs | medir_fluxo: {custo_fluxo * 1e6:.2f} µs")
+    print(f"por requisição: {por_requisicao * 1e6:.1f} µs = {por_requisicao / 1.0 * 100:.4f}% de um fluxo de 1 s")
+    print(f"/metrics com {len(registro.exportar().splitlines())} linhas")
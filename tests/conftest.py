@@ -0,0 +1,13 @@
+"""
+Os testes rodam sem Gemini, Atlas ou MongoDB: os falsos do `load_test` (modelo de chat,
+embeddings, mongomock, índice local do FAQ) são instalados uma vez, antes de qualquer
+teste importar `ia_calbon`.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import load_test  # noqa: E402
+
+load_test.instalar_backends_falsos(load_test.criar_parser().parse_args(["--sem-latencia", "--formularios", "20"]))
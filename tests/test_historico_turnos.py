@@ -0,0 +1,74 @@
+"""
+Cada turno grava exatamente duas mensagens no histórico da sessão: a pergunta do usuário e
+a resposta final devolvida a ele, que precisa ser uma resposta de verdade (não vazia, nem a
+mensagem de erro ou de reprovação). Vale nos fluxos síncrono e assíncrono, inclusive quando
+o fluxo termina cedo (pergunta bloqueada pelas badwords ou resposta direta do pré-roteador).
+
+Roda sem Gemini, Atlas ou MongoDB, com os falsos do `load_test` (ver conftest.py):
+    $ python -m pytest tests/
+"""
+import asyncio
+import uuid
+
+import pytest
+
+import ia_calbon
+from pre_router import RESPOSTAS_SAUDACAO
+
+PERGUNTAS = {
+    "badword": "que merda de emissão é essa?",
+    "pre_roteador": "Bom dia",
+    "carbono": "Como reduzir minha emissão de carbono no transporte?",
+    "faq": "Como meus dados são usados pela Gaia?",
+    "diagnostico": "Analise o formulário do crachá 3.",
+    "direta": "Qual a previsão do tempo?",
+}
+
+
+# Respostas que indicam que o fluxo falhou no caminho, mesmo com o turno gravado.
+RESPOSTAS_DE_FALHA = {
+    ia_calbon.JSON_ERRO_DIAGNOSTICO,
+    ia_calbon.RESPOSTA_FAQ_VAZIA,
+    ia_calbon.RESPOSTA_REPROVACAO_PADRAO,
+    *ia_calbon.RESPOSTAS_REPROVACAO.values(),
+}
+
+
+def _conferir_turno(caso, session_id, turno, resposta):
+    mensagens = ia_calbon.get_session_history(session_id).messages
+    assert len(mensagens) == 2 * turno
+    pergunta, resposta_gravada = mensagens[-2:]
+    assert (pergunta.type, pergunta.content) == ("human", PERGUNTAS[caso])
+    assert (resposta_gravada.type, resposta_gravada.content) == ("ai", resposta)
+    assert resposta.strip()
+    assert resposta not in RESPOSTAS_DE_FALHA
+    if caso == "badword":
+        assert resposta == ia_calbon.RESPOSTA_BADWORD
+    elif caso == "pre_roteador":
+        assert resposta in RESPOSTAS_SAUDACAO
+
+
+@pytest.mark.parametrize("caso", sorted(PERGUNTAS))
+def test_fluxo_sincrono_grava_pergunta_e_resposta_por_turno(caso):
+    session_id = f"sync-{caso}-{uuid.uuid4().hex}"
+    for turno in range(1, 3):
+        resposta = ia_calbon.executar_fluxo_gaia(PERGUNTAS[caso], session_id)
+        _conferir_turno(caso, session_id, turno, resposta)
+
+
+@pytest.mark.parametrize("caso", sorted(PERGUNTAS))
+def test_fluxo_assincrono_grava_pergunta_e_resposta_por_turno(caso):
+    session_id = f"async-{caso}-{uuid.uuid4().hex}"
+
+    async def conversar():
+        for turno in range(1, 3):
+            resposta = await ia_calbon.executar_fluxo_gaia_async(PERGUNTAS[caso], session_id)
+            _conferir_turno(caso, session_id, turno, resposta)
+
+    asyncio.run(conversar())
+
+
+def test_casos_cobrem_as_saidas_antecipadas():
+    assert ia_calbon.BADWORDS_MATCHER.contem(PERGUNTAS["badword"])
+    resposta = ia_calbon.pre_roteador.rotear(PERGUNTAS["pre_roteador"], ia_calbon.PERSONA_SISTEMA_GAIA)
+    assert resposta is not None and not resposta.startswith("ROUTE=")
@@ -0,0 +1,30 @@
+"""
+`ModeloResiliente._astream` sobre um modelo sem streaming nativo: a `AIMessage` inteira
+vira um pedaço que ainda carrega as chamadas de ferramenta e o uso de tokens, e o agente
+de diagnóstico (que depende das chamadas de ferramenta) responde no fluxo assíncrono.
+"""
+import asyncio
+import uuid
+
+from langchain_core.messages import AIMessage
+
+import ia_calbon
+from llm_resilience import _como_pedaco
+
+
+def test_pedaco_preserva_chamadas_de_ferramenta_e_uso():
+    mensagem = AIMessage(
+        content="",
+        tool_calls=[{"name": "query_formulario_funcionario", "args": {"numero_cracha": 3}, "id": "call_1", "type": "tool_call"}],
+        usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12},
+    )
+    pedaco = _como_pedaco(mensagem)
+    assert pedaco.tool_calls == mensagem.tool_calls
+    assert pedaco.usage_metadata == mensagem.usage_metadata
+
+
+def test_diagnostico_assincrono_responde():
+    pergunta = "Analise o formulário do crachá 3."
+    resposta = asyncio.run(ia_calbon.executar_fluxo_gaia_async(pergunta, f"diag-{uuid.uuid4().hex}"))
+    assert resposta.strip()
+    assert resposta not in (ia_calbon.JSON_ERRO_DIAGNOSTICO, ia_calbon.RESPOSTA_REPROVACAO_PADRAO)
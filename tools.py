@@ -1,18 +1,18 @@
-import os
-import pymongo
 from dotenv import load_dotenv
 from langchain.tools import tool
 from langchain.pydantic_v1 import BaseModel, Field
-from collections import Counter
+from typing import Optional
+from datetime import datetime, timedelta
+from concurrency import run_blocking
+from telemetry import medir_ferramenta
+from mongo_client import get_db
+from form_summary import resumo_formularios, GAIA_RESUMO_MATERIALIZADO
+from form_cache import catalogo_perguntas, cache_crachas, garantir_indices
 
 load_dotenv()
 
-MONGO_URL = os.getenv("MONGO_URL")
-
 def get_db_connection():
-    client = pymongo.MongoClient(MONGO_URL)
-    db = client["dbInterEco"]
-    return db
+    return get_db()
 
 class QueryFormularioArgs(BaseModel):
     numero_cracha: int = Field(..., description="Número do crachá do funcionário para buscar o formulário respondido.")
@@ -22,15 +22,23 @@ def query_formulario_funcionario(numero_cracha: int) -> dict:
     """
     Busca o formulário respondido por um funcionário específico com base no número do crachá.
     """
+    if GAIA_RESUMO_MATERIALIZADO:
+        # É o resumo materializado que observa as mudanças e invalida o cache do crachá.
+        resumo_formularios.iniciar_em_segundo_plano()
+    em_cache = cache_crachas.buscar(numero_cracha)
+    if em_cache is not None:
+        return em_cache
+
     db = get_db_connection()
     try:
+        garantir_indices(db)
         form = db.formulario.find_one({"numero_cracha": numero_cracha})
         if not form:
             return {"status": "error", "message": f"Nenhum formulário encontrado para o crachá {numero_cracha}"}
         
         respostas = form.get("respostas", [])
         id_perguntas = [r["id_pergunta"] for r in respostas]
-        perguntas_dict = {p["_id"]: p for p in db.perguntas.find({"_id": {"$in": id_perguntas}})}
+        perguntas_dict = catalogo_perguntas.buscar_varias(id_perguntas)
         
         resultados = []
         for r in respostas:
@@ -42,7 +50,7 @@ def query_formulario_funcionario(numero_cracha: int) -> dict:
                     "resposta": r["resposta"]
                 })
 
-        return {
+        resultado = {
             "status": "ok",
             "numero_cracha": numero_cracha,
             "data_resposta": str(form.get("data_resposta")),
@@ -50,48 +58,99 @@ def query_formulario_funcionario(numero_cracha: int) -> dict:
             "classificacao_emissao": form.get("classificacao_emissao"),
             "respostas": resultados
         }
+        cache_crachas.guardar(numero_cracha, resultado, form_id=form.get("_id"))
+        return resultado
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-@tool("query_resumo_geral_formularios")
-def query_resumo_geral_formularios() -> dict:
+class QueryResumoArgs(BaseModel):
+    data_inicio: Optional[str] = Field(None, description="Data inicial (AAAA-MM-DD) de resposta dos formulários a considerar.")
+    data_fim: Optional[str] = Field(None, description="Data final (AAAA-MM-DD), inclusiva, de resposta dos formulários a considerar.")
+    categoria: Optional[str] = Field(None, description="Considerar apenas as perguntas desta categoria (ex: transporte, energia).")
+    classificacao_emissao: Optional[str] = Field(None, description="Considerar apenas os formulários com esta classificação de emissão.")
+
+def _filtro_formularios(data_inicio=None, data_fim=None, classificacao_emissao=None) -> dict:
+    filtro = {}
+    if data_inicio or data_fim:
+        filtro["data_resposta"] = {}
+        if data_inicio:
+            filtro["data_resposta"]["$gte"] = datetime.fromisoformat(data_inicio)
+        if data_fim:
+            filtro["data_resposta"]["$lt"] = datetime.fromisoformat(data_fim) + timedelta(days=1)
+    if classificacao_emissao:
+        filtro["classificacao_emissao"] = classificacao_emissao
+    return filtro
+
+def _pipeline_resumo(filtro: dict, categoria=None) -> list:
+    """
+    Conta as respostas por pergunta no próprio MongoDB: apenas os totais
+    por (pergunta, resposta) trafegam pela rede, nunca os formulários.
+    """
+    pipeline = [
+        {"$match": filtro},
+        {"$unwind": "$respostas"},
+        {"$group": {
+            "_id": {"id_pergunta": "$respostas.id_pergunta", "resposta": "$respostas.resposta"},
+            "total": {"$sum": 1}
+        }},
+        {"$group": {
+            "_id": "$_id.id_pergunta",
+            "respostas": {"$push": {"resposta": "$_id.resposta", "total": "$total"}}
+        }},
+        {"$lookup": {"from": "perguntas", "localField": "_id", "foreignField": "_id", "as": "pergunta_info"}},
+        {"$unwind": "$pergunta_info"},
+    ]
+    if categoria:
+        pipeline.append({"$match": {"pergunta_info.categoria": categoria}})
+    pipeline.append({"$sort": {"_id": 1}})
+    return pipeline
+
+@tool("query_resumo_geral_formularios", args_schema=QueryResumoArgs)
+def query_resumo_geral_formularios(
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    categoria: Optional[str] = None,
+    classificacao_emissao: Optional[str] = None
+) -> dict:
     """
     Busca e resume as respostas de TODOS os formulários enviados,
     agregando a contagem de cada resposta por pergunta.
+    Aceita filtros opcionais por período de resposta, categoria da pergunta
+    e classificação de emissão.
     Não retorna informações de um usuário específico.
     """
-    db = get_db_connection()
     try:
-        todos_formularios = list(db.formulario.find({}))
-        if not todos_formularios:
+        # Sem filtros, o resumo vem do snapshot mantido incrementalmente (O(perguntas)).
+        if GAIA_RESUMO_MATERIALIZADO and not any((data_inicio, data_fim, categoria, classificacao_emissao)):
+            try:
+                resumo_formularios.iniciar()
+            except Exception as e:
+                # Sem o snapshot, o resumo sai da agregação abaixo (e o início é tentado de novo na próxima chamada).
+                print(f"[tools] Resumo materializado indisponível, usando a agregação: {e}")
+            if resumo_formularios.pronto():
+                resumo = resumo_formularios.resumo()
+                if not resumo["total_formularios_analisados"]:
+                    return {"status": "ok", "message": "Nenhum formulário encontrado para resumir."}
+                return {"status": "ok", **resumo}
+
+        db = get_db_connection()
+        filtro = _filtro_formularios(data_inicio, data_fim, classificacao_emissao)
+        total_formularios = db.formulario.count_documents(filtro)
+        if not total_formularios:
             return {"status": "ok", "message": "Nenhum formulário encontrado para resumir."}
 
-        perguntas_dict = {p["_id"]: p for p in db.perguntas.find({})}
-        
-        resumo_respostas = {}
-
-        for form in todos_formularios:
-            for resposta_usuario in form.get("respostas", []):
-                id_pergunta = resposta_usuario["id_pergunta"]
-                resposta_dada = resposta_usuario["resposta"]
-
-                if id_pergunta not in resumo_respostas:
-                    pergunta_info = perguntas_dict.get(id_pergunta)
-                    if pergunta_info:
-                        resumo_respostas[id_pergunta] = {
-                            "pergunta": pergunta_info["pergunta"],
-                            "categoria": pergunta_info["categoria"],
-                            "respostas": Counter()
-                        }
-                
-                if id_pergunta in resumo_respostas:
-                    resumo_respostas[id_pergunta]["respostas"][resposta_dada] += 1
-        
-        lista_resumo = list(resumo_respostas.values())
+        lista_resumo = []
+        for grupo in db.formulario.aggregate(_pipeline_resumo(filtro, categoria)):
+            pergunta_info = grupo["pergunta_info"]
+            lista_resumo.append({
+                "pergunta": pergunta_info["pergunta"],
+                "categoria": pergunta_info["categoria"],
+                "respostas": {r["resposta"]: r["total"] for r in grupo["respostas"]}
+            })
 
         return {
             "status": "ok",
-            "total_formularios_analisados": len(todos_formularios),
+            "total_formularios_analisados": total_formularios,
             "resumo_por_pergunta": lista_resumo
         }
 
@@ -99,6 +158,25 @@ def query_resumo_geral_formularios() -> dict:
         return {"status": "error", "message": str(e)}
 
 
+def _com_execucao_assincrona(ferramenta):
+    """
+    Dá à ferramenta uma versão assíncrona: o pymongo continua síncrono,
+    mas roda no pool limitado de `concurrency` em vez de bloquear o event loop.
+    """
+    async def _coroutine(**kwargs):
+        return await run_blocking(ferramenta.func, **kwargs)
+
+    ferramenta.coroutine = _coroutine
+    return ferramenta
+
+for _ferramenta in (query_formulario_funcionario, query_resumo_geral_formularios):
+    _ferramenta.func = medir_ferramenta(_ferramenta.func, _ferramenta.name)
+    _com_execucao_assincrona(_ferramenta)
+
+# Mudanças de formulário vistas pelo resumo materializado invalidam o cache do crachá.
+resumo_formularios.adicionar_ouvinte(cache_crachas.ao_mudar_formulario)
+
+
 TOOLS = [
     query_formulario_funcionario,
     query_resumo_geral_formularios